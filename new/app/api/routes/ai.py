@@ -1,14 +1,13 @@
 # py
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse, JSONResponse
-import json
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import JSONResponse
 from app.api.deps import get_current_user
-from app.schemas import StreamAgentRequest, HealthGenerateRequest, HealthGenerateResponse
+from app.schemas import StreamAgentRequest, HealthGenerateRequest, HealthGenerateResponse, InsightJobResponse
 from app.services import agents as agent_svc
-from app.services.supabase_service import create_health_insight
+from app.services import insight_jobs
 from app.core.config import get_settings
-from app.services.openai_client import async_stream_chat
-from loguru import logger
+from app.core.jobs import JobQueueFull, get_job_queue
+from app.core.sse import EventSourceResponse
 
 router = APIRouter()
 
@@ -16,42 +15,46 @@ settings = get_settings()
 
 @router.post("/ai/stream-agent-response")
 async def stream_agent(request: StreamAgentRequest, user=Depends(get_current_user)):
-    user_context = request.supabase_id
+    user_context = {"supabase_id": user["supabase_id"]}
     prompt = request.prompt
     agent = request.agent
+    if agent and agent not in agent_svc.AGENT_SPECS:
+        raise HTTPException(status_code=400, detail="Unknown agent")
 
-    async def event_generator():
-        try:
-            if agent:
-                # Single agent streaming
-                system_prompt = agent_svc.AGENT_SPECS.get(agent)
-                if not system_prompt:
-                    raise HTTPException(status_code=400, detail="Unknown agent")
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt},
-                    {"role": "user", "content": f"User context: {user}"}
-                ]
-                async for chunk in async_stream_chat(messages):
-                    payload = {"agent": agent, "chunk": chunk}
-                    yield f"data: {json.dumps(payload)}\n\n"
-            else:
-                # Orchestrator streaming by delegating to stream_orchestrator
-                async for item in agent_svc.stream_orchestrator({"supabase_id": user["supabase_id"]}, prompt):
-                    yield f"data: {json.dumps(item)}\n\n"
-        except Exception as e:
-            logger.exception("Streaming error")
-            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    # Single agent or the default set; either way deltas arrive tagged by agent as they are generated
+    events = agent_svc.stream_orchestrator(user_context, prompt, agents=[agent] if agent else None)
+    return EventSourceResponse(events)
 
 @router.post("/health/generate-insights", response_model=HealthGenerateResponse)
 async def generate_insights(req: HealthGenerateRequest, user=Depends(get_current_user)):
-    # Run orchestrator synchronously
-    result = await agent_svc.run_agents_concurrently(req.context, req.prompt)
-    # Save to Supabase
-    saved = create_health_insight(user["supabase_id"], req.dict(), {r["name"]: r for r in result["agents"]}, result["aggregated_output"], result["confidence"])
-    return HealthGenerateResponse(id=saved["id"], aggregated_output=result["aggregated_output"], confidence=result["confidence"], agents_output={r["name"]: r for r in result["agents"]})
+    # Run orchestrator synchronously; POST /health/insight-jobs is the non-blocking variant
+    return HealthGenerateResponse(**await insight_jobs.generate_and_save(user["supabase_id"], req.model_dump()))
+
+@router.post("/health/insight-jobs", response_model=InsightJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_insight_job(req: HealthGenerateRequest, response: Response, user=Depends(get_current_user)):
+    # returns at once; identical in-flight submissions share one job
+    try:
+        job = await insight_jobs.submit(user["supabase_id"], req.model_dump())
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending jobs", headers={"Retry-After": "5"})
+    response.headers["Location"] = f"/api/health/insight-jobs/{job.id}"
+    return job.to_dict()
+
+def _owned_job(job_id: str, user: dict):
+    job = get_job_queue().get(job_id)
+    if job is None or job.owner != user["supabase_id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/health/insight-jobs/{job_id}", response_model=InsightJobResponse)
+async def get_insight_job(job_id: str, user=Depends(get_current_user)):
+    return _owned_job(job_id, user).to_dict()
+
+@router.get("/health/insight-jobs/{job_id}/events")
+async def insight_job_events(job_id: str, user=Depends(get_current_user)):
+    # progress events replayed from the start, then live until the job finishes
+    job = _owned_job(job_id, user)
+    return EventSourceResponse(get_job_queue().events(job.id))
 
 @router.post("/customer-portal")
 async def customer_portal(body: dict, user=Depends(get_current_user)):
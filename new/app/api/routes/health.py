@@ -1,13 +1,46 @@
 # py
-from fastapi import APIRouter, Depends, Query, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from app.api.deps import get_current_user
-from app.services.supabase_service import list_health_insights
-from app.schemas import HealthInsightItem
+from app.core.config import get_settings
+from app.core import serialization
+from app.core.serialization import FastJSONResponse
+from app.services.supabase_service import decode_cursor, list_health_insights_page, iter_health_insights
+from app.services.health_batch import CATEGORY_LABELS, batch_metrics
+from app.schemas import BatchMetricsRequest, HealthInsightItem
 
 router = APIRouter()
 
+settings = get_settings()
+
 @router.get("/health/insights", response_model=List[HealthInsightItem])
-async def get_insights(limit: int = Query(50, ge=1, le=100), user=Depends(get_current_user)):
-    items = list_health_insights(user["supabase_id"], limit=limit)
+async def get_insights(
+    response: Response,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    user=Depends(get_current_user),
+):
+    if format == "ndjson":
+        # full-history export, streamed one keyset page at a time
+        if cursor:
+            decode_cursor(cursor)  # a bad cursor is a 400 here, not an empty 200 once the stream has started
+        async def lines():
+            async for row in iter_health_insights(user["supabase_id"], page_size=settings.INSIGHTS_EXPORT_PAGE_SIZE, cursor=cursor):
+                yield serialization.dumps(row) + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    items, next_cursor = await list_health_insights_page(user["supabase_id"], limit=limit, cursor=cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return items
+
+@router.post("/health/metrics/batch")
+async def compute_metrics_batch(req: BatchMetricsRequest, user=Depends(get_current_user)):
+    # columnar in, columnar out; category holds indexes into category_labels
+    try:
+        metrics = batch_metrics(req.weight_kg, req.height_cm, req.age, req.sex, req.activity_level, req.goal)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return FastJSONResponse({"count": len(req.weight_kg), "category_labels": CATEGORY_LABELS, **{k: v.tolist() for k, v in metrics.items()}})
@@ -7,5 +7,5 @@ router = APIRouter()
 
 @router.post("/users/profile")
 async def upsert_profile(body: UserProfileRequest):
-    record = upsert_user_profile(body.supabase_id, body.dict())
+    record = await upsert_user_profile(body.supabase_id, body.dict())
     return record
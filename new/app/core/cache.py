@@ -0,0 +1,165 @@
+# py
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Optional, Protocol, Tuple
+from app.core.config import get_settings
+from app.core import serialization
+from app.core.metrics import REGISTRY
+
+settings = get_settings()
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> Optional[Any]: ...
+    async def set(self, key: str, value: Any, ttl: float) -> None: ...
+    async def delete(self, key: str) -> None: ...
+    async def clear(self) -> None: ...
+
+
+class InMemoryLRUCache:
+    """Bounded LRU with per-entry expiry. Safe without locks on a single event loop."""
+
+    def __init__(self, max_entries: int, clock: Callable[[], float] = time.monotonic):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self._clock = clock
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (self._clock() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def clear(self) -> None:
+        self._data.clear()
+
+
+class RedisCache:
+    """Cache backend for any client speaking the redis.asyncio API (get/set/delete/scan_iter).
+
+    Size limits are left to the server's maxmemory-policy (allkeys-lru); TTLs are set per key.
+    """
+
+    def __init__(self, client: Any, prefix: str = "cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        return serialization.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self.client.set(self.prefix + key, serialization.dumps(value), px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+    async def clear(self) -> None:
+        async for key in self.client.scan_iter(match=self.prefix + "*"):
+            await self.client.delete(key)
+
+
+class ResultCache:
+    """Agent result cache: picks the TTL per agent and tracks hit/miss counters."""
+
+    def __init__(self, backend: CacheBackend, default_ttl: float, agent_ttls: Optional[Dict[str, float]] = None):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.agent_ttls = dict(agent_ttls or {})
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+    def ttl_for(self, agent_name: str) -> float:
+        return self.agent_ttls.get(agent_name, self.default_ttl)
+
+    async def get(self, agent_name: str, key: str) -> Optional[Any]:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses[agent_name] += 1
+        else:
+            self.hits[agent_name] += 1
+        return value
+
+    async def set(self, agent_name: str, key: str, value: Any) -> None:
+        ttl = self.ttl_for(agent_name)
+        if ttl <= 0:
+            return
+        await self.backend.set(key, value, ttl)
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+        self.hits.clear()
+        self.misses.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = sum(self.hits.values())
+        misses = sum(self.misses.values())
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "by_agent": {
+                agent: {"hits": self.hits[agent], "misses": self.misses[agent]}
+                for agent in sorted(set(self.hits) | set(self.misses))
+            },
+        }
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def build_backend(kind: str) -> CacheBackend:
+    if kind == "memory":
+        return InMemoryLRUCache(settings.CACHE_MAX_ENTRIES)
+    if kind == "redis":
+        from app.core.redis import get_redis
+        return RedisCache(get_redis(), prefix=settings.CACHE_KEY_PREFIX)
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+def get_result_cache() -> ResultCache:
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            build_backend(settings.CACHE_BACKEND),
+            default_ttl=settings.CACHE_DEFAULT_TTL,
+            agent_ttls=settings.CACHE_AGENT_TTLS,
+        )
+    return _result_cache
+
+
+def _collect_metrics():
+    if _result_cache is None:
+        return
+    cache = _result_cache
+    samples = [("_total", {"agent": agent, "result": "hit"}, n) for agent, n in cache.hits.items()]
+    samples += [("_total", {"agent": agent, "result": "miss"}, n) for agent, n in cache.misses.items()]
+    yield "cache_requests", "counter", "Agent result cache lookups", samples
+    yield "cache_hit_ratio", "gauge", "Share of agent result cache lookups that hit, since start", [("", {}, cache.stats()["hit_ratio"])]
+
+
+REGISTRY.register_collector(_collect_metrics)
@@ -1,5 +1,5 @@
 # app/core/config.py
-from typing import Optional
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 # pydantic v2: BaseSettings moved to pydantic-settings
@@ -18,8 +18,100 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str
     RATE_LIMIT_TOKENS: int = Field(10)
     RATE_LIMIT_RATE: float = Field(1.0)
+    RATE_LIMIT_SHARDS: int = Field(64)  # power of two; idle keys are swept one shard at a time
+    RATE_LIMIT_MAX_KEYS: int = Field(1_000_000)
+    RATE_LIMIT_SWEEP_SECONDS: float = Field(1.0)  # time for one full sweep over all shards
+    # memory: per worker | shm: shared by all workers on one host | redis: shared across hosts (needs REDIS_URL)
+    RATE_LIMIT_BACKEND: str = Field("memory")
+    RATE_LIMIT_SHM_PATH: str = Field("/dev/shm/health-ai-ratelimit")
+    RATE_LIMIT_SHM_SLOTS: int = Field(65536)  # 16 bytes each; a multiple of 64
+    RATE_LIMIT_REDIS_PREFIX: str = Field("rl:")
+    JWT_CACHE_SIZE: int = Field(10000)  # verified tokens kept in memory; 0 disables the cache
+    JWT_CACHE_MAX_TTL: float = Field(300.0)  # entries also never outlive the token's exp
     STRIPE_SECRET_KEY: Optional[str] = None
-    STREAM_CHUNK_SIZE: int = Field(1024)
+    # OpenAI transport: one shared keep-alive pool per worker
+    OPENAI_BASE_URL: Optional[str] = None  # None = api.openai.com; point at any compatible server
+    OPENAI_MODEL: str = Field("gpt-4o-mini")
+    OPENAI_MAX_CONNECTIONS: int = Field(100)
+    OPENAI_MAX_KEEPALIVE: int = Field(50)
+    OPENAI_KEEPALIVE_EXPIRY: float = Field(90.0)
+    OPENAI_HTTP2: bool = Field(True)  # needs the h2 package; falls back to HTTP/1.1 without it
+    OPENAI_CONNECT_TIMEOUT: float = Field(5.0)
+    OPENAI_READ_TIMEOUT: float = Field(60.0)  # max gap between bytes, so long streams are fine
+    OPENAI_POOL_TIMEOUT: float = Field(5.0)  # max wait for a free connection before failing
+    OPENAI_WARMUP_CONNECTIONS: int = Field(4)  # opened at startup; 0 disables
+    # LLM admission: weighted fair queue by tier in front of an adaptive (AIMD) concurrency limit
+    LLM_TIER_WEIGHTS: Dict[str, float] = Field(default_factory=lambda: {"free": 1.0, "pro": 4.0, "enterprise": 8.0})
+    LLM_INITIAL_CONCURRENCY: int = Field(16)
+    LLM_MIN_CONCURRENCY: int = Field(2)
+    LLM_MAX_CONCURRENCY: int = Field(64)
+    LLM_LATENCY_TARGET_SECONDS: float = Field(20.0)  # slower calls (time to first token when streaming) shrink the limit
+    LLM_MAX_QUEUE: int = Field(1000)
+    LLM_QUEUE_TIMEOUT: float = Field(30.0)
+    # LLM retries: jittered backoff or the provider's Retry-After, from a shared budget
+    LLM_MAX_ATTEMPTS: int = Field(3)
+    LLM_RETRY_BASE_DELAY: float = Field(0.25)
+    LLM_RETRY_MAX_DELAY: float = Field(4.0)
+    LLM_RETRY_AFTER_MAX: float = Field(20.0)  # longer Retry-After values fail the call instead of waiting
+    LLM_RETRY_BUDGET_RATIO: float = Field(0.2)  # retries + hedges allowed per call made
+    LLM_RETRY_BUDGET_MIN_PER_SECOND: float = Field(1.0)
+    LLM_RETRY_BUDGET_MAX: float = Field(20.0)
+    LLM_HEDGE_PERCENTILE: Optional[float] = Field(0.95)  # hedge non-streaming calls slower than this latency percentile; None disables
+    LLM_HEDGE_MIN_DELAY: float = Field(2.0)
+    LLM_BREAKER_FAILURES: int = Field(5)  # consecutive provider failures that open the circuit
+    LLM_BREAKER_RESET_SECONDS: float = Field(30.0)
+    TOOL_TIMEOUT_SECONDS: float = Field(5.0)  # per tool call, unless the tool registers its own
+    TOOL_MAX_ROUNDS: int = Field(3)  # model turns that may request tools before an answer is forced
+    PROMPT_CONTEXT_BUDGET: int = Field(1500)  # max tokens of request context sent to a model
+    PROMPT_AGENT_BUDGETS: Dict[str, int] = Field(default_factory=dict)  # per-agent overrides, JSON in env
+    STREAM_CHUNK_SIZE: int = Field(1024)  # max bytes coalesced into one SSE frame
+    SSE_MAX_DELAY_MS: float = Field(25.0)  # max time a buffered delta waits for more before flushing
+    SSE_HEARTBEAT_SECONDS: float = Field(15.0)
+    SSE_QUEUE_SIZE: int = Field(64)
+    # database access (async PostgREST client, or an in-memory stand-in)
+    DB_BACKEND: str = Field("supabase")  # supabase | memory
+    DB_POOL_SIZE: int = Field(20)
+    DB_KEEPALIVE_EXPIRY: float = Field(30.0)
+    DB_CONNECT_TIMEOUT: float = Field(5.0)
+    DB_TIMEOUT: float = Field(10.0)
+    DB_POOL_TIMEOUT: float = Field(5.0)  # max wait for a free pooled connection
+    DB_IDENTITY_CACHE_SIZE: int = Field(10000)  # cached supabase_id -> users_profiles.id mappings
+    INSIGHTS_EXPORT_PAGE_SIZE: int = Field(500)
+    # write-behind for health_insights: requests return once the id is allocated, inserts are batched
+    INSIGHTS_WRITE_BEHIND: bool = Field(False)
+    INSIGHTS_WRITE_BATCH: int = Field(100)
+    INSIGHTS_WRITE_DELAY_MS: float = Field(200.0)
+    INSIGHTS_WRITE_MAX_PENDING: int = Field(10000)
+    INSIGHTS_WRITE_SPOOL: Optional[str] = None  # local append-only JSONL file (fsynced per submit) for crash safety, e.g. /var/spool/insights.jsonl
+    INSIGHTS_WRITE_MAX_ATTEMPTS: int = Field(5)  # failures in a row before a batch is split to find a bad row
+    INSIGHTS_WRITE_DEAD_LETTER: Optional[str] = None  # JSONL file for rows that fail permanently; they are only logged without one
+
+    # background jobs (POST /health/insight-jobs)
+    JOB_BACKEND: str = Field("memory")  # memory: worker tasks inside each web process
+    JOB_CONCURRENCY: int = Field(8)  # jobs running at once per process
+    JOB_MAX_PENDING: int = Field(1000)
+    JOB_RESULT_TTL: float = Field(600.0)  # finished jobs stay pollable (and deduplicate) this long
+
+    JSON_BACKEND: str = Field("auto")  # auto (orjson if installed) | orjson | json
+    REDIS_URL: Optional[str] = None  # e.g. redis://localhost:6379/0, or memory:// for a local stand-in
+
+    # agent result cache
+    CACHE_BACKEND: str = Field("memory")  # memory | redis
+    CACHE_MAX_ENTRIES: int = Field(2048)
+    CACHE_DEFAULT_TTL: float = Field(600.0)
+    CACHE_AGENT_TTLS: Dict[str, float] = Field(default_factory=dict)  # JSON in env, e.g. {"workout_generator": 3600}
+    CACHE_KEY_PREFIX: str = Field("agent-cache:")
+    # near-duplicate lookup behind the exact cache (MinHash/LSH over canonicalized prompts)
+    SIMILARITY_CACHE_THRESHOLD: float = Field(0.0)  # min estimated Jaccard similarity of prompt features (e.g. 0.7); 0 disables
+    SIMILARITY_AGENT_THRESHOLDS: Dict[str, float] = Field(default_factory=dict)  # per-agent overrides, JSON in env
+    SIMILARITY_CACHE_SCOPE: str = Field("user")  # user: only a user's own results | global: shared across users
+    SIMILARITY_STAT_BUCKETS: Dict[str, float] = Field(default_factory=lambda: {"weight_kg": 2.5, "height_cm": 5.0, "age": 5.0})
+    SIMILARITY_CACHE_MAX_ENTRIES: int = Field(20000)
+    SIMILARITY_CACHE_NUM_PERM: int = Field(64)
+    SIMILARITY_CACHE_BANDS: int = Field(16)  # 16 bands x 4 rows: pairs above ~0.5 similarity become candidates
+
+    METRICS_ENABLED: bool = Field(True)  # serves GET /metrics (Prometheus text format) and samples event-loop lag
+    METRICS_LOOP_LAG_INTERVAL: float = Field(0.5)  # seconds between event-loop lag samples
 
     # pydantic v2 uses model_config instead of inner Config class
     model_config = {
@@ -0,0 +1,116 @@
+# py
+"""Pooled httpx transport for outbound API clients, with pool-utilization counters.
+
+`PooledTransport` is a plain AsyncHTTPTransport (one keep-alive pool, optional
+HTTP/2) that also records every request's pool wait and whether it opened a new
+connection, using httpcore's trace hook. That makes reuse visible: `connects` /
+`requests` is the share of calls that paid a TCP+TLS handshake. `stats()` also reads
+the live pool, i.e. open, busy and idle connections, and requests queued for one.
+A full pool raises httpx.PoolTimeout after `pool` seconds instead of queuing silently.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+import httpx
+from loguru import logger
+
+try:
+    import h2  # noqa: F401  (HTTP/2 support for httpx)
+except ImportError:  # optional dependency
+    h2 = None
+
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, max_connections: int, max_keepalive: int, keepalive_expiry: float, http2: bool = False, **kwargs: Any):
+        if http2 and h2 is None:
+            logger.warning("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive, keepalive_expiry=keepalive_expiry)
+        super().__init__(limits=limits, http2=http2, **kwargs)
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.requests = 0
+        self.connects = 0
+        self.pool_timeouts = 0
+        self.pool_wait_total = 0.0
+        self.pool_wait_max = 0.0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        start = time.monotonic()
+        waited = False
+        outer = request.extensions.get("trace")
+
+        async def trace(name: str, info: Dict) -> None:
+            nonlocal waited
+            if not waited and name.endswith((".connect_tcp.started", ".send_request_headers.started")):
+                # the pool handed this request a connection, new or reused
+                waited = True
+                wait = time.monotonic() - start
+                self.pool_wait_total += wait
+                self.pool_wait_max = max(self.pool_wait_max, wait)
+            if name == "connection.connect_tcp.started":
+                self.connects += 1
+            if outer is not None:
+                await outer(name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            return await super().handle_async_request(request)
+        except httpx.PoolTimeout:
+            self.pool_timeouts += 1
+            logger.warning("HTTP pool exhausted for {}: {} connections busy", request.url.host, self.max_connections)
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        connections = list(self._pool.connections)
+        busy = sum(1 for c in connections if not c.is_idle() and not c.is_closed())
+        queued = sum(1 for r in getattr(self._pool, "_requests", ()) if r.is_queued())
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "open": len(connections),
+            "busy": busy,
+            "idle": len(connections) - busy,
+            "queued": queued,
+            "utilization": round(busy / self.max_connections, 3) if self.max_connections else 0.0,
+            "requests": self.requests,
+            "connects": self.connects,
+            "reuse_ratio": round(1 - self.connects / self.requests, 3) if self.requests else 0.0,
+            "pool_timeouts": self.pool_timeouts,
+            "pool_wait_avg_ms": round(self.pool_wait_total / self.requests * 1000, 3) if self.requests else 0.0,
+            "pool_wait_max_ms": round(self.pool_wait_max * 1000, 3),
+        }
+
+
+async def warm_up(client: httpx.AsyncClient, url: str, connections: int) -> int:
+    """Opens up to `connections` pooled connections (TCP + TLS) ahead of traffic; returns how many succeeded.
+
+    Any HTTP status counts: only the handshake matters. Failures are logged, never raised,
+    so an unreachable provider does not block startup.
+    """
+    if connections <= 0:
+        return 0
+    results = await asyncio.gather(*(client.head(url) for _ in range(connections)), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        logger.warning("HTTP warm-up of {}: {} of {} failed ({})", url, len(errors), connections, errors[0])
+    return connections - len(errors)
+
+
+def pooled_client(
+    max_connections: int,
+    max_keepalive: int,
+    keepalive_expiry: float,
+    http2: bool,
+    connect_timeout: float,
+    read_timeout: float,
+    pool_timeout: float,
+    base_url: Optional[str] = None,
+    **kwargs: Any,
+) -> httpx.AsyncClient:
+    transport = PooledTransport(max_connections, max_keepalive, keepalive_expiry, http2=http2)
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=pool_timeout)
+    if base_url is not None:
+        kwargs["base_url"] = base_url
+    return httpx.AsyncClient(transport=transport, timeout=timeout, **kwargs)
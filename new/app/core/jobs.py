@@ -0,0 +1,210 @@
+# py
+"""Background jobs: submit returns a job id at once, and a bounded worker pool runs the work.
+
+Handlers are registered by kind with `register_job`. Each one receives the payload and
+a `progress(event)` callback. Every progress event and the final state are appended to
+the job's event log. Clients either poll `get(job_id)` or follow `events(job_id)`,
+which replays the log and then waits for new entries. It is exposed over SSE.
+
+Submissions with the same `dedup_key` share one job while it is queued, running or
+finished within `result_ttl`. A failed job is not reused, so resubmitting retries it.
+At most `max_pending` jobs wait in the queue; beyond that `submit` raises JobQueueFull.
+
+`InProcessJobQueue` runs the handlers as asyncio tasks inside this process. That keeps
+web workers from holding request sockets open for a whole agent run.
+"""
+import asyncio
+import itertools
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from loguru import logger
+from app.core.config import get_settings
+
+settings = get_settings()
+
+ProgressFn = Callable[[Dict], None]
+JobHandler = Callable[[Dict, ProgressFn], Awaitable[Any]]
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+_handlers: Dict[str, JobHandler] = {}
+
+
+def register_job(kind: str) -> Callable[[JobHandler], JobHandler]:
+    def decorator(fn: JobHandler) -> JobHandler:
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+class JobQueueFull(RuntimeError):
+    """Too many jobs are waiting; the caller should retry later."""
+
+
+class Job:
+    __slots__ = ("id", "kind", "owner", "payload", "dedup_key", "status", "result", "error", "events", "created_at", "started_at", "finished_at", "_changed")
+
+    def __init__(self, kind: str, owner: Optional[str], payload: Dict, dedup_key: Optional[str]):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.owner = owner
+        self.payload = payload
+        self.dedup_key = dedup_key
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.events: List[Dict] = []
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    def _emit(self, event: Dict) -> None:
+        self.events.append(event)
+        self._changed.set()
+        self._changed = asyncio.Event()  # waiters on the old event wake; new waiters wait for the next entry
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.events[-1] if self.events else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class InProcessJobQueue:
+    def __init__(self, concurrency: int, max_pending: int, result_ttl: float):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._queue: "asyncio.Queue[Job]" = asyncio.Queue()
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[str, Job] = {}
+        self._finished: "OrderedDict[str, float]" = OrderedDict()  # job id -> finish time, oldest first
+        self._workers: List[asyncio.Task] = []
+        self.running = 0
+        self.submitted = 0
+        self.deduplicated = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def _start(self) -> None:
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work(i)) for i in range(self.concurrency)]
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > cutoff:
+                break
+            del self._finished[job_id]
+            job = self._jobs.pop(job_id, None)
+            if job is not None and job.dedup_key is not None and self._by_key.get(job.dedup_key) is job:
+                del self._by_key[job.dedup_key]
+
+    async def submit(self, kind: str, payload: Dict, owner: Optional[str] = None, dedup_key: Optional[str] = None) -> Job:
+        if kind not in _handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self._expire()
+        if dedup_key is not None:
+            existing = self._by_key.get(dedup_key)
+            if existing is not None and existing.status != FAILED:
+                self.deduplicated += 1
+                return existing
+        if self._queue.qsize() >= self.max_pending:
+            raise JobQueueFull("Job queue is full")
+        job = Job(kind, owner, payload, dedup_key)
+        self._jobs[job.id] = job
+        if dedup_key is not None:
+            self._by_key[dedup_key] = job
+        self.submitted += 1
+        job._emit({"stage": QUEUED})
+        self._start()
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict]:
+        """Every event of the job so far, then new ones as they happen, until it finishes."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        for seen in itertools.count():
+            while seen >= len(job.events):
+                if job.status in FINISHED:
+                    return
+                await job._changed.wait()
+            yield job.events[seen]
+
+    async def _work(self, worker_no: int) -> None:
+        while True:
+            job = await self._queue.get()
+            self.running += 1
+            job.status = RUNNING
+            job.started_at = time.time()
+            job._emit({"stage": RUNNING})
+            try:
+                job.result = await _handlers[job.kind](job.payload, job._emit)
+                job.status = SUCCEEDED
+                self.succeeded += 1
+            except asyncio.CancelledError:
+                job.status, job.error = FAILED, "cancelled"
+                raise
+            except Exception as e:
+                logger.exception("Job {} ({}) failed", job.id, job.kind)
+                job.status, job.error = FAILED, str(e)
+                self.failed += 1
+            finally:
+                self.running -= 1
+                job.finished_at = time.time()
+                self._finished[job.id] = job.finished_at
+                job._emit({"stage": job.status, **({"error": job.error} if job.error else {})})
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "running": self.running,
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retained": len(self._jobs),
+        }
+
+    async def close(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+_job_queue: Optional[InProcessJobQueue] = None
+
+
+def get_job_queue() -> InProcessJobQueue:
+    global _job_queue
+    if _job_queue is None:
+        if settings.JOB_BACKEND != "memory":
+            raise ValueError(f"Unknown JOB_BACKEND: {settings.JOB_BACKEND}")
+        _job_queue = InProcessJobQueue(settings.JOB_CONCURRENCY, settings.JOB_MAX_PENDING, settings.JOB_RESULT_TTL)
+    return _job_queue
+
+
+async def close_job_queue() -> None:
+    global _job_queue
+    if _job_queue is not None:
+        await _job_queue.close()
+        _job_queue = None
@@ -0,0 +1,261 @@
+# py
+"""In-process counters, gauges and histograms, rendered in the Prometheus text format.
+
+Recording is a dict lookup and an add (a histogram adds a bisect), with no locks. That
+is safe on one event loop. Label values are passed positionally, in `labelnames` order:
+
+    LLM_LATENCY.observe(0.42, "workout_generator", "gpt-4o-mini", "complete")
+
+Numbers that other modules already keep (cache hit counters, SSE totals, scheduler
+state) are not counted twice. `register_collector` reads them when /metrics is
+scraped. Every worker process has its own registry, so scrape each worker (or run
+one worker per container).
+"""
+import asyncio
+import bisect
+import functools
+import math
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+from loguru import logger
+
+T = TypeVar("T")
+
+# set by the agent runner so LLM calls can be labelled with the agent that made them
+current_agent: ContextVar[str] = ContextVar("current_agent", default="none")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# (name, type, help, [(suffix, labels, value)]) as yielded by collectors
+Family = Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _check(self, labels: Tuple) -> None:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        try:
+            self._values[labels] += amount
+        except KeyError:
+            self._check(labels)
+            self._values[labels] = amount
+
+    def value(self, *labels: Any) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}_total{_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *labels: Any) -> None:
+        if labels not in self._values:
+            self._check(labels)
+        self._values[labels] = value
+
+    def value(self, *labels: Any) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (last one is +Inf, not cumulative), sum]
+        self._series: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            self._check(labels)
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels: Any) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def sum(self, *labels: Any) -> float:
+        series = self._series.get(labels)
+        return series[1] if series else 0.0
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collect: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+            lines += metric.render()
+        for collect in self._collectors:
+            try:
+                families = list(collect())
+            except Exception:
+                logger.exception("Metrics collector failed")
+                continue
+            for name, kind, help, samples in families:
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                lines += [f"{name}{suffix}{_labels(list(labels), list(labels.values()))} {_format_value(v)}" for suffix, labels, v in samples]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+LLM_LATENCY = REGISTRY.histogram("llm_request_duration_seconds", "LLM call latency; streams are timed to their last chunk", ("agent", "model", "mode"), LLM_BUCKETS)
+LLM_TTFT = REGISTRY.histogram("llm_time_to_first_token_seconds", "Time from sending a streaming LLM request to its first chunk", ("agent", "model"), LLM_BUCKETS)
+LLM_TOKENS = REGISTRY.counter("llm_tokens", "LLM tokens from the provider's usage; streams without usage count one completion token per delta", ("agent", "model", "kind"))
+LLM_REQUESTS = REGISTRY.counter("llm_requests", "LLM call attempts by outcome", ("agent", "model", "outcome"))
+RATE_LIMIT_DECISIONS = REGISTRY.counter("rate_limit_decisions", "Per-user rate limiter decisions", ("backend", "decision"))
+SSE_TTFB = REGISTRY.histogram("sse_time_to_first_byte_seconds", "Time from opening an SSE response to its first frame", (), LLM_BUCKETS)
+SSE_DURATION = REGISTRY.histogram("sse_stream_duration_seconds", "Lifetime of SSE responses", (), LLM_BUCKETS)
+DB_LATENCY = REGISTRY.histogram("db_call_duration_seconds", "supabase_service call latency", ("function", "outcome"))
+LOOP_LAG = REGISTRY.histogram("event_loop_lag_seconds", "How late the event loop ran a timer", (), LAG_BUCKETS)
+
+
+def timed(histogram: Histogram) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Decorator for coroutine functions: observes their latency labelled (function name, ok|error)."""
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        name = fn.__name__
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await fn(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                histogram.observe(time.perf_counter() - start, name, outcome)
+        return wrapper
+    return decorator
+
+
+class LoopLagMonitor:
+    """Sleeps `interval` at a time and records how much later than asked it woke up."""
+
+    def __init__(self, histogram: Histogram = LOOP_LAG, interval: float = 0.5):
+        self.histogram = histogram
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.max_lag = max(self.max_lag, lag)
+            self.histogram.observe(lag)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+_loop_monitor: Optional[LoopLagMonitor] = None
+
+
+def get_loop_monitor(interval: float = 0.5) -> LoopLagMonitor:
+    global _loop_monitor
+    if _loop_monitor is None:
+        _loop_monitor = LoopLagMonitor(LOOP_LAG, interval)
+    return _loop_monitor
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -1,37 +1,284 @@
 # py
+import hashlib
+import math
+import mmap
+import os
+import struct
 import time
-import asyncio
-from typing import Dict
+from typing import Any, Callable, Dict, List, Optional, Union
+from loguru import logger
 from app.core.config import get_settings
+from app.core.metrics import RATE_LIMIT_DECISIONS
+from app.core.redis import get_redis, register_script_impl
 
 settings = get_settings()
 
-class TokenBucket:
-    def __init__(self, capacity: int, refill_rate: float):
-        self.capacity = capacity
-        self.refill_rate = refill_rate
-        self.tokens = capacity
-        self.last = time.monotonic()
-        self.lock = asyncio.Lock()
-
-    async def consume(self, amount: int = 1) -> bool:
-        async with self.lock:
-            now = time.monotonic()
-            elapsed = now - self.last
-            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
-            self.last = now
-            if self.tokens >= amount:
-                self.tokens -= amount
-                return True
-            return False
-
-_bucket_store: Dict[str, TokenBucket] = {}
-
-def get_bucket(key: str) -> TokenBucket:
-    if key not in _bucket_store:
-        _bucket_store[key] = TokenBucket(settings.RATE_LIMIT_TOKENS, settings.RATE_LIMIT_RATE)
-    return _bucket_store[key]
+class GCRAStore:
+    """Per-key rate limiting with the generic cell rate algorithm (GCRA).
+
+    Same policy as a token bucket of `capacity` tokens refilled at `rate` per second,
+    but the state for a key is one float: its theoretical arrival time (TAT). There is
+    no lock: the check-and-update runs synchronously, and the event loop never
+    interleaves two of them. A key whose TAT is in the past behaves exactly like a full
+    bucket, so it can be dropped without changing any decision. A sweep walks one shard
+    at a time and drops those idle keys, so memory tracks recently active users rather
+    than every user ever seen. `max_keys` is a hard cap for bursts of distinct keys.
+    """
+
+    __slots__ = ("interval", "burst", "shards", "mask", "max_keys", "size", "sweep_step", "clock", "evicted", "_next_sweep", "_sweep_shard")
+
+    def __init__(self, capacity: int, rate: float, shards: int = 64, max_keys: int = 1_000_000, sweep_interval: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        if capacity <= 0 or rate <= 0:
+            raise ValueError("capacity and rate must be positive")
+        if shards <= 0 or shards & (shards - 1):
+            raise ValueError("shards must be a power of two")
+        self.interval = 1.0 / rate
+        self.burst = capacity * self.interval + 1e-9  # tolerance for float drift in repeated TAT additions
+        self.shards: List[Dict[str, float]] = [{} for _ in range(shards)]
+        self.mask = shards - 1
+        self.max_keys = max_keys
+        self.size = 0
+        self.sweep_step = sweep_interval / shards  # one full pass over all shards per sweep_interval
+        self.clock = clock
+        self.evicted = 0
+        self._next_sweep = 0.0
+        self._sweep_shard = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def allow(self, key: str, cost: int = 1, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = self.clock()
+        shard = self.shards[hash(key) & self.mask]
+        tat = shard.get(key)
+        is_new = tat is None
+        if is_new:
+            if self.size >= self.max_keys:
+                self._make_room(shard, now)
+            tat = now
+        elif tat < now:
+            tat = now
+        new_tat = tat + cost * self.interval
+        if new_tat - now > self.burst:
+            allowed = False
+        else:
+            if is_new:
+                self.size += 1
+            shard[key] = new_tat
+            allowed = True
+        if now >= self._next_sweep:
+            self._sweep(now)
+        return allowed
+
+    def _evict_idle(self, shard: Dict[str, float], now: float) -> int:
+        idle = [k for k, tat in shard.items() if tat <= now]
+        for k in idle:
+            del shard[k]
+        self.size -= len(idle)
+        self.evicted += len(idle)
+        return len(idle)
+
+    def _sweep(self, now: float) -> None:
+        self._evict_idle(self.shards[self._sweep_shard], now)
+        self._sweep_shard = (self._sweep_shard + 1) & self.mask
+        self._next_sweep = now + self.sweep_step
+
+    def _make_room(self, shard: Dict[str, float], now: float) -> None:
+        if self._evict_idle(shard, now) or not shard:
+            return
+        # every key in this shard is still active: drop the oldest-inserted one (it restarts with a full bucket)
+        del shard[next(iter(shard))]
+        self.size -= 1
+        self.evicted += 1
+        logger.warning("Rate limiter key table full ({} keys); evicting an active key", self.max_keys)
+
+    def stats(self) -> Dict[str, int]:
+        return {"keys": self.size, "evicted": self.evicted}
+
+_SLOT = struct.Struct("<Qd")  # key hash (0 = empty slot), TAT
+
+
+class SharedMemoryGCRA:
+    """GCRA over a fixed-size hash table in an mmap'd file, shared by all workers on a host.
+
+    A slot is 16 bytes: a 64-bit hash of the key and its TAT. Slots are grouped in
+    stripes of 64; a key probes up to 8 slots in its stripe, and the check-and-update
+    holds an fcntl lock on that stripe's bytes only, so workers contend only when their
+    keys share a stripe. The table never grows. A slot whose TAT has passed is free,
+    like an idle key in GCRAStore. When every probed slot is active, the one closest to
+    idle is taken over. TATs come from CLOCK_MONOTONIC, which every process on the host
+    shares.
+    """
+
+    STRIPE = 64
+    PROBES = 8
+
+    def __init__(self, path: str, capacity: int, rate: float, slots: int = 65536, clock: Callable[[], float] = time.monotonic):
+        import fcntl  # POSIX only
+
+        if capacity <= 0 or rate <= 0:
+            raise ValueError("capacity and rate must be positive")
+        if slots <= 0 or slots % self.STRIPE:
+            raise ValueError(f"slots must be a positive multiple of {self.STRIPE}")
+        self._fcntl = fcntl
+        self.interval = 1.0 / rate
+        self.burst = capacity * self.interval + 1e-9
+        self.slots = slots
+        self.stripes = slots // self.STRIPE
+        self.clock = clock
+        self.evicted = 0  # this process only
+        size = slots * _SLOT.size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)  # new pages read as zeros, i.e. empty slots
+        self.mm = mmap.mmap(self.fd, size)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    def allow(self, key: str, cost: int = 1, now: Optional[float] = None) -> bool:
+        h = self._hash(key)
+        base = (h % self.stripes) * self.STRIPE
+        start = (h >> 32) % self.STRIPE
+        stripe_bytes = self.STRIPE * _SLOT.size
+        mm = self.mm
+        self._fcntl.lockf(self.fd, self._fcntl.LOCK_EX, stripe_bytes, base * _SLOT.size)
+        try:
+            if now is None:
+                now = self.clock()
+            slot = free = victim = None
+            victim_tat = math.inf
+            for i in range(self.PROBES):
+                idx = base + (start + i) % self.STRIPE
+                slot_hash, tat = _SLOT.unpack_from(mm, idx * _SLOT.size)
+                if slot_hash == h:
+                    slot = idx
+                    break
+                if free is None and (slot_hash == 0 or tat <= now):
+                    free = idx
+                elif tat < victim_tat:
+                    victim, victim_tat = idx, tat
+            if slot is None:
+                tat = now
+                if free is not None:
+                    slot = free
+                else:
+                    slot = victim
+                    self.evicted += 1
+            elif tat < now:
+                tat = now
+            new_tat = tat + cost * self.interval
+            if new_tat - now > self.burst:
+                return False
+            _SLOT.pack_into(mm, slot * _SLOT.size, h, new_tat)
+            return True
+        finally:
+            self._fcntl.lockf(self.fd, self._fcntl.LOCK_UN, stripe_bytes, base * _SLOT.size)
+
+    def stats(self) -> Dict[str, int]:
+        now = self.clock()
+        active = sum(1 for slot_hash, tat in _SLOT.iter_unpack(self.mm) if slot_hash and tat > now)
+        return {"keys": active, "slots": self.slots, "evicted": self.evicted}
+
+    def close(self) -> None:
+        self.mm.close()
+        os.close(self.fd)
+
+
+# One round trip, atomic on the server. Uses the server clock so hosts need not agree on
+# time; a key expires when its bucket would be full again, so idle users cost nothing.
+GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local interval, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat or tat < now then tat = now end
+local new_tat = tat + cost * interval
+if new_tat - now > burst then return 0 end
+redis.call('SET', KEYS[1], string.format('%.6f', new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return 1
+"""
+
+
+def _gcra_lua_local(r: Any, keys: List[str], args: List[Any]) -> int:
+    # InMemoryRedis port of GCRA_LUA
+    now = time.time()
+    interval, burst, cost = (float(a) for a in args)
+    raw = r._alive(keys[0])
+    tat = float(raw) if raw is not None else now
+    tat = max(tat, now)
+    new_tat = tat + cost * interval
+    if new_tat - now > burst:
+        return 0
+    r._put(keys[0], "%.6f" % new_tat, math.ceil((new_tat - now) * 1000) / 1000.0)
+    return 1
+
+
+register_script_impl(GCRA_LUA, _gcra_lua_local)
+
+
+class RedisGCRA:
+    """GCRA state kept in Redis, shared by every worker on every host."""
+
+    def __init__(self, client: Any, capacity: int, rate: float, prefix: str = "rl:"):
+        if capacity <= 0 or rate <= 0:
+            raise ValueError("capacity and rate must be positive")
+        self.interval = 1.0 / rate
+        self.burst = capacity * self.interval + 1e-6  # the script stores TATs with microsecond precision
+        self.prefix = prefix
+        self.script = client.register_script(GCRA_LUA)
+
+    async def allow(self, key: str, cost: int = 1) -> bool:
+        return bool(await self.script(keys=[self.prefix + key], args=[self.interval, self.burst, cost]))
+
+
+_store: Optional[GCRAStore] = None
+_shared: Optional[Union[SharedMemoryGCRA, RedisGCRA]] = None
+
+
+def get_store() -> GCRAStore:
+    """This worker's own limiter; also the fallback when Redis is unreachable."""
+    global _store
+    if _store is None:
+        _store = GCRAStore(
+            settings.RATE_LIMIT_TOKENS,
+            settings.RATE_LIMIT_RATE,
+            shards=settings.RATE_LIMIT_SHARDS,
+            max_keys=settings.RATE_LIMIT_MAX_KEYS,
+            sweep_interval=settings.RATE_LIMIT_SWEEP_SECONDS,
+        )
+    return _store
+
+
+def get_limiter() -> Union[GCRAStore, SharedMemoryGCRA, RedisGCRA]:
+    global _shared
+    backend = settings.RATE_LIMIT_BACKEND
+    if backend == "memory":
+        return get_store()
+    if _shared is None:
+        if backend == "shm":
+            _shared = SharedMemoryGCRA(settings.RATE_LIMIT_SHM_PATH, settings.RATE_LIMIT_TOKENS, settings.RATE_LIMIT_RATE, slots=settings.RATE_LIMIT_SHM_SLOTS)
+        elif backend == "redis":
+            _shared = RedisGCRA(get_redis(), settings.RATE_LIMIT_TOKENS, settings.RATE_LIMIT_RATE, prefix=settings.RATE_LIMIT_REDIS_PREFIX)
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+    return _shared
+
 
 async def allow_request(key: str) -> bool:
-    bucket = get_bucket(key)
-    return await bucket.consume(1)
+    limiter = get_limiter()
+    backend = settings.RATE_LIMIT_BACKEND
+    if isinstance(limiter, RedisGCRA):
+        try:
+            allowed = await limiter.allow(key)
+        except Exception as e:
+            # keep serving with per-worker limits rather than failing every request
+            logger.warning("Redis rate limiter unavailable ({}); using local limits", e)
+            backend = "memory_fallback"
+            allowed = get_store().allow(key)
+    else:
+        allowed = limiter.allow(key)
+    RATE_LIMIT_DECISIONS.inc(backend, "allow" if allowed else "deny")
+    return allowed
@@ -0,0 +1,107 @@
+# py
+import fnmatch
+import hashlib
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.core.config import get_settings
+
+settings = get_settings()
+_redis: Any = None
+
+# Python ports of the Lua scripts the backend registers, keyed by the script's SHA1.
+ScriptImpl = Callable[["InMemoryRedis", List[str], List[Any]], Any]
+_script_impls: Dict[str, ScriptImpl] = {}
+
+
+def register_script_impl(script: str, impl: ScriptImpl) -> None:
+    """Give InMemoryRedis a Python equivalent of `script`. The port runs without awaiting, so it is atomic like EVAL."""
+    _script_impls[hashlib.sha1(script.encode()).hexdigest()] = impl
+
+
+class InMemoryRedis:
+    """Local stand-in for the subset of Redis commands the backend uses.
+
+    Values are stored as bytes like a real server would return them, so code
+    written against it behaves the same once pointed at Redis.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+
+    def _alive(self, key: str) -> Optional[bytes]:
+        key = self._key(key)
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    @staticmethod
+    def _key(key: Any) -> str:
+        return key.decode() if isinstance(key, bytes) else str(key)
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._alive(key)
+
+    async def set(self, key: str, value: Any, ex: Optional[float] = None, px: Optional[int] = None, nx: bool = False) -> bool:
+        if nx and self._alive(key) is not None:
+            return False
+        self._put(key, value, px / 1000.0 if px is not None else ex)
+        return True
+
+    def _put(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[self._key(key)] = (self._encode(value), expires_at)
+
+    async def delete(self, *keys: str) -> int:
+        removed = 0
+        for key in keys:
+            if self._data.pop(self._key(key), None) is not None:
+                removed += 1
+        return removed
+
+    async def scan_iter(self, match: str = "*"):
+        for key in list(self._data):
+            if fnmatch.fnmatchcase(key, match) and self._alive(key) is not None:
+                yield key.encode()
+
+    def register_script(self, script: str):
+        """Mirror of redis-py's register_script: returns an awaitable `script(keys=..., args=...)`."""
+        impl = _script_impls.get(hashlib.sha1(script.encode()).hexdigest())
+        if impl is None:
+            raise NotImplementedError("InMemoryRedis has no local implementation of this script")
+
+        async def run(keys: Optional[List[str]] = None, args: Optional[List[Any]] = None, client: Any = None) -> Any:
+            return impl(self, list(keys or []), list(args or []))
+
+        return run
+
+    async def ping(self) -> bool:
+        return True
+
+    async def aclose(self) -> None:
+        self._data.clear()
+
+
+def get_redis():
+    """Shared Redis connection built from REDIS_URL; `memory://` uses InMemoryRedis."""
+    global _redis
+    if _redis is None:
+        url = settings.REDIS_URL
+        if not url:
+            raise RuntimeError("REDIS_URL is not configured")
+        if url.startswith("memory://"):
+            _redis = InMemoryRedis()
+        else:
+            import redis.asyncio as aioredis  # optional dependency, only needed for a real server
+            _redis = aioredis.from_url(url)
+    return _redis
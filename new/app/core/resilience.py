@@ -0,0 +1,243 @@
+# py
+"""Retries, hedging and a circuit breaker for calls to an external provider.
+
+`Resilience.call(fn)` runs `fn()` and wraps it as follows:
+
+- If the call is slower than the recent p95 latency, a second identical attempt
+  (a hedge) is started and whichever finishes first wins.
+- Provider failures and throttling (as judged by `classify`) are retried after the
+  server's Retry-After, or otherwise after short jittered exponential backoff.
+- Retries and hedges draw on one process-wide budget. It refills with a fraction of
+  all calls, so during an outage retries cannot multiply the load.
+- After `failure_threshold` consecutive provider failures the breaker opens and calls
+  fail at once with CircuitOpenError. After `reset_timeout` one probe is let through;
+  its outcome closes the breaker or re-opens it.
+"""
+import asyncio
+import email.utils
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Mapping, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# what a failed call means, as decided by the caller's `classify(exc) -> (kind, retry_after)`
+FATAL = "fatal"  # not retryable and says nothing about provider health (bad request, auth)
+FAILURE = "failure"  # transient provider failure: retried, counts towards opening the breaker
+THROTTLED = "throttled"  # rate limited: retried after Retry-After, but the provider is healthy
+
+
+class CircuitOpenError(RuntimeError):
+    """The provider is failing; the call was rejected without being attempted."""
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Seconds to wait from `retry-after-ms` or `retry-after` (seconds or an HTTP date), or None."""
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            parsed = email.utils.parsedate_tz(value)
+            if parsed is not None:
+                return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+    return None
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def before_call(self) -> None:
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError("Provider circuit is open")
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                raise CircuitOpenError("Provider circuit is half-open; probe in flight")
+            self._probing = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def record_neutral(self) -> None:
+        # the call ended without telling us anything about provider health (e.g. a 400)
+        self._probing = False
+
+
+class RetryBudget:
+    """Token bucket for retries and hedges: each call deposits `ratio`, plus `min_per_second` over time."""
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.exhausted = 0
+        self._refilled_at = time.monotonic()
+
+    def deposit(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio + (now - self._refilled_at) * self.min_per_second)
+        self._refilled_at = now
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        self.exhausted += 1
+        return False
+
+
+class LatencyWindow:
+    """Recent successful call latencies; the hedge delay is their `percentile`."""
+
+    def __init__(self, size: int = 256, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, latency: float) -> None:
+        self.samples.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class Resilience:
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        budget: RetryBudget,
+        classify: Callable[[BaseException], Tuple[str, Optional[float]]],
+        max_attempts: int = 3,
+        base_delay: float = 0.25,
+        max_delay: float = 4.0,
+        max_retry_after: float = 20.0,
+        hedge_percentile: Optional[float] = 0.95,
+        hedge_min_delay: float = 1.0,
+    ):
+        self.breaker = breaker
+        self.budget = budget
+        self.classify = classify
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.latencies = LatencyWindow()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        if self.hedge_percentile is None:
+            return None
+        p = self.latencies.percentile(self.hedge_percentile)
+        return None if p is None else max(self.hedge_min_delay, p)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))  # full jitter
+
+    async def call(self, fn: Callable[[], Awaitable[T]], hedge: bool = True) -> T:
+        self.budget.deposit()
+        for attempt in range(self.max_attempts):
+            self.breaker.before_call()
+            try:
+                result = await (self._hedged(fn) if hedge else fn())
+            except asyncio.CancelledError:
+                self.breaker.record_neutral()
+                raise
+            except Exception as e:
+                kind, retry_after = self.classify(e)
+                if kind == FAILURE:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_neutral()
+                if kind == FATAL:
+                    raise
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                if attempt + 1 >= self.max_attempts or delay > self.max_retry_after or not self.budget.withdraw():
+                    raise
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+        raise AssertionError("unreachable")
+
+    async def _timed(self, fn: Callable[[], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        result = await fn()
+        self.latencies.add(time.monotonic() - start)
+        return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable[T]]) -> T:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._timed(fn)
+        start = time.monotonic()
+        primary = asyncio.ensure_future(fn())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and self.budget.withdraw():
+                self.hedges += 1
+                pending.add(asyncio.ensure_future(fn()))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.latencies.add(time.monotonic() - start)
+                        self.hedge_wins += task is not primary
+                        return task.result()
+                    error = task.exception()
+            raise error  # every attempt failed
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "breaker_rejected": self.breaker.rejected,
+            "retries": self.retries,
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "retry_budget_exhausted": self.budget.exhausted,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": round(d * 1000, 1) if (d := self.hedge_delay()) is not None else None,
+        }
@@ -0,0 +1,230 @@
+# py
+"""Admission control in front of the LLM provider: weighted fair queuing plus an AIMD limit.
+
+At most `limit` calls are outstanding at once. Callers beyond that wait in a queue and
+are released in weighted-fair order: each call gets a virtual finish tag of
+max(now, tier's last tag) + 1/weight. So under contention a pro call (weight 4) is
+admitted four times as often as a free one, while an idle tier still gets a slot right
+away. A free burst can therefore never starve paying users.
+
+The limit adapts (AIMD): +1/limit per on-time success while the limit is actually in
+use, multiplied by 0.9 when latency exceeds the target and by 0.5 on a provider 429.
+There is at most one decrease per cooldown, so one overload burst does not collapse
+it to the minimum. Queue waits are recorded per tier.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+from app.core.config import get_settings
+from app.core.metrics import REGISTRY
+
+settings = get_settings()
+
+# subscription tier of the request being served; set by the agent orchestrator
+current_tier: ContextVar[str] = ContextVar("current_tier", default="free")
+
+
+class SchedulerOverloaded(RuntimeError):
+    """The call could not be admitted: the queue is full or it waited longer than the queue timeout."""
+
+
+class AIMDLimit:
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_target: float, backoff: float = 0.5, latency_backoff: float = 0.9, cooldown: float = 1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.latency_backoff = latency_backoff
+        self.cooldown = cooldown
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.decreases = 0
+        self._last_decrease = float("-inf")
+
+    @property
+    def value(self) -> int:
+        return int(self.limit)
+
+    def on_success(self, latency: float, in_flight: int) -> None:
+        if latency > self.latency_target:
+            self._decrease(self.latency_backoff)
+        elif in_flight * 2 >= self.limit:  # only grow a limit that is actually being used
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_overload(self) -> None:
+        self._decrease(self.backoff)
+
+    def _decrease(self, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * factor)
+        self.decreases += 1
+
+
+class _TierStats:
+    __slots__ = ("submitted", "admitted", "rejected", "wait_total", "wait_max", "recent")
+
+    def __init__(self):
+        self.submitted = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent: Deque[float] = deque(maxlen=1024)
+
+    def admit(self, wait: float) -> None:
+        self.admitted += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.recent.append(wait)
+
+    def snapshot(self, depth: int) -> Dict[str, Any]:
+        waits = sorted(self.recent)
+
+        def pct(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 3) if waits else 0.0
+
+        return {
+            "queued": depth,
+            "submitted": self.submitted,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_avg_ms": round(self.wait_total / self.admitted * 1000, 3) if self.admitted else 0.0,
+            "wait_p50_ms": pct(0.50),
+            "wait_p95_ms": pct(0.95),
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+class FairScheduler:
+    def __init__(self, weights: Dict[str, float], limit: AIMDLimit, max_queue: int, queue_timeout: float):
+        self.weights = weights
+        self.default_weight = min(weights.values()) if weights else 1.0
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._heap: List[Tuple[float, int, str, asyncio.Future, float]] = []
+        self._seq = itertools.count()
+        self._virtual = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._depth: Dict[str, int] = {}
+        self._stats: Dict[str, _TierStats] = {}
+
+    def _tier_stats(self, tier: str) -> _TierStats:
+        stats = self._stats.get(tier)
+        if stats is None:
+            stats = self._stats[tier] = _TierStats()
+        return stats
+
+    @property
+    def queued(self) -> int:
+        return sum(self._depth.values())
+
+    async def acquire(self, tier: str) -> None:
+        stats = self._tier_stats(tier)
+        stats.submitted += 1
+        if self.in_flight < self.limit.value and not self.queued:
+            self.in_flight += 1
+            stats.admit(0.0)
+            return
+        if self.queued >= self.max_queue:
+            stats.rejected += 1
+            raise SchedulerOverloaded("LLM queue is full")
+
+        finish = max(self._virtual, self._last_finish.get(tier, 0.0)) + 1.0 / self.weights.get(tier, self.default_weight)
+        self._last_finish[tier] = finish
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (finish, next(self._seq), tier, fut, time.monotonic()))
+        self._depth[tier] = self._depth.get(tier, 0) + 1
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # the slot was granted in the same tick as the timeout
+            stats.rejected += 1
+            raise SchedulerOverloaded(f"Waited over {self.queue_timeout:g}s for an LLM slot") from None
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # the slot was granted just as the caller went away
+            raise
+        finally:
+            if not fut.done() or fut.cancelled():
+                self._depth[tier] -= 1  # left the queue without being admitted; its entry is skipped lazily
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._heap and self.in_flight < self.limit.value:
+            finish, _, tier, fut, enqueued = heapq.heappop(self._heap)
+            if fut.done():  # timed out or cancelled while queued
+                continue
+            self._virtual = finish
+            self._depth[tier] -= 1
+            self.in_flight += 1
+            self._tier_stats(tier).admit(time.monotonic() - enqueued)
+            fut.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, tier: str) -> AsyncIterator[None]:
+        await self.acquire(tier)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record_success(self, latency: float) -> None:
+        self.limit.on_success(latency, self.in_flight)
+        self._dispatch()  # the limit may have grown
+
+    def record_overload(self) -> None:
+        self.limit.on_overload()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit.value,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "limit_decreases": self.limit.decreases,
+            "tiers": {tier: s.snapshot(self._depth.get(tier, 0)) for tier, s in self._stats.items()},
+        }
+
+
+_scheduler: Optional[FairScheduler] = None
+
+
+def get_llm_scheduler() -> FairScheduler:
+    global _scheduler
+    if _scheduler is None:
+        limit = AIMDLimit(
+            settings.LLM_INITIAL_CONCURRENCY,
+            settings.LLM_MIN_CONCURRENCY,
+            settings.LLM_MAX_CONCURRENCY,
+            settings.LLM_LATENCY_TARGET_SECONDS,
+        )
+        _scheduler = FairScheduler(settings.LLM_TIER_WEIGHTS, limit, settings.LLM_MAX_QUEUE, settings.LLM_QUEUE_TIMEOUT)
+    return _scheduler
+
+
+def _collect_metrics():
+    if _scheduler is None:
+        return
+    s = _scheduler
+    yield "llm_concurrency_limit", "gauge", "Current adaptive limit on concurrent LLM calls", [("", {}, s.limit.value)]
+    yield "llm_in_flight", "gauge", "LLM calls holding a scheduler slot", [("", {}, s.in_flight)]
+    yield "llm_queued", "gauge", "LLM calls waiting for a scheduler slot", [("", {}, s.queued)]
+    tiers = list(s._stats.items())
+    yield "llm_queue_wait_seconds", "summary", "Time LLM calls waited for a slot, by tier", (
+        [("_sum", {"tier": t}, st.wait_total) for t, st in tiers] + [("_count", {"tier": t}, st.admitted) for t, st in tiers])
+    yield "llm_queue_rejected", "counter", "LLM calls rejected by the scheduler (queue full or timed out)", [("_total", {"tier": t}, st.rejected) for t, st in tiers]
+
+
+REGISTRY.register_collector(_collect_metrics)
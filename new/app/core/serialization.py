@@ -0,0 +1,82 @@
+# py
+"""One JSON codec for the hot paths: SSE frames, cache keys and values, API responses.
+
+Uses orjson when it is installed (JSON_BACKEND=auto), otherwise the stdlib. Both
+produce the same compact UTF-8 bytes: datetimes become ISO strings and other unknown
+types str(). `canonical` sorts keys so equal values give equal bytes. Hash it with
+`digest` to build cache keys.
+"""
+import hashlib
+import json
+from typing import Any, Callable, Union
+from fastapi.responses import JSONResponse
+from app.core.config import get_settings
+
+settings = get_settings()
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    # match orjson's native output for datetimes and numpy values
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return str(obj)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+
+
+def _json_canonical(obj: Any) -> bytes:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+
+
+def _select() -> tuple:
+    backend = settings.JSON_BACKEND
+    if backend == "orjson" and orjson is None:
+        raise RuntimeError("JSON_BACKEND=orjson but orjson is not installed")
+    if backend in ("auto", "orjson") and orjson is not None:
+        opts = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        return (
+            "orjson",
+            lambda obj: orjson.dumps(obj, default=str, option=opts),
+            lambda obj: orjson.dumps(obj, default=str, option=opts | orjson.OPT_SORT_KEYS),
+            orjson.loads,
+        )
+    if backend not in ("auto", "json", "orjson"):
+        raise ValueError(f"Unknown JSON_BACKEND: {backend}")
+    return "json", _json_dumps, _json_canonical, json.loads
+
+
+BACKEND: str
+dumps: Callable[[Any], bytes]
+canonical: Callable[[Any], bytes]
+loads: Callable[[Union[bytes, str]], Any]
+BACKEND, dumps, canonical, loads = _select()
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode()
+
+
+def digest(*parts: Union[str, bytes]) -> str:
+    """Hex key over several parts without concatenating them; parts are length-prefixed so they cannot run together."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        data = part.encode() if isinstance(part, str) else part
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: renders with the selected backend instead of json.dumps."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
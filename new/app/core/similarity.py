@@ -0,0 +1,108 @@
+# py
+"""MinHash signatures and an LSH index for near-duplicate lookup.
+
+A signature is `num_perm` minimum hashes over a feature set. The fraction of equal
+positions in two signatures estimates the Jaccard similarity of the two sets. The
+index splits each signature into `bands` bands of `rows` values. Two entries become
+candidates when any band matches exactly, which happens with probability
+1 - (1 - s^rows)^bands. Candidates are then ranked by their estimated similarity.
+Entries live in a namespace: only entries in the same namespace can match. The index
+is bounded (LRU) and entries expire after their TTL.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple
+import numpy as np
+
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _hash32(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=4).digest(), "little")
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        # (a * h + b) mod p with a, b, h < 2^32 stays inside uint64
+        self._a = rng.randint(1, int(_MAX_HASH), size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(_MAX_HASH), size=num_perm, dtype=np.uint64)
+
+    def signature(self, features: Iterable[str]) -> np.ndarray:
+        hashes = np.fromiter((_hash32(f) for f in set(features)), dtype=np.uint64)
+        if not hashes.size:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the feature sets behind two signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class LSHIndex:
+    def __init__(self, num_perm: int, bands: int, max_entries: int, clock: Callable[[], float] = time.monotonic):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self._clock = clock
+        self._buckets: Dict[Tuple[str, int, bytes], Set[str]] = {}
+        # key -> (namespace, signature, expires_at, value), least recently used first
+        self._entries: "OrderedDict[str, Tuple[str, np.ndarray, float, Any]]" = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _band_keys(self, namespace: str, signature: np.ndarray) -> List[Tuple[str, int, bytes]]:
+        return [(namespace, i, signature[i * self.rows:(i + 1) * self.rows].tobytes()) for i in range(self.bands)]
+
+    def add(self, namespace: str, key: str, signature: np.ndarray, value: Any, ttl: float) -> None:
+        self.remove(key)
+        self._entries[key] = (namespace, signature, self._clock() + ttl, value)
+        for band in self._band_keys(namespace, signature):
+            self._buckets.setdefault(band, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self.remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in self._band_keys(entry[0], entry[1]):
+            keys = self._buckets.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._buckets[band]
+
+    def query(self, namespace: str, signature: np.ndarray, threshold: float) -> List[Tuple[float, str, Any]]:
+        """Live entries in `namespace` with estimated similarity >= threshold, most similar first."""
+        candidates: Set[str] = set()
+        for band in self._band_keys(namespace, signature):
+            candidates |= self._buckets.get(band, set())
+        now = self._clock()
+        matches = []
+        for key in candidates:
+            _, other, expires_at, value = self._entries[key]
+            if expires_at <= now:
+                self.remove(key)
+                continue
+            score = similarity(signature, other)
+            if score >= threshold:
+                matches.append((score, key, value))
+        matches.sort(key=lambda m: m[0], reverse=True)
+        if matches:
+            self._entries.move_to_end(matches[0][1])
+        return matches
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
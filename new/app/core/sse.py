@@ -0,0 +1,204 @@
+# py
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from app.core.config import get_settings
+from app.core import serialization
+from app.core.metrics import REGISTRY, SSE_DURATION, SSE_TTFB
+
+settings = get_settings()
+
+Event = Union[Dict[str, Any], str]
+
+SSE_HEADERS = {"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+
+_END = object()
+_totals = {"streams": 0, "active": 0, "bytes": 0, "frames": 0, "events": 0}
+
+
+def encode_event(event: Event) -> bytes:
+    """Dict events become a `data:` line; strings are passed through as pre-formatted SSE."""
+    if isinstance(event, str):
+        return event.encode()
+    return b"data: " + serialization.dumps(event) + b"\n\n"
+
+
+def format_event(event: Event) -> str:
+    return encode_event(event).decode()
+
+
+def error_event(message: str) -> str:
+    return f"event: error\ndata: {serialization.dumps_str({'error': message})}\n\n"
+
+
+def _mergeable(prev: Event, event: Event) -> bool:
+    return (
+        isinstance(prev, dict) and isinstance(event, dict)
+        and prev.get("stage") == "delta" and event.get("stage") == "delta"
+        and prev.get("agent") == event.get("agent")
+        and prev.keys() == event.keys()
+    )
+
+
+class SSEWriter:
+    """Turns an event stream into SSE frames sized for the wire.
+
+    Events are pulled from the source by a producer task into a bounded queue. The
+    frame loop drains whatever is ready, merges consecutive token deltas from the same
+    agent, and flushes once the frame reaches `chunk_size` bytes or `max_delay` has
+    passed since the first buffered event. The first frame is flushed immediately so
+    time-to-first-byte is not delayed. Because frames are yielded to a response that
+    awaits the ASGI `send`, a slow client stops the frame loop, the queue fills, and
+    the producer stops pulling from the source: backpressure reaches the agent streams
+    instead of piling up in memory. A comment frame is sent when idle for `heartbeat`.
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[Event],
+        chunk_size: Optional[int] = None,
+        max_delay: Optional[float] = None,
+        heartbeat: Optional[float] = None,
+        queue_size: Optional[int] = None,
+    ):
+        self.source = source
+        self.chunk_size = chunk_size or settings.STREAM_CHUNK_SIZE
+        self.max_delay = settings.SSE_MAX_DELAY_MS / 1000.0 if max_delay is None else max_delay
+        self.heartbeat = settings.SSE_HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or settings.SSE_QUEUE_SIZE)
+        self.bytes_sent = 0
+        self.frames_sent = 0
+        self.events = 0
+        self.started_at = time.monotonic()
+        self.first_frame_at: Optional[float] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "bytes": self.bytes_sent,
+            "frames": self.frames_sent,
+            "events": self.events,
+            "ttfb": (self.first_frame_at - self.started_at) if self.first_frame_at else None,
+            "duration": time.monotonic() - self.started_at,
+        }
+
+    async def _produce(self) -> None:
+        try:
+            async for event in self.source:
+                await self._queue.put(event)
+        except Exception as e:
+            logger.exception("SSE source failed")
+            await self._queue.put(error_event(str(e)))
+        # not in a finally: once cancelled nobody drains the queue, and a put on a full queue would never return
+        await self._queue.put(_END)
+
+    def _emit(self, pending: List[Union[Event, bytes]]) -> bytes:
+        frame = b"".join(e if isinstance(e, bytes) else encode_event(e) for e in pending)
+        self.frames_sent += 1
+        self.bytes_sent += len(frame)
+        _totals["frames"] += 1
+        _totals["bytes"] += len(frame)
+        if self.first_frame_at is None:
+            self.first_frame_at = time.monotonic()
+            SSE_TTFB.observe(self.first_frame_at - self.started_at)
+        return frame
+
+    def _add(self, pending: List[Union[Event, bytes]], event: Event) -> int:
+        """Buffers an event and returns (about) how many bytes it adds to the frame.
+
+        Every event is serialized exactly once: deltas stay dicts until the frame is
+        emitted, because the next delta may still merge into them; everything else is
+        encoded here.
+        """
+        self.events += 1
+        _totals["events"] += 1
+        if pending and _mergeable(pending[-1], event):
+            pending[-1] = {**pending[-1], "content": pending[-1]["content"] + event["content"]}
+            return len(event["content"])
+        if isinstance(event, dict) and event.get("stage") == "delta":
+            pending.append(event)
+            return len(event.get("content") or "") + 48  # frame overhead estimate
+        data = encode_event(event)
+        pending.append(data)
+        return len(data)
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        producer = asyncio.create_task(self._produce())
+        getter: Optional[asyncio.Future] = None
+        _totals["streams"] += 1
+        _totals["active"] += 1
+        try:
+            done = False
+            while not done:
+                # wait for the first event of the next frame (heartbeat while idle)
+                getter = getter or asyncio.ensure_future(self._queue.get())
+                await asyncio.wait({getter}, timeout=self.heartbeat or None)
+                if not getter.done():
+                    yield HEARTBEAT_FRAME
+                    continue
+                event, getter = getter.result(), None
+                if event is _END:
+                    break
+
+                pending: List[Union[Event, bytes]] = []
+                size = self._add(pending, event)
+                deadline = loop.time() + (self.max_delay if self.first_frame_at is not None else 0.0)
+                while size < self.chunk_size:
+                    if not self._queue.empty():
+                        event = self._queue.get_nowait()
+                    else:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            break
+                        getter = asyncio.ensure_future(self._queue.get())
+                        await asyncio.wait({getter}, timeout=remaining)
+                        if not getter.done():
+                            break
+                        event, getter = getter.result(), None
+                    if event is _END:
+                        done = True
+                        break
+                    size += self._add(pending, event)
+                yield self._emit(pending)
+        finally:
+            _totals["active"] -= 1
+            SSE_DURATION.observe(time.monotonic() - self.started_at)
+            if getter is not None:
+                getter.cancel()
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            # the producer may have been cancelled mid-iteration; close the source so upstream streams end too
+            aclose = getattr(self.source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            logger.debug("SSE stream closed", **self.stats())
+
+
+class EventSourceResponse(StreamingResponse):
+    """StreamingResponse fed by an SSEWriter; `writer.stats()` has the per-stream counters."""
+
+    media_type = "text/event-stream"
+
+    def __init__(self, events: AsyncIterator[Event], headers: Optional[Dict[str, str]] = None, **writer_options: Any):
+        self.writer = SSEWriter(events, **writer_options)
+        super().__init__(self.writer.frames(), headers={**SSE_HEADERS, **(headers or {})}, media_type=self.media_type)
+
+
+def stream_totals() -> Dict[str, int]:
+    """Process-wide SSE counters (streams opened/active, bytes, frames, events)."""
+    return dict(_totals)
+
+
+_TOTALS_HELP = {"streams": "SSE responses opened", "bytes": "SSE bytes sent", "frames": "SSE frames sent", "events": "Events written to SSE responses"}
+
+
+def _collect_totals():
+    yield "sse_streams_active", "gauge", "Open SSE responses", [("", {}, _totals["active"])]
+    for key, help in _TOTALS_HELP.items():
+        yield f"sse_{key}", "counter", help, [("_total", {}, _totals[key])]
+
+
+REGISTRY.register_collector(_collect_totals)
@@ -0,0 +1,264 @@
+# py
+import base64
+import json
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple
+import httpx
+from loguru import logger
+from app.core.config import get_settings
+from app.core import serialization
+
+settings = get_settings()
+
+
+# what GET /health/insights returns; the jsonb request/agent payloads are never fetched for lists
+INSIGHT_LIST_COLUMNS = ("id", "aggregated_output", "confidence", "created_at")
+
+# keyset position: (created_at, id) of the last row of the previous page
+Cursor = Tuple[str, str]
+
+
+def encode_cursor(row: Dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([row["created_at"], row["id"]]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Cursor:
+    # both values end up inside a PostgREST filter string, so only a timestamp and a UUID get through
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        datetime.fromisoformat(created_at)
+        return created_at, str(uuid.UUID(row_id))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+class Repository(Protocol):
+    async def upsert_user_profile(self, supabase_id: str, data: Dict) -> Dict: ...
+    async def resolve_profile_id(self, supabase_id: str) -> Optional[str]: ...
+    async def create_health_insight(self, user_supabase_id: str, payload: Dict) -> Dict: ...
+    async def bulk_create_health_insights(self, rows: List[Dict]) -> int: ...
+    async def list_health_insights(self, user_supabase_id: str, limit: int, after: Optional[Cursor] = None, columns: Sequence[str] = ...) -> List[Dict]: ...
+    async def close(self) -> None: ...
+
+
+class DBError(RuntimeError):
+    def __init__(self, status_code: int):
+        super().__init__("DB error")
+        self.status_code = status_code
+
+
+class IdentityMap:
+    """Bounded LRU of supabase_id -> users_profiles.id.
+
+    A profile's id never changes while it exists, so entries need no TTL: they are
+    (re)filled whenever a profile is upserted or a query returns the id, and dropped
+    when the database reports the profile missing.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._ids: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, supabase_id: str) -> Optional[str]:
+        user_id = self._ids.get(supabase_id)
+        if user_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._ids.move_to_end(supabase_id)
+        return user_id
+
+    def put(self, supabase_id: str, user_id: str) -> None:
+        self._ids[supabase_id] = user_id
+        self._ids.move_to_end(supabase_id)
+        while len(self._ids) > self.max_entries:
+            self._ids.popitem(last=False)
+
+    def invalidate(self, supabase_id: str) -> None:
+        self._ids.pop(supabase_id, None)
+
+
+class PostgrestRepository:
+    """Talks to Supabase's PostgREST endpoint over one pooled, keep-alive httpx client.
+
+    Every call is a single round trip: the profile id comes from the identity map, and
+    on a miss it is resolved inside the same statement (an inner-join filter for reads,
+    the create_health_insight_for RPC for writes).
+    """
+
+    def __init__(self, base_url: str, service_key: str, client: Optional[httpx.AsyncClient] = None):
+        self.identities = IdentityMap(settings.DB_IDENTITY_CACHE_SIZE)
+        self.client = client or httpx.AsyncClient(
+            base_url=base_url.rstrip("/") + "/rest/v1",
+            headers={"apikey": service_key, "Authorization": f"Bearer {service_key}", "Content-Type": "application/json"},
+            limits=httpx.Limits(max_connections=settings.DB_POOL_SIZE, max_keepalive_connections=settings.DB_POOL_SIZE, keepalive_expiry=settings.DB_KEEPALIVE_EXPIRY),
+            timeout=httpx.Timeout(settings.DB_TIMEOUT, connect=settings.DB_CONNECT_TIMEOUT, pool=settings.DB_POOL_TIMEOUT),
+        )
+
+    async def _request(self, method: str, path: str, what: str, **kwargs) -> Any:
+        if "json" in kwargs:
+            kwargs["content"] = serialization.dumps(kwargs.pop("json"))
+        resp = await self.client.request(method, path, **kwargs)
+        if resp.status_code >= 400:
+            logger.error("Supabase {} error: {} {}", what, resp.status_code, resp.text)
+            raise DBError(resp.status_code)
+        return serialization.loads(resp.content) if resp.content else None
+
+    async def upsert_user_profile(self, supabase_id: str, data: Dict) -> Dict:
+        rows = await self._request(
+            "POST", "/users_profiles", "upsert_user_profile",
+            params={"on_conflict": "supabase_id"},
+            headers={"Prefer": "resolution=merge-duplicates,return=representation"},
+            json=data,
+        )
+        self.identities.put(supabase_id, rows[0]["id"])
+        return rows[0]
+
+    async def resolve_profile_id(self, supabase_id: str) -> Optional[str]:
+        """users_profiles.id for a supabase_id (identity map first), or None if there is no profile."""
+        user_id = self.identities.get(supabase_id)
+        if user_id is not None:
+            return user_id
+        rows = await self._request("GET", "/users_profiles", "resolve_profile_id", params={"select": "id", "supabase_id": f"eq.{supabase_id}", "limit": 1})
+        if not rows:
+            return None
+        self.identities.put(supabase_id, rows[0]["id"])
+        return rows[0]["id"]
+
+    async def create_health_insight(self, user_supabase_id: str, payload: Dict) -> Dict:
+        user_id = self.identities.get(user_supabase_id)
+        if user_id is not None:
+            try:
+                rows = await self._request("POST", "/health_insights", "create_health_insight", headers={"Prefer": "return=representation"}, json={"user_id": user_id, **payload})
+                return rows[0]
+            except DBError as e:
+                if e.status_code != 409:  # 409 = FK violation: profile was deleted, mapping is stale
+                    raise
+                self.identities.invalidate(user_supabase_id)
+        rows = await self._request("POST", "/rpc/create_health_insight_for", "create_health_insight", json={"p_supabase_id": user_supabase_id, **{f"p_{k}": v for k, v in payload.items()}})
+        if not rows:
+            raise ValueError("User profile not found")
+        self.identities.put(user_supabase_id, rows[0]["user_id"])
+        return rows[0]
+
+    async def bulk_create_health_insights(self, rows: List[Dict]) -> int:
+        """Multi-row insert; rows carry supabase_id and a pre-allocated id, duplicates are ignored."""
+        inserted = await self._request("POST", "/rpc/create_health_insights_bulk", "bulk_create_health_insights", json={"p_rows": rows})
+        if inserted != len(rows):
+            logger.warning("bulk_create_health_insights inserted {} of {} rows (duplicates or missing profiles)", inserted, len(rows))
+        return inserted
+
+    async def list_health_insights(self, user_supabase_id: str, limit: int, after: Optional[Cursor] = None, columns: Sequence[str] = INSIGHT_LIST_COLUMNS) -> List[Dict]:
+        """Newest-first page of insights, keyset-paginated on (created_at, id) and projected to `columns`."""
+        select = ",".join(dict.fromkeys([*columns, "id", "created_at"]))
+        params: Dict[str, Any] = {"select": select, "order": "created_at.desc,id.desc", "limit": limit}
+        if after is not None:
+            created_at, row_id = after
+            params["or"] = f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id}))'
+        user_id = self.identities.get(user_supabase_id)
+        if user_id is not None:
+            rows = await self._request("GET", "/health_insights", "list_health_insights", params={**params, "user_id": f"eq.{user_id}"})
+            # an empty later page is just the end of the list. An empty first page may mean the profile
+            # was recreated under a new id (writes drop the mapping on the FK 409, reads cannot tell),
+            # so drop the mapping and let the join below settle it.
+            if rows or after is not None:
+                return rows
+            self.identities.invalidate(user_supabase_id)
+        # resolve the profile server-side with an inner-join filter instead of a separate lookup
+        params["select"] = select + ",users_profiles!inner(id)"
+        params["users_profiles.supabase_id"] = f"eq.{user_supabase_id}"
+        rows = await self._request("GET", "/health_insights", "list_health_insights", params=params)
+        for row in rows:
+            profile = row.pop("users_profiles", None)
+            if profile:
+                self.identities.put(user_supabase_id, profile["id"])
+        return rows
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class InMemoryRepository:
+    """Dict-backed stand-in with the same behaviour, for tests, benchmarks and local runs without Supabase."""
+
+    def __init__(self):
+        self.profiles: Dict[str, Dict] = {}  # by supabase_id
+        self.insights: List[Dict] = []
+        self._last_ts = datetime.min.replace(tzinfo=timezone.utc)
+
+    def _now(self) -> str:
+        # strictly increasing so newest-first order is deterministic, like a DB sequence
+        self._last_ts = max(datetime.now(timezone.utc), self._last_ts + timedelta(microseconds=1))
+        return self._last_ts.isoformat()
+
+    async def upsert_user_profile(self, supabase_id: str, data: Dict) -> Dict:
+        now = datetime.now(timezone.utc).isoformat()
+        current = self.profiles.get(supabase_id) or {"id": str(uuid.uuid4()), "created_at": now}
+        current.update(data)
+        self.profiles[supabase_id] = current
+        return dict(current)
+
+    async def resolve_profile_id(self, supabase_id: str) -> Optional[str]:
+        profile = self.profiles.get(supabase_id)
+        return profile["id"] if profile else None
+
+    async def create_health_insight(self, user_supabase_id: str, payload: Dict) -> Dict:
+        profile = self.profiles.get(user_supabase_id)
+        if profile is None:
+            raise ValueError("User profile not found")
+        row = {"id": str(uuid.uuid4()), "user_id": profile["id"], "created_at": self._now(), **payload}
+        self.insights.append(row)
+        return dict(row)
+
+    async def bulk_create_health_insights(self, rows: List[Dict]) -> int:
+        existing = {r["id"] for r in self.insights}
+        inserted = 0
+        for row in rows:
+            profile = self.profiles.get(row["supabase_id"])
+            if profile is None or row["id"] in existing:
+                continue
+            fields = {k: v for k, v in row.items() if k != "supabase_id"}
+            self.insights.append({"user_id": profile["id"], **fields})
+            existing.add(row["id"])
+            inserted += 1
+        return inserted
+
+    async def list_health_insights(self, user_supabase_id: str, limit: int, after: Optional[Cursor] = None, columns: Sequence[str] = INSIGHT_LIST_COLUMNS) -> List[Dict]:
+        profile = self.profiles.get(user_supabase_id)
+        if profile is None:
+            return []
+        rows = [r for r in self.insights if r["user_id"] == profile["id"]]
+        rows.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+        if after is not None:
+            rows = [r for r in rows if (r["created_at"], r["id"]) < after]
+        keep = set(columns) | {"id", "created_at"}
+        return [{k: v for k, v in r.items() if k in keep} for r in rows[:limit]]
+
+    async def close(self) -> None:
+        pass
+
+
+_repository: Optional[Repository] = None
+
+
+def get_repository() -> Repository:
+    global _repository
+    if _repository is None:
+        if settings.DB_BACKEND == "memory":
+            _repository = InMemoryRepository()
+        elif settings.DB_BACKEND == "supabase":
+            _repository = PostgrestRepository(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+        else:
+            raise ValueError(f"Unknown DB_BACKEND: {settings.DB_BACKEND}")
+    return _repository
+
+
+async def close_repository() -> None:
+    global _repository
+    if _repository is not None:
+        await _repository.close()
+        _repository = None
@@ -0,0 +1,312 @@
+# py
+import asyncio
+import json
+import os
+import shutil
+import time
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple
+from loguru import logger
+from app.core.config import get_settings
+
+settings = get_settings()
+
+FlushFn = Callable[[List[Dict]], Awaitable[Any]]
+
+
+def is_transient(exc: Exception) -> bool:
+    """False for failures that retrying the same rows cannot fix: 4xx responses (except 408/429) and bad data."""
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500:
+        return status in (408, 429)
+    return not isinstance(exc, (ValueError, TypeError))
+
+
+class WriteBehindQueue:
+    """Buffers rows in memory and writes them in multi-row batches.
+
+    A batch is flushed once `max_batch` rows are pending or the oldest pending row has
+    waited `max_delay` seconds. At most `max_pending` rows are held: `submit` waits for
+    room when the buffer is full, so a slow database slows producers instead of
+    growing memory. Failed flushes keep their rows and retry with backoff.
+
+    A batch that fails permanently (`is_transient` says no, e.g. a 4xx from a bad row)
+    or `max_attempts` times in a row is split in half until the failing row is alone.
+    That row is then moved to `dead_letter_path` (or only logged) and counted in
+    `stats()["dropped"]`, so one poison row cannot block every later insert. A lone row
+    that keeps failing transiently (the database is down) is retried, never dropped.
+
+    With a `spool_path`, `submit` returns only once its row is appended to a local JSONL
+    file and fsynced. Concurrent submits share one write and fsync, and all file I/O
+    runs in a worker thread. Flushed rows are not rewritten: the byte offset of the
+    first unflushed row is checkpointed in `<spool_path>.offset`, and the file is
+    compacted once the queue drains or the flushed head outgrows both
+    `spool_compact_bytes` and the unflushed tail. The file is replayed from the
+    checkpoint on start. Replays can repeat rows that were already written, so
+    `flush_fn` must be idempotent on the row id.
+    """
+
+    def __init__(self, flush_fn: FlushFn, max_batch: int = 100, max_delay: float = 0.5, max_pending: int = 10000, spool_path: Optional[str] = None, spool_compact_bytes: int = 1 << 20, max_attempts: int = 5, dead_letter_path: Optional[str] = None, is_transient: Callable[[Exception], bool] = is_transient):
+        self.flush_fn = flush_fn
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path
+        self.is_transient = is_transient
+        self._batch_limit = max_batch  # shrinks while a failing batch is bisected
+        self._attempts = 0  # consecutive failures of the current head batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.spool_path = spool_path
+        self.spool_compact_bytes = spool_compact_bytes
+        self._rows: List[Dict] = []
+        self._sizes: List[int] = []  # spooled bytes of each pending row
+        self._first_at: Optional[float] = None
+        self._room = asyncio.Condition()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        # rows waiting for the next spool write: (row, encoded line, resolved once durable)
+        self._unspooled: List[Tuple[Dict, bytes, asyncio.Future]] = []
+        self._spool_lock = asyncio.Lock()
+        self._spool_file: Optional[BinaryIO] = None
+        self._spool_offset = 0  # bytes at the head of the spool that are already flushed
+        self._spool_size = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._rows), "flushed": self.flushed, "batches": self.batches, "failures": self.failures, "dropped": self.dropped}
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        if self.spool_path and self._spool_file is None:
+            replay = await asyncio.to_thread(self._open_spool)
+            if replay:
+                logger.info("Replaying {} spooled rows from {}", len(replay), self.spool_path)
+                # the spool holds every pending row, including any left in memory by an earlier close()
+                self._rows, self._sizes = [], []
+                self._accept([row for row, _ in replay], [size for _, size in replay])
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, row: Dict) -> None:
+        if self._task is None:
+            await self.start()
+        async with self._room:
+            await self._room.wait_for(lambda: len(self._rows) + len(self._unspooled) < self.max_pending)
+            if not self.spool_path:
+                self._accept([row], [0])
+                return
+            durable = asyncio.get_running_loop().create_future()
+            self._unspooled.append((row, (json.dumps(row, default=str) + "\n").encode(), durable))
+        # shielded: a caller that goes away must not strand rows queued behind it
+        await asyncio.shield(self._write_spool())
+        await durable
+
+    def _accept(self, rows: List[Dict], sizes: List[int]) -> None:
+        was_empty = not self._rows
+        self._rows.extend(rows)
+        self._sizes.extend(sizes)
+        if was_empty:
+            self._first_at = time.monotonic()
+        if was_empty or len(self._rows) >= self.max_batch:
+            self._wakeup.set()  # start the delay window, or flush a full batch now
+
+    async def _write_spool(self) -> None:
+        async with self._spool_lock:
+            if not self._unspooled:
+                return  # an earlier holder wrote these rows along with its own
+            pending, self._unspooled = self._unspooled, []
+            try:
+                await asyncio.to_thread(self._append_spool, b"".join(line for _, line, _ in pending))
+            except Exception as e:
+                for _, _, durable in pending:
+                    durable.set_exception(e)
+                return
+            self._accept([row for row, _, _ in pending], [len(line) for _, line, _ in pending])
+            for _, _, durable in pending:
+                durable.set_result(None)
+
+    async def _advance_spool(self, nbytes: int) -> None:
+        async with self._spool_lock:
+            self._spool_offset += nbytes
+            live = self._spool_size - self._spool_offset
+            if live == 0 or self._spool_offset >= max(self.spool_compact_bytes, live):
+                await asyncio.to_thread(self._compact_spool)
+            else:
+                await asyncio.to_thread(self._write_offset, self._spool_offset)
+
+    # blocking spool file I/O; only called through asyncio.to_thread, under _spool_lock
+
+    def _open_spool(self) -> List[Tuple[Dict, int]]:
+        try:
+            with open(self.spool_path + ".offset") as f:
+                offset = int(f.read() or 0)
+        except FileNotFoundError:
+            offset = 0
+        data = b""
+        if os.path.exists(self.spool_path):
+            with open(self.spool_path, "rb") as f:
+                data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            logger.warning("Dropping a torn last line ({} bytes) from {}", len(data) - end, self.spool_path)
+            with open(self.spool_path, "r+b") as f:
+                f.truncate(end)
+        self._spool_offset = min(offset, end)
+        self._spool_size = end
+        self._spool_file = open(self.spool_path, "ab")
+        return [(json.loads(line), len(line)) for line in data[self._spool_offset:end].splitlines(keepends=True)]
+
+    def _append_spool(self, data: bytes) -> None:
+        self._spool_file.write(data)
+        self._spool_file.flush()
+        os.fsync(self._spool_file.fileno())
+        self._spool_size += len(data)
+
+    def _write_offset(self, offset: int) -> None:
+        tmp = self.spool_path + ".offset.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.spool_path + ".offset")
+
+    def _compact_spool(self) -> None:
+        # reset the checkpoint first: a crash before the swap replays flushed rows again, never skips any
+        self._write_offset(0)
+        tmp = self.spool_path + ".tmp"
+        with open(self.spool_path, "rb") as src, open(tmp, "wb") as dst:
+            src.seek(self._spool_offset)
+            shutil.copyfileobj(src, dst)
+            dst.flush()
+            os.fsync(dst.fileno())
+        self._spool_file.close()
+        os.replace(tmp, self.spool_path)
+        self._spool_file = open(self.spool_path, "ab")
+        self._spool_size -= self._spool_offset
+        self._spool_offset = 0
+
+    def _append_dead_letter(self, row: Dict, error: str) -> None:
+        with open(self.dead_letter_path, "a") as f:
+            f.write(json.dumps({"row": row, "error": error}, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _remove_head(self, n: int) -> None:
+        del self._rows[:n]
+        nbytes = sum(self._sizes[:n])
+        del self._sizes[:n]
+        self._first_at = time.monotonic() if self._rows else None
+        if self.spool_path:
+            await self._advance_spool(nbytes)
+        async with self._room:
+            self._room.notify_all()
+
+    async def _flush_once(self) -> None:
+        batch = self._rows[:self._batch_limit]
+        await self.flush_fn(batch)
+        self._attempts = 0
+        self._batch_limit = min(self.max_batch, self._batch_limit * 2)
+        self.flushed += len(batch)
+        self.batches += 1
+        await self._remove_head(len(batch))
+
+    async def _isolate(self, exc: Exception) -> bool:
+        """Bisects a failing batch, or dead-letters a lone bad row. False if there is nothing left to split."""
+        size = min(self._batch_limit, len(self._rows))
+        if size > 1:
+            self._batch_limit = size // 2
+            self._attempts = 0
+            return True
+        if self.is_transient(exc):
+            return False
+        row = self._rows[0]
+        logger.error("Write-behind dropping row {} after a permanent failure: {!r}", row.get("id"), exc)
+        if self.dead_letter_path:
+            await asyncio.to_thread(self._append_dead_letter, row, repr(exc))
+        self.dropped += 1
+        self._attempts = 0
+        await self._remove_head(1)
+        return True
+
+    async def _run(self) -> None:
+        backoff = self.max_delay
+        while True:
+            if not self._rows:
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            waited = time.monotonic() - (self._first_at or time.monotonic())
+            if len(self._rows) < self.max_batch and waited < self.max_delay and not self._closing:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.max_delay - waited)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._flush_once()
+                backoff = self.max_delay
+            except Exception as e:
+                self.failures += 1
+                self._attempts += 1
+                if (not self.is_transient(e) or self._attempts >= self.max_attempts) and await self._isolate(e):
+                    continue  # retry a smaller batch at once
+                logger.exception("Write-behind flush failed; {} rows kept for retry", len(self._rows))
+                if self._closing:
+                    return
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    async def close(self) -> None:
+        """Flush what is pending and stop. Rows that still fail stay in the spool (if any)."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        if self._spool_file is not None:
+            async with self._spool_lock:
+                self._spool_file.close()
+                self._spool_file = None
+        if self._rows:
+            logger.error("Write-behind stopped with {} unflushed rows{}", len(self._rows), " (kept in spool)" if self.spool_path else "")
+
+
+_insight_writer: Optional[WriteBehindQueue] = None
+
+
+def get_insight_writer() -> WriteBehindQueue:
+    global _insight_writer
+    if _insight_writer is None:
+        from app.db.repository import get_repository
+
+        async def flush(rows: List[Dict]) -> None:
+            await get_repository().bulk_create_health_insights(rows)
+
+        _insight_writer = WriteBehindQueue(
+            flush,
+            max_batch=settings.INSIGHTS_WRITE_BATCH,
+            max_delay=settings.INSIGHTS_WRITE_DELAY_MS / 1000.0,
+            max_pending=settings.INSIGHTS_WRITE_MAX_PENDING,
+            spool_path=settings.INSIGHTS_WRITE_SPOOL or None,
+            max_attempts=settings.INSIGHTS_WRITE_MAX_ATTEMPTS,
+            dead_letter_path=settings.INSIGHTS_WRITE_DEAD_LETTER or None,
+        )
+    return _insight_writer
+
+
+async def close_insight_writer() -> None:
+    global _insight_writer
+    if _insight_writer is not None:
+        await _insight_writer.close()
+        _insight_writer = None
@@ -1,8 +1,11 @@
 # py
 from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from loguru import logger
 from starlette.middleware.base import BaseHTTPMiddleware
+from app.core.serialization import FastJSONResponse
 
 class LoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
@@ -26,3 +29,8 @@ def register_middleware(app: FastAPI):
     @app.exception_handler(ValueError)
     async def value_error_handler(request: Request, exc: ValueError):
         return JSONResponse(status_code=400, content={"error": "bad_request", "details": str(exc)})
+
+    @app.exception_handler(RequestValidationError)
+    async def validation_error_handler(request: Request, exc: RequestValidationError):
+        # FastAPI's default renders with stdlib json and raises when an echoed input is inf/nan
+        return FastJSONResponse(status_code=422, content={"detail": jsonable_encoder(exc.errors())})
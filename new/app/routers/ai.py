@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, Request
-from fastapi.responses import StreamingResponse
+from app.core.sse import EventSourceResponse
 from app.services.agents import AgentOrchestrator
 from app.core.security import get_current_user
 from pydantic import BaseModel
@@ -16,23 +16,8 @@ class StreamRequest(BaseModel):
 @router.post("/stream-agent-response")
 async def stream_agent_response(req: StreamRequest, user=Depends(get_current_user), request: Request = None):
     orchestrator = AgentOrchestrator(user.id)
-    async def event_generator():
-        try:
-            heartbeat = asyncio.create_task(send_heartbeat())
-            async for chunk in orchestrator.stream_orchestrator(req.prompt, req.stats, req.options):
-                yield chunk
-            heartbeat.cancel()
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            yield f"data: {{\"stage\": \"error\", \"error\": \"{str(e)}\"}}\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "Connection": "keep-alive"})
-
-async def send_heartbeat():
-    while True:
-        await asyncio.sleep(15)
-        yield "data: {\"type\": \"heartbeat\"}\n\n"
+    # EventSourceResponse handles frame coalescing, keep-alive comments and backpressure
+    return EventSourceResponse(orchestrator.stream_orchestrator(req.prompt, req.stats, req.options, request))
 
 @router.post("/generate-workout")
 async def generate_workout(body: Dict, user=Depends(get_current_user)):
@@ -1,5 +1,5 @@
 # py
-from pydantic import BaseModel, Field, EmailStr, validator
+from pydantic import BaseModel, Field, EmailStr, FiniteFloat, validator, model_validator
 from typing import Optional, Dict, Any, List
 from datetime import date, datetime
 
@@ -21,6 +21,16 @@ class HealthGenerateResponse(BaseModel):
     confidence: float = Field(..., ge=0.0, le=1.0)
     agents_output: Dict[str, Any]
 
+class InsightJobResponse(BaseModel):
+    id: str
+    status: str  # queued | running | succeeded | failed
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Optional[Dict[str, Any]] = None  # latest progress event
+    result: Optional[HealthGenerateResponse] = None
+    error: Optional[str] = None
+
 class StreamAgentRequest(BaseModel):
     supabase_id: str = Field(..., min_length=1)
     prompt: str = Field(..., min_length=1, max_length=2000)
@@ -31,3 +41,21 @@ class HealthInsightItem(BaseModel):
     aggregated_output: str
     confidence: float
     created_at: datetime
+
+class BatchMetricsRequest(BaseModel):
+    # columnar: row i of every list describes client i
+    # finite only: inf/nan would pass through numpy into the response, which JSON cannot carry
+    weight_kg: List[FiniteFloat] = Field(..., min_length=1, max_length=100_000)
+    height_cm: List[FiniteFloat]
+    age: List[FiniteFloat]
+    sex: List[str]
+    activity_level: Optional[List[str]] = None  # default sedentary
+    goal: Optional[List[str]] = None  # lose | maintain | gain, default maintain
+
+    @model_validator(mode="after")
+    def same_length(self):
+        n = len(self.weight_kg)
+        columns = [self.height_cm, self.age, self.sex, self.activity_level, self.goal]
+        if any(c is not None and len(c) != n for c in columns):
+            raise ValueError("All columns must have the same length")
+        return self
@@ -0,0 +1,139 @@
+# py
+"""Output models and the per-agent validator registry.
+
+Each structured agent maps to an OutputSpec holding a TypeAdapter that is compiled
+once at import, plus its JSON schema, which goes into the agent's system prompt.
+Shapes may be TypedDicts (used here) or BaseModels.
+Validation parses the raw completion once (`validate_json`), with no json.loads
+first. Agents without a spec return `{"text": ...}`. A spec registered with
+strict=False does the same when the model answered in prose instead of JSON.
+"""
+from typing import Any, Callable, Dict, List, Optional
+from typing_extensions import Annotated, NotRequired, TypedDict
+from pydantic import ConfigDict, Field, TypeAdapter, ValidationError
+from app.core import serialization
+
+# Output shapes are TypedDicts: the adapter validates straight into plain dicts, which
+# is what callers cache and serialize, so there is no model instance to dump afterwards.
+
+
+class Exercise(TypedDict):
+    # only the name is required; sets, reps, rest etc. pass through as given
+    __pydantic_config__ = ConfigDict(extra="allow")  # type: ignore[misc]
+    name: str
+
+
+class WorkoutPlan(TypedDict):
+    title: str
+    duration_minutes: int
+    difficulty: Annotated[str, Field(pattern="^(beginner|intermediate|advanced)$")]
+    exercises: Annotated[List[Exercise], Field(min_length=1)]
+    tips: NotRequired[List[str]]
+    progression: NotRequired[Dict[str, str]]
+
+
+class Meal(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="allow")  # type: ignore[misc]
+    name: str
+
+
+class NutritionPlan(TypedDict):
+    meals: List[Meal]
+    notes: NotRequired[Optional[str]]
+
+
+class RecoveryPlan(TypedDict):
+    summary: str
+    sleep_hours: NotRequired[Optional[float]]
+    rest_days_per_week: NotRequired[Optional[int]]
+    recommendations: NotRequired[List[str]]
+
+
+class Habit(TypedDict):
+    habit: str
+    cue: NotRequired[Optional[str]]
+    frequency: NotRequired[Optional[str]]
+
+
+class HabitPlan(TypedDict):
+    summary: str
+    habits: NotRequired[List[Habit]]
+
+
+def _strip_fences(content: str) -> str:
+    # models often wrap JSON in ```json fences; slice them off instead of re-parsing
+    text = content.strip()
+    if text.startswith("```"):
+        text = text[text.find("\n") + 1:]
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text
+
+
+class OutputSpec:
+    __slots__ = ("shape", "adapter", "schema", "instructions", "defaults", "strict", "items")
+
+    def __init__(self, shape: Any, defaults: Optional[Dict[str, Callable[[], Any]]] = None, strict: bool = True, items: Optional[Dict[str, Any]] = None):
+        self.shape = shape
+        self.adapter = TypeAdapter(shape)
+        # top-level array fields whose elements are validated and streamed one by one
+        self.items = {field: TypeAdapter(item) for field, item in (items or {}).items()}
+        self.schema = self.adapter.json_schema()
+        self.instructions = f"Reply with JSON only, matching this schema: {serialization.dumps_str(self.schema)}"
+        self.defaults = defaults or {}  # optional top-level keys filled in when the model leaves them out
+        self.strict = strict
+
+    def validate(self, content: Any) -> Dict:
+        try:
+            if isinstance(content, (str, bytes)):
+                value = self.adapter.validate_json(_strip_fences(content) if isinstance(content, str) else content)
+            else:
+                value = self.adapter.validate_python(content)
+        except ValidationError:
+            if self.strict or not isinstance(content, str):
+                raise
+            return {"text": content}
+        if not isinstance(value, dict):
+            return self.adapter.dump_python(value)  # BaseModel shapes
+        for key, make in self.defaults.items():
+            if key not in value:
+                value[key] = make()
+        return value
+
+    def validate_item(self, field: str, raw: str) -> Optional[Dict]:
+        """One streamed array element, or None if it does not validate (the final plan validation reports it)."""
+        try:
+            return self.items[field].validate_json(raw)
+        except ValidationError:
+            return None
+
+
+OUTPUT_SPECS: Dict[str, OutputSpec] = {}
+
+
+def register_output(agent_name: str, shape: Any, defaults: Optional[Dict[str, Callable[[], Any]]] = None, strict: bool = True, items: Optional[Dict[str, Any]] = None) -> OutputSpec:
+    spec = OUTPUT_SPECS[agent_name] = OutputSpec(shape, defaults, strict, items)
+    return spec
+
+
+def validate_output(agent_name: str, content: Any) -> Dict:
+    spec = OUTPUT_SPECS.get(agent_name)
+    if spec is None:
+        return {"text": content}
+    return spec.validate(content)
+
+
+def get_output_spec(agent_name: str) -> Optional[OutputSpec]:
+    return OUTPUT_SPECS.get(agent_name)
+
+
+def output_instructions(agent_name: str) -> str:
+    spec = OUTPUT_SPECS.get(agent_name)
+    return spec.instructions if spec is not None else ""
+
+
+register_output("workout_generator", WorkoutPlan, {"tips": list, "progression": dict}, items={"exercises": Exercise})
+register_output("nutrition_generator", NutritionPlan, {"notes": lambda: None}, items={"meals": Meal})
+# advice agents: structured when the model complies, plain text otherwise
+register_output("recovery_advisor", RecoveryPlan, {"recommendations": list}, strict=False)
+register_output("habit_coach", HabitPlan, {"habits": list}, strict=False)
@@ -1,146 +1,207 @@
 # app/services/agents.py
 import asyncio
-import hashlib
-import json
 import logging
-from typing import AsyncGenerator, Dict, Any, List
-from pydantic import BaseModel, Field
+from functools import lru_cache
+from typing import AsyncGenerator, Callable, Dict, Any, List, Optional
 from fastapi import Request, Depends
 
 
 # Use relative imports (works better for Pylance/module resolution in a package)
 from .openai_client import openai_client, TOOLS
-from .supabase_service import get_user_history, save_plan_to_db
+from . import health_engine, prompting
+from .agent_outputs import NutritionPlan, WorkoutPlan, get_output_spec, output_instructions, validate_output  # noqa: F401  (models re-exported)
+from .tools import ToolContext, executor as tool_executor
+from .partial_json import PartialJSONItems
+from .similarity_cache import get_similarity_cache
 from .subscription import get_subscription_tier, is_rate_limited  # implement these in app/services/subscription.py
+from app.core.cache import get_result_cache
+from app.core import serialization
+from app.core.sse import format_event
+from app.core.config import get_settings
+from app.core.metrics import current_agent
+from app.core.scheduler import current_tier
+from app.core.singleflight import SingleFlight
 # from app.core.security import get_current_user  # Module doesn't exist
 
 logger = logging.getLogger("app.services.agents")
+settings = get_settings()
 
+# identical in-flight agent runs (same cache key) share one LLM call across requests
+agent_inflight = SingleFlight()
 
-class WorkoutPlan(BaseModel):
-    title: str
-    duration_minutes: int
-    difficulty: str = Field(..., regex="^(beginner|intermediate|advanced)$")
-    exercises: List[Dict[str, Any]] = Field(..., min_items=1)
-    tips: List[str] = []
-    progression: Dict[str, str] = {}
 
+AGENT_SPECS: Dict[str, str] = {
+    "workout_generator": "You are workout_generator, a certified fitness coach. Reply with a workout plan. Use tools for accuracy.",
+    "nutrition_generator": "You are nutrition_generator, a nutrition expert. Reply with a meal plan. Use tools for accuracy.",
+    "recovery_advisor": "You are recovery_advisor. Give sleep, rest and recovery guidance. Use tools for accuracy.",
+    "habit_coach": "You are habit_coach. Suggest small, sustainable habit changes. Use tools for accuracy.",
+}
 
-class NutritionPlan(BaseModel):
-    meals: List[Dict[str, Any]]
-    notes: str | None = None
+DEFAULT_AGENTS = ["workout_generator", "nutrition_generator"]
+INSIGHT_AGENTS = ["recovery_advisor", "habit_coach"]
+
+# name reported for answers computed by app.services.health_engine instead of a model
+LOCAL_AGENT = "health_engine"
+
+# bounded so a slow SSE consumer pushes back on the agent streams instead of buffering
+STREAM_QUEUE_SIZE = 256
+_AGENT_FINISHED = object()
 
 
 class AgentOrchestrator:
     def __init__(self, user_id: str):
         self.user_id = user_id
-        self.cache: Dict[str, Any] = {}  # small in-memory cache; replace with Redis in prod
+        # process-wide, bounded result cache (memory or redis backend, see app.core.cache)
+        self.cache = get_result_cache()
+        # near-duplicate requests (rephrased prompt, slightly different stats); None when disabled
+        self.similar = get_similarity_cache()
+
+    def cache_key(self, agent_name: str, prompt: str, context_text: str) -> str:
+        # context_text is the assembled (compacted, canonical) context, so it is serialized only once
+        return f"{agent_name}:{serialization.digest(prompt, context_text, self.user_id)}"
+
+    def _assemble(self, agent_name: str, prompt: str, context: Dict) -> prompting.AssembledPrompt:
+        return prompting.assemble(agent_name, _system_spec(agent_name), prompt, context)
+
+    async def _cached(self, agent_name: str, cache_key: str, prompt: str, context: Dict) -> Optional[Dict]:
+        cached = await self.cache.get(agent_name, cache_key)
+        if cached is None and self.similar is not None:
+            cached = await self.similar.get(agent_name, self.user_id, prompt, context)
+        return cached
+
+    async def _store(self, agent_name: str, cache_key: str, prompt: str, context: Dict, result: Dict) -> None:
+        await self.cache.set(agent_name, cache_key, result)
+        if self.similar is not None:
+            self.similar.add(agent_name, self.user_id, prompt, context, cache_key)
 
     async def run_agent(self, agent_name: str, prompt: str, context: Dict) -> Dict:
         """
         Run a single agent synchronously (non-streaming). Returns validated model dict.
         """
-        cache_key = hashlib.md5((prompt + json.dumps(context, sort_keys=True) + self.user_id).encode()).hexdigest()
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        assembled = self._assemble(agent_name, prompt, context)
+        cache_key = self.cache_key(agent_name, prompt, assembled.context_text)
+        cached = await self._cached(agent_name, cache_key, prompt, context)
+        if cached is not None:
+            return cached
 
         # Gate subscription / quota check
         tier = await get_subscription_tier(self.user_id)
         if tier == "free" and await is_rate_limited(self.user_id):
             raise ValueError("Quota exceeded")
+        current_tier.set(tier)  # LLM calls from here are queued with this tier's weight
+        current_agent.set(agent_name)  # and labelled with this agent in the LLM metrics
+
+        return await agent_inflight.do(cache_key, lambda: self._run_uncached(agent_name, assembled.messages, context, cache_key, prompt))
+
+    async def _run_uncached(self, agent_name: str, messages: List[Dict], context: Dict, cache_key: str, prompt: str) -> Dict:
+        messages = list(messages)
+        ctx = ToolContext(self.user_id, context)
+
+        # each turn's tool calls run concurrently and their results go back to the model;
+        # after TOOL_MAX_ROUNDS turns of tool use the model must answer
+        for round_no in range(settings.TOOL_MAX_ROUNDS + 1):
+            tool_choice = "auto" if round_no < settings.TOOL_MAX_ROUNDS else "none"
+            response = await openai_client.call_with_tools(messages, TOOLS, stream=False, tool_choice=tool_choice)
+            message = _first_message(response)
+            tool_calls = message.get("tool_calls") or []
+            if not tool_calls or tool_choice == "none":
+                break
+            messages.append({"role": "assistant", "content": message.get("content"), "tool_calls": tool_calls})
+            messages.extend(await tool_executor.run(tool_calls, ctx))
 
-        messages = [
-            {"role": "system", "content": f"You are {agent_name}. Use tools for accuracy."},
-            {"role": "user", "content": prompt + f"\nContext: {json.dumps(context)}"},
-        ]
+        content = message.get("content")
+        if content is None:
+            raise RuntimeError("No content returned by LLM")
 
-        # call the OpenAI wrapper (non-streaming)
-        response = await openai_client.call_with_tools(messages, TOOLS, stream=False)
+        result = self._validate_output(agent_name, content)
 
-        # defensive extraction of content/tool_calls depending on returned shape
-        # response could be dict-like from model_dump()
-        choice = None
-        try:
-            choice = response["choices"][0]
-        except Exception:
-            # fallback: if the wrapper returns the object directly
-            try:
-                choice = response.choices[0]
-            except Exception:
-                logger.error("Unexpected response shape from openai_client.call_with_tools", extra={"response": str(response)})
-                raise RuntimeError("Unexpected LLM response shape")
-
-        # process tool calls (if any)
-        tool_calls = []
-        try:
-            # many SDKs put tool calls under message.tool_calls or in `choice["message"]["tool_calls"]`
-            tool_calls = choice.get("message", {}).get("tool_calls", []) or getattr(choice, "message", {}).get("tool_calls", []) or []
-        except Exception:
-            tool_calls = []
-
-        if tool_calls:
-            for tool_call in tool_calls:
-                # support both dict-like and object-like shapes
-                func_name = tool_call.get("function", {}).get("name") if isinstance(tool_call, dict) else getattr(tool_call.function, "name", None)
-                args_raw = tool_call.get("function", {}).get("arguments") if isinstance(tool_call, dict) else getattr(tool_call.function, "arguments", "{}")
-                try:
-                    args = json.loads(args_raw) if isinstance(args_raw, str) else args_raw
-                except Exception:
-                    args = {}
-
-                if func_name == "fetch_user_history":
-                    args["result"] = await get_user_history(self.user_id)
-                elif func_name == "save_plan":
-                    args["result"] = await save_plan_to_db(self.user_id, args.get("plan"))
-                # Add other deterministic handlers here
-                # optionally log the executed/tool result
-
-        # Validate LLM output with Pydantic models
-        content = None
-        try:
-            content = choice.get("message", {}).get("content") or (getattr(choice, "message", {}).get("content") if hasattr(choice, "message") else None)
-        except Exception:
-            content = None
+        # cache and return
+        await self._store(agent_name, cache_key, prompt, context, result)
+        return result
 
-        if content is None:
-            # try other paths
-            content = choice.get("text") if isinstance(choice, dict) else getattr(choice, "text", None)
+    def _validate_output(self, agent_name: str, content: Any) -> Dict:
+        return validate_output(agent_name, content)
 
-        if content is None:
-            raise RuntimeError("No content returned by LLM")
+    async def stream_agent(self, agent_name: str, prompt: str, context: Dict) -> AsyncGenerator[Dict, None]:
+        """
+        Stream one agent: yields a `delta` event per content token chunk as it arrives,
+        an `item` event as each exercise/meal of a structured plan closes, then a `done`
+        event carrying the fully validated result.
+        """
+        assembled = self._assemble(agent_name, prompt, context)
+        cache_key = self.cache_key(agent_name, prompt, assembled.context_text)
+        cached = await self._cached(agent_name, cache_key, prompt, context)
+        if cached is not None:
+            yield {"stage": "done", "agent": agent_name, "result": cached, "cached": True}
+            return
 
-        # Expect LLM to return JSON for structured plans; try to parse/validate
-        if agent_name == "workout_generator":
-            # if the model returned a JSON string
-            if isinstance(content, str):
-                try:
-                    # Accept either JSON string (model_validate_json) or python dict
-                    validated = WorkoutPlan.model_validate_json(content)
-                except Exception:
-                    # If it's not JSON, try to parse as dict (i.e., model returned python-like repr)
-                    try:
-                        parsed = json.loads(content)
-                        validated = WorkoutPlan.model_validate(parsed)
-                    except Exception as e:
-                        logger.exception("Failed to validate workout plan", exc_info=e)
-                        raise
-            else:
-                validated = WorkoutPlan.model_validate(content)
-
-            result = validated.model_dump()
-        elif agent_name == "nutrition_generator":
-            # similar pattern — validate with NutritionPlan
-            if isinstance(content, str):
-                result = NutritionPlan.model_validate_json(content).model_dump()
-            else:
-                result = NutritionPlan.model_validate(content).model_dump()
+        tier = await get_subscription_tier(self.user_id)
+        if tier == "free" and await is_rate_limited(self.user_id):
+            raise ValueError("Quota exceeded")
+        current_tier.set(tier)  # LLM calls from here are queued with this tier's weight
+        current_agent.set(agent_name)  # and labelled with this agent in the LLM metrics
+
+        parts: List[str] = []
+        wants_tools = False
+        spec = get_output_spec(agent_name)
+        items = PartialJSONItems(spec.items) if spec is not None and spec.items else None
+        stream = await openai_client.call_with_tools(assembled.messages, TOOLS, stream=True)
+        async for delta in stream:
+            if delta["type"] == "content":
+                parts.append(delta["data"])
+                yield {"stage": "delta", "agent": agent_name, "content": delta["data"]}
+                if items is not None:
+                    for field, index, raw in items.feed(delta["data"]):
+                        item = spec.validate_item(field, raw)
+                        if item is not None:
+                            yield {"stage": "item", "agent": agent_name, "field": field, "index": index, "item": item}
+            elif delta["type"] == "tool_call":
+                wants_tools = True
+
+        if wants_tools and not parts:
+            # the model asked for tools instead of answering; the non-streaming path runs them
+            result = await self.run_agent(agent_name, prompt, context)
         else:
-            # Generic fallback
-            result = {"text": content}
+            result = self._validate_output(agent_name, "".join(parts))
+            await self._store(agent_name, cache_key, prompt, context, result)
+        yield {"stage": "done", "agent": agent_name, "result": result}
 
-        # cache and return
-        self.cache[cache_key] = result
-        return result
+    async def stream_concurrently(self, agents: List[str], prompt: str, context: Dict) -> AsyncGenerator[Dict, None]:
+        """
+        Stream all agents at once, multiplexing their events in arrival order.
+        Each agent ends with its own `done`/`error` event; a final `complete` event carries the aggregate.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        async def _pump(agent):
+            try:
+                async for event in self.stream_agent(agent, prompt, context):
+                    await queue.put(event)
+            except Exception as e:
+                logger.warning("Agent stream failed", extra={"agent": agent, "error": str(e)})
+                await queue.put({"stage": "error", "agent": agent, "error": str(e)})
+            # not in a finally: once cancelled the consumer is gone, and a put on a full queue would never return
+            await queue.put(_AGENT_FINISHED)
+
+        tasks = [asyncio.create_task(_pump(agent)) for agent in agents]
+        finals: Dict[str, Dict] = {}
+        remaining = len(tasks)
+        try:
+            while remaining:
+                event = await queue.get()
+                if event is _AGENT_FINISHED:
+                    remaining -= 1
+                    continue
+                if event["stage"] in ("done", "error"):
+                    finals[event["agent"]] = event
+                yield event
+        finally:
+            # consumer went away early (client disconnect): stop the remaining agents
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        yield {"stage": "complete", "aggregated": _aggregate(agents, finals)}
 
     async def run_concurrently(self, agents: List[str], prompt: str, context: Dict) -> AsyncGenerator[Dict, None]:
         """
@@ -154,18 +215,23 @@ class AgentOrchestrator:
                 return {"agent": agent, "error": str(e)}
 
         tasks = [asyncio.create_task(_run(agent)) for agent in agents]
-        done, _pending = await asyncio.wait(tasks, return_when=asyncio.ALL_COMPLETED)
-        for t in done:
-            yield t.result()
-
-        # aggregate them (simple example)
-        aggregated = {"action_plan": [f"From {r['agent']}: {r.get('result') or r.get('error')}" for r in (task.result() for task in done)]}
-        yield {"stage": "complete", "aggregated": aggregated}
-
-    async def stream_orchestrator(self, prompt: str, stats: Dict, options: Dict, request: Request) -> AsyncGenerator[str, None]:
+        finals: Dict[str, Dict] = {}
+        try:
+            # yield each agent as soon as it finishes instead of waiting for the slowest
+            for next_done in asyncio.as_completed(tasks):
+                r = await next_done
+                finals[r["agent"]] = r
+                yield r
+        finally:
+            for t in tasks:
+                t.cancel()
+
+        yield {"stage": "complete", "aggregated": _aggregate(agents, finals)}
+
+    async def stream_orchestrator(self, prompt: str, stats: Dict, options: Dict, request: Optional[Request] = None) -> AsyncGenerator[str, None]:
         """
         SSE streamer: yields SSE-formatted strings (i.e., 'data: ...\n\n').
-        `request` is required so we can check request.is_disconnected()
+        Token deltas from all agents are interleaved as they arrive; pass `request` to stop on client disconnect.
         """
         context = {"stats": stats}
         agents = options.get("agents", ["workout_generator"])
@@ -173,23 +239,89 @@ class AgentOrchestrator:
         # Subscription check here (avoid slowapi decorator complexity in the orchestrator)
         tier = await get_subscription_tier(self.user_id)
         if tier == "free" and await is_rate_limited(self.user_id):
-            yield f"data: {json.dumps({'stage': 'error', 'error': 'quota_exceeded'})}\n\n"
+            yield format_event({"stage": "error", "error": "quota_exceeded"})
             return
 
         # notify start
-        yield f"data: {json.dumps({'stage': 'starting', 'agents': agents})}\n\n"
+        yield format_event({"stage": "starting", "agents": agents})
 
-        async for chunk in self.run_concurrently(agents, prompt, context):
-            if request.is_disconnected():
+        async for chunk in self.stream_concurrently(agents, prompt, context):
+            if request is not None and await request.is_disconnected():
                 logger.info("Client disconnected, aborting stream", extra={"user_id": self.user_id})
-                break
-            yield f"data: {json.dumps(chunk)}\n\n"
-            # small throttle
-            await asyncio.sleep(0.05)
-
-        # final complete message is emitted by run_concurrently, but ensure finalization
-        if not request.is_disconnected():
-            yield f"data: {json.dumps({'stage': 'finished'})}\n\n"
+                return
+            yield format_event(chunk)
+
+        yield format_event({"stage": "finished"})
+
+
+@lru_cache(maxsize=None)
+def _system_spec(agent_name: str) -> str:
+    # role text plus the output schema; fixed per agent so it stays in the cacheable prefix
+    spec = AGENT_SPECS.get(agent_name) or f"You are {agent_name}. Use tools for accuracy."
+    instructions = output_instructions(agent_name)
+    return f"{spec}\n{instructions}" if instructions else spec
+
+
+def _first_message(response: Any) -> Dict:
+    """The first choice's message as a plain dict, from a model_dump() dict or an SDK object."""
+    try:
+        choice = response["choices"][0] if isinstance(response, dict) else response.choices[0]
+    except Exception:
+        logger.error("Unexpected response shape from openai_client.call_with_tools", extra={"response": str(response)})
+        raise RuntimeError("Unexpected LLM response shape")
+    if not isinstance(choice, dict):
+        choice = choice.model_dump()
+    message = dict(choice.get("message") or {})
+    if message.get("content") is None and choice.get("text") is not None:
+        message["content"] = choice["text"]
+    return message
+
+
+def _aggregate(agents: List[str], finals: Dict[str, Dict]) -> Dict:
+    return {"action_plan": [f"From {a}: {finals[a].get('result') or finals[a].get('error')}" for a in agents if a in finals]}
+
+
+async def stream_orchestrator(user_context: Dict, prompt: str, agents: Optional[List[str]] = None) -> AsyncGenerator[Dict, None]:
+    """Event stream for the SSE route: multiplexed per-agent deltas, per-agent completion, then the aggregate."""
+    # no local fast path here: the stream route has no stats to compute from
+    context = {k: v for k, v in user_context.items() if k != "supabase_id"}
+    orchestrator = AgentOrchestrator(user_context["supabase_id"])
+    async for event in orchestrator.stream_concurrently(agents or DEFAULT_AGENTS, prompt, context):
+        yield event
+
+
+async def run_agents_concurrently(user_context: Dict, prompt: str, agents: Optional[List[str]] = None, progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Non-streaming insights run: every agent's output plus an aggregated text and mean confidence.
+
+    `progress`, if given, is called with an `agent_done`/`agent_error` event as each agent finishes.
+    """
+    context = {k: v for k, v in user_context.items() if k != "supabase_id"}
+    local = health_engine.answer_locally(prompt, context) if agents is None else None
+    if local is not None:
+        # computable from the stats: exact answer, no model call
+        return {"agents": [{"name": LOCAL_AGENT, "output": local["text"], "data": local["data"], "confidence": 1.0}], "aggregated_output": local["text"], "confidence": 1.0}
+    orchestrator = AgentOrchestrator(user_context.get("supabase_id", "anonymous"))
+    agents = agents or INSIGHT_AGENTS
+    finals: Dict[str, Dict] = {}
+    async for event in orchestrator.run_concurrently(agents, prompt, context):
+        if "agent" in event:
+            finals[event["agent"]] = event
+            if progress is not None:
+                progress({"stage": "agent_error" if "error" in event else "agent_done", "agent": event["agent"], "completed": len(finals), "total": len(agents)})
+    results = []
+    for name in agents:
+        event = finals[name]
+        if "error" in event:
+            results.append({"name": name, "output": "", "error": event["error"], "confidence": 0.0})
+            continue
+        result = event["result"]
+        output = result.get("text") or result.get("summary") or serialization.dumps_str(result)
+        # simple deterministic heuristic: assertive recommendations score higher
+        confidence = 0.9 if "should" in output or "recommend" in output else 0.7
+        results.append({"name": name, "output": output, "confidence": confidence, **({} if "text" in result else {"data": result})})
+    aggregated_text = "\n\n".join(f"{r['name'].upper()}:\n{r['output']}" for r in results if r["output"])
+    avg_conf = sum(r["confidence"] for r in results) / len(results)
+    return {"agents": results, "aggregated_output": aggregated_text, "confidence": float(avg_conf)}
 
 
 
@@ -285,7 +417,7 @@ class AgentOrchestrator:
 # class WorkoutPlan(BaseModel):
 #     title: str
 #     duration_minutes: int
-#     difficulty: str = Field(..., regex="^(beginner|intermediate|advanced)$")
+#     difficulty: str = Field(..., pattern="^(beginner|intermediate|advanced)$")
 #     exercises: List[Dict[str, Any]] = Field(..., min_items=1)  # e.g., {"name": str, "sets": int, "reps": str}
 #     tips: List[str] = []
 #     progression: Dict[str, str] = {}
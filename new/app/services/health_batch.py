@@ -0,0 +1,75 @@
+# py
+"""Columnar, NumPy-backed version of the health_engine math for many people at once.
+
+Same formulas and constants as health_engine (BMI, Mifflin-St Jeor BMR, TDEE, goal
+target), computed in one vectorized pass over equal-length columns.
+"""
+from typing import Dict, Optional, Sequence
+import numpy as np
+from app.services.health_engine import ACTIVITY_ALIASES, ACTIVITY_FACTORS, GOAL_ADJUSTMENT
+
+CATEGORY_LABELS = ("Underweight", "Normal weight", "Overweight", "Obesity")  # index = category code
+_CATEGORY_EDGES = np.array([18.5, 25.0, 30.0])
+_SEX_OFFSET = {"male": 5.0, "m": 5.0, "man": 5.0, "female": -161.0, "f": -161.0, "woman": -161.0}  # Mifflin-St Jeor constant
+
+
+class _LabelTable(dict):
+    """label -> number, resolving (and validating) each distinct label once."""
+
+    def __init__(self, table: Dict[str, float], what: str, aliases: Optional[Dict[str, str]] = None):
+        super().__init__()
+        self.table = table
+        self.what = what
+        self.aliases = aliases or {}
+
+    def __missing__(self, label: str) -> float:
+        key = str(label).lower().replace(" ", "_")
+        key = self.aliases.get(key, key)
+        if key not in self.table:
+            raise ValueError(f"Unknown {self.what}: {label!r}")
+        value = self[label] = self.table[key]
+        return value
+
+
+def _lookup(values: Optional[Sequence[str]], table: _LabelTable, n: int, default: str) -> np.ndarray:
+    if values is None:
+        return np.full(n, table[default], dtype=np.float64)
+    # a dict hit per row is far cheaper than np.unique/np.char on string arrays
+    return np.fromiter(map(table.__getitem__, values), dtype=np.float64, count=n)
+
+
+def bmi_category_codes(bmi: np.ndarray) -> np.ndarray:
+    return np.searchsorted(_CATEGORY_EDGES, bmi, side="right").astype(np.int8)
+
+
+def batch_metrics(
+    weight_kg: Sequence[float],
+    height_cm: Sequence[float],
+    age: Sequence[float],
+    sex: Sequence[str],
+    activity_level: Optional[Sequence[str]] = None,
+    goal: Optional[Sequence[str]] = None,
+) -> Dict[str, np.ndarray]:
+    """BMI, category code, BMR, TDEE and calorie target per row. Raises ValueError on bad rows."""
+    w = np.asarray(weight_kg, dtype=np.float64)
+    h = np.asarray(height_cm, dtype=np.float64)
+    a = np.asarray(age, dtype=np.float64)
+    n = len(w)
+    if not (len(h) == len(a) == len(sex) == n) or (activity_level is not None and len(activity_level) != n) or (goal is not None and len(goal) != n):
+        raise ValueError("All columns must have the same length")
+    bad = np.flatnonzero(~((w > 0) & (h > 0) & (a > 0)))
+    if bad.size:
+        raise ValueError(f"Weight, height and age must be positive (rows {bad[:10].tolist()})")
+
+    height_m = h / 100.0
+    bmi = np.round(w / (height_m * height_m), 2)
+    bmr = 10.0 * w + 6.25 * h - 5.0 * a + _lookup(sex, _LabelTable(_SEX_OFFSET, "sex"), n, "female")
+    tdee = bmr * _lookup(activity_level, _LabelTable(ACTIVITY_FACTORS, "activity_level", ACTIVITY_ALIASES), n, "sedentary")
+    target = tdee + _lookup(goal, _LabelTable(GOAL_ADJUSTMENT, "goal"), n, "maintain")
+    return {
+        "bmi": bmi,
+        "category": bmi_category_codes(bmi),
+        "bmr": np.round(bmr),
+        "tdee": np.round(tdee),
+        "target_kcal": np.round(target),
+    }
@@ -0,0 +1,170 @@
+# py
+"""Deterministic health numbers: BMI, BMR/TDEE calorie targets and macro splits.
+
+Used as tool handlers for the agents and as a fast path that answers computable
+questions from the request's stats without calling the model at all.
+"""
+import re
+from typing import Dict, List, Optional
+from app.utils.bmi import calculate_bmi, bmi_category
+
+ACTIVITY_FACTORS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very_active": 1.9,
+}
+# the estimate_calories tool schema uses low/medium/high
+ACTIVITY_ALIASES = {"low": "sedentary", "medium": "moderate", "high": "active"}
+GOAL_ADJUSTMENT = {"lose": -500, "maintain": 0, "gain": 300}  # kcal/day
+PROTEIN_G_PER_KG = {"lose": 2.0, "maintain": 1.6, "gain": 1.8}
+FAT_SHARE = 0.25  # of calories; carbs take the rest
+
+
+def activity_factor(level: Optional[str]) -> float:
+    level = (level or "sedentary").lower().replace(" ", "_")
+    level = ACTIVITY_ALIASES.get(level, level)
+    if level not in ACTIVITY_FACTORS:
+        raise ValueError(f"activity_level must be one of {sorted(ACTIVITY_FACTORS) + sorted(ACTIVITY_ALIASES)}")
+    return ACTIVITY_FACTORS[level]
+
+
+def bmr_mifflin(weight_kg: float, height_cm: float, age: float, sex: str) -> float:
+    """Mifflin-St Jeor resting energy expenditure, kcal/day."""
+    if weight_kg <= 0 or height_cm <= 0 or age <= 0:
+        raise ValueError("Weight, height and age must be positive")
+    base = 10 * weight_kg + 6.25 * height_cm - 5 * age
+    return base + 5 if sex == "male" else base - 161
+
+
+def calorie_target(bmr: float, activity_level: Optional[str] = None, goal: str = "maintain") -> Dict[str, int]:
+    tdee = bmr * activity_factor(activity_level)
+    return {"bmr": round(bmr), "tdee": round(tdee), "target": round(tdee + GOAL_ADJUSTMENT.get(goal, 0))}
+
+
+def macro_split(calories: float, weight_kg: float, goal: str = "maintain") -> Dict[str, int]:
+    """Grams per day: protein by body weight, fat as a share of calories, carbs for the remainder."""
+    protein = PROTEIN_G_PER_KG.get(goal, 1.6) * weight_kg
+    fat = calories * FAT_SHARE / 9
+    carbs = max(calories - protein * 4 - fat * 9, 0) / 4
+    return {"calories": round(calories), "protein_g": round(protein), "fat_g": round(fat), "carbs_g": round(carbs)}
+
+
+def normalize_stats(stats: Dict) -> Dict:
+    """Metric stats from the loosely shaped request context; missing or unusable fields are left out."""
+    out: Dict = {}
+
+    def number(*keys: str) -> Optional[float]:
+        for key in keys:
+            try:
+                value = float(stats[key])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if value > 0:
+                return value
+        return None
+
+    weight = number("weight_kg", "weight")
+    if weight:
+        out["weight_kg"] = weight
+    height_cm = number("height_cm")
+    if height_cm is None:
+        height = number("height", "height_m")
+        if height is not None:
+            height_cm = height * 100 if height < 3 else height  # metres or centimetres
+    if height_cm:
+        out["height_cm"] = height_cm
+    age = number("age")
+    if age:
+        out["age"] = age
+    sex = str(stats.get("sex") or stats.get("gender") or "").lower()
+    if sex in ("male", "m", "man"):
+        out["sex"] = "male"
+    elif sex in ("female", "f", "woman"):
+        out["sex"] = "female"
+    if stats.get("activity_level"):
+        out["activity_level"] = str(stats["activity_level"])
+    goal = str(stats.get("goal") or "").lower()
+    if goal in GOAL_ADJUSTMENT:
+        out["goal"] = goal
+    return out
+
+
+def compute(stats: Dict, wanted: List[str]) -> Optional[Dict]:
+    """The requested metrics ("bmi", "calories", "macros"), or None if the stats are not enough for all of them."""
+    s = normalize_stats(stats)
+    result: Dict = {}
+    if "bmi" in wanted:
+        if "weight_kg" not in s or "height_cm" not in s:
+            return None
+        value = calculate_bmi(s["weight_kg"], s["height_cm"] / 100)
+        result["bmi"] = {"bmi": value, "category": bmi_category(value)}
+    if "calories" in wanted or "macros" in wanted:
+        if not {"weight_kg", "height_cm", "age", "sex"} <= s.keys():
+            return None
+        goal = s.get("goal", "maintain")
+        try:
+            calories = calorie_target(bmr_mifflin(s["weight_kg"], s["height_cm"], s["age"], s["sex"]), s.get("activity_level"), goal)
+        except ValueError:
+            return None
+        calories["activity_level"] = s.get("activity_level", "sedentary")
+        calories["goal"] = goal
+        if "calories" in wanted:
+            result["calories"] = calories
+        if "macros" in wanted:
+            result["macros"] = macro_split(calories["target"], s["weight_kg"], goal)
+    return result
+
+
+# only questions about the user's own numbers; "calories in a banana" or "a healthy BMI
+# for a child" are not answerable from the user's stats
+_INTENTS = {
+    "bmi": re.compile(r"\bmy (current )?(bmi|body mass index)\b|\b(bmi|body mass index) (for|of) me\b", re.I),
+    "calories": re.compile(
+        r"\bhow many (calories|kcal) (should|do|must) i (eat|need|have|consume|get)\b"
+        r"|\bmy (daily )?(calorie (target|needs?|intake|goal|budget)|calories|kcal|tdee|bmr|maintenance( calories)?|metabolic rate)\b",
+        re.I,
+    ),
+    "macros": re.compile(r"\bmy (daily )?macros?\b|\bmacros? for me\b", re.I),
+}
+# anything that asks for a plan or advice still needs the model
+_NEEDS_MODEL = re.compile(r"\b(plan|workout|routine|program|exercises?|recipes?|meals?|schedule|diet|advice|why)\b", re.I)
+# foods, activities, other people, general ranges and causes: not a lookup of the user's numbers
+_NOT_ABOUT_ME = re.compile(
+    r"\b(in|of) (a|an|one|this|that|the|these|those)\b|\bburn\w*|\bdid i\b|\b\d+ ?k\b|\b(run|ran|walk|swim|ride|hike)\w*"
+    r"|\b(child|children|kids?|teens?|teenagers?|son|daughter|wife|husband|partner|friend|mom|dad|someone|people|person|women|men|adults?)\b"
+    r"|\b(healthy|normal|range|average|ideal|typical)\b|\b(lowers?|raises?|increases?|reduces?|boosts?|affects?|changes?)\b",
+    re.I,
+)
+
+
+def detect_intents(prompt: str) -> List[str]:
+    if len(prompt) > 300 or _NEEDS_MODEL.search(prompt) or _NOT_ABOUT_ME.search(prompt):
+        return []
+    return [name for name, pattern in _INTENTS.items() if pattern.search(prompt)]
+
+
+def render(result: Dict) -> str:
+    lines = []
+    if "bmi" in result:
+        lines.append(f"BMI: {result['bmi']['bmi']} ({result['bmi']['category']})")
+    if "calories" in result:
+        c = result["calories"]
+        lines.append(f"BMR: {c['bmr']} kcal/day; TDEE ({c['activity_level']}): {c['tdee']} kcal/day; target to {c['goal']}: {c['target']} kcal/day")
+    if "macros" in result:
+        m = result["macros"]
+        lines.append(f"Macros for {m['calories']} kcal: protein {m['protein_g']} g, fat {m['fat_g']} g, carbs {m['carbs_g']} g")
+    return "\n".join(lines)
+
+
+def answer_locally(prompt: str, context: Dict) -> Optional[Dict]:
+    """Answer a purely computational prompt from the context's stats; None means ask the model."""
+    wanted = detect_intents(prompt)
+    if not wanted:
+        return None
+    stats = context.get("stats") if isinstance(context.get("stats"), dict) else context
+    result = compute(stats, wanted)
+    if not result:
+        return None
+    return {"text": render(result), "data": result}
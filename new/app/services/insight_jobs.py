@@ -0,0 +1,42 @@
+# py
+"""generate-insights as one unit of work, run inline by the sync route or as a background job."""
+from typing import Dict, Optional
+from app.core import serialization
+from app.core.jobs import Job, ProgressFn, get_job_queue, register_job
+from app.services import agents as agent_svc
+from app.services.supabase_service import create_health_insight
+
+JOB_KIND = "generate_insights"
+
+
+async def generate_and_save(supabase_id: str, request_payload: Dict, progress: Optional[ProgressFn] = None) -> Dict:
+    """Runs the insight agents and stores the result; returns the HealthGenerateResponse fields."""
+    user_context = {**request_payload.get("context", {}), "supabase_id": supabase_id}
+    if progress is None:
+        result = await agent_svc.run_agents_concurrently(user_context, request_payload["prompt"])
+    else:
+        result = await agent_svc.run_agents_concurrently(user_context, request_payload["prompt"], progress=progress)
+    agents_output = {r["name"]: r for r in result["agents"]}
+    saved = await create_health_insight(supabase_id, request_payload, agents_output, result["aggregated_output"], result["confidence"])
+    if progress is not None:
+        progress({"stage": "saved", "id": saved["id"]})
+    return {"id": saved["id"], "aggregated_output": result["aggregated_output"], "confidence": result["confidence"], "agents_output": agents_output}
+
+
+@register_job(JOB_KIND)
+async def _run(payload: Dict, progress: ProgressFn) -> Dict:
+    return await generate_and_save(payload["supabase_id"], payload["request"], progress)
+
+
+def dedup_key(supabase_id: str, request_payload: Dict) -> str:
+    # the same user asking the same thing with the same context gets the same job
+    return f"{JOB_KIND}:{serialization.digest(supabase_id, request_payload['prompt'], serialization.canonical(request_payload.get('context', {})))}"
+
+
+async def submit(supabase_id: str, request_payload: Dict) -> Job:
+    return await get_job_queue().submit(
+        JOB_KIND,
+        {"supabase_id": supabase_id, "request": request_payload},
+        owner=supabase_id,
+        dedup_key=dedup_key(supabase_id, request_payload),
+    )
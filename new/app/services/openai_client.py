@@ -38,12 +38,18 @@
 
 import asyncio
 import logging
-from typing import AsyncGenerator, Dict, Any, List
-from openai import AsyncOpenAI
-from tenacity import retry, stop_after_attempt, wait_exponential
+from typing import AsyncGenerator, AsyncIterator, Dict, Any, List, Optional, Tuple
+import httpx
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, RateLimitError
 from pydantic import BaseModel
-import os
 from loguru import logger
+from app.core.config import get_settings
+from app.core.http_pool import PooledTransport, pooled_client, warm_up
+from app.core.metrics import LLM_LATENCY, LLM_REQUESTS, LLM_TOKENS, LLM_TTFT, current_agent
+from app.core.resilience import FAILURE, FATAL, THROTTLED, CircuitBreaker, Resilience, RetryBudget, parse_retry_after
+from app.core.scheduler import current_tier, get_llm_scheduler
+
+settings = get_settings()
 
 class Tool(BaseModel):
     type: str = "function"
@@ -53,49 +59,191 @@ class AgentResponse(BaseModel):
     content: str
     tool_calls: List[Dict] = []
 
+def classify_error(exc: BaseException) -> Tuple[str, Optional[float]]:
+    if isinstance(exc, APIStatusError):
+        retry_after = parse_retry_after(exc.response.headers)
+        if exc.status_code == 429:
+            return THROTTLED, retry_after
+        if exc.status_code in (408, 409) or exc.status_code >= 500:
+            return FAILURE, retry_after
+        return FATAL, None
+    if isinstance(exc, (APIConnectionError, httpx.TransportError)):  # includes timeouts
+        return FAILURE, None
+    return FATAL, None
+
+
 class OpenAIClient:
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = "gpt-4o-mini"
+        # one tuned pool shared by every call in this worker, instead of the SDK's defaults
+        self.http = pooled_client(
+            settings.OPENAI_MAX_CONNECTIONS,
+            settings.OPENAI_MAX_KEEPALIVE,
+            settings.OPENAI_KEEPALIVE_EXPIRY,
+            http2=settings.OPENAI_HTTP2,
+            connect_timeout=settings.OPENAI_CONNECT_TIMEOUT,
+            read_timeout=settings.OPENAI_READ_TIMEOUT,
+            pool_timeout=settings.OPENAI_POOL_TIMEOUT,
+        )
+        # no SDK-internal retries: 429s must reach the scheduler, and retries go through self.resilience
+        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL, http_client=self.http, max_retries=0)
+        self.model = settings.OPENAI_MODEL
+        self.resilience = Resilience(
+            CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS),
+            RetryBudget(settings.LLM_RETRY_BUDGET_RATIO, settings.LLM_RETRY_BUDGET_MIN_PER_SECOND, settings.LLM_RETRY_BUDGET_MAX),
+            classify_error,
+            max_attempts=settings.LLM_MAX_ATTEMPTS,
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY,
+            max_retry_after=settings.LLM_RETRY_AFTER_MAX,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+            hedge_min_delay=settings.LLM_HEDGE_MIN_DELAY,
+        )
+
+    @property
+    def transport(self) -> PooledTransport:
+        return self.http._transport
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return self.transport.stats()
+
+    async def warm_up(self, connections: int = settings.OPENAI_WARMUP_CONNECTIONS) -> int:
+        """Pre-opens pooled connections to the API host so the first requests skip the handshake."""
+        # HTTP/2 multiplexes every request over one connection
+        opened = await warm_up(self.http, str(self.client.base_url), 1 if self.transport.http2 else connections)
+        logger.info("OpenAI transport warmed up", connections=opened, **self.pool_stats())
+        return opened
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     async def call_with_tools(
         self,
         messages: List[Dict],
         tools: List[Dict],
-        stream: bool = False
+        stream: bool = False,
+        tool_choice: str = "auto"
     ) -> AsyncGenerator[Dict, None] | Dict:
-        start_time = asyncio.get_event_loop().time()
-        try:
-            if stream:
-                stream_iter = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    tools=tools,
-                    tool_choice="auto",
-                    stream=True
-                )
-                async for chunk in stream_iter:
-                    if chunk.choices[0].delta.tool_calls:
-                        yield {"type": "tool_call", "data": chunk.choices[0].delta}
-                    elif chunk.choices[0].delta.content:
-                        yield {"type": "content", "data": chunk.choices[0].delta.content}
-                    await asyncio.sleep(0.01)  # Heartbeat
-            else:
+        # with stream=True the awaited result is an async generator of deltas
+        tier = current_tier.get()
+        if stream:
+            return self._stream_with_tools(messages, tools, tier)
+        response = await self.resilience.call(lambda: self._complete(messages, tools, tool_choice, tier))
+        # Execute tools here if needed (deterministic helpers)
+        return response.model_dump()
+
+    async def _complete(self, messages: List[Dict], tools: List[Dict], tool_choice: str, tier: str) -> Any:
+        """One attempt: a scheduler slot plus one completion request."""
+        scheduler = get_llm_scheduler()
+        agent = current_agent.get()
+        async with scheduler.slot(tier):
+            start_time = asyncio.get_event_loop().time()
+            try:
                 response = await self.client.chat.completions.create(
                     model=self.model,
                     messages=messages,
                     tools=tools,
-                    tool_choice="auto"
+                    tool_choice=tool_choice
                 )
-                tokens = response.usage.total_tokens if response.usage else 0
-                latency = asyncio.get_event_loop().time() - start_time
-                logger.info("OpenAI call", model=self.model, tokens=tokens, latency=latency)
-                # Execute tools here if needed (deterministic helpers)
-                return response.model_dump()
+            except RateLimitError as e:
+                scheduler.record_overload()
+                LLM_REQUESTS.inc(agent, self.model, "throttled")
+                logger.error("OpenAI error", error=str(e))
+                raise
+            except Exception as e:
+                LLM_REQUESTS.inc(agent, self.model, "error")
+                logger.error("OpenAI error", error=str(e))
+                raise
+            latency = asyncio.get_event_loop().time() - start_time
+            scheduler.record_success(latency)
+        LLM_REQUESTS.inc(agent, self.model, "ok")
+        LLM_LATENCY.observe(latency, agent, self.model, "complete")
+        if response.usage:
+            LLM_TOKENS.inc(agent, self.model, "prompt", amount=response.usage.prompt_tokens)
+            LLM_TOKENS.inc(agent, self.model, "completion", amount=response.usage.completion_tokens)
+        tokens = response.usage.total_tokens if response.usage else 0
+        logger.info("OpenAI call", model=self.model, tokens=tokens, latency=latency)
+        return response
+
+    async def _open_stream(self, messages: List[Dict], tools: List[Dict], tier: str) -> Tuple[Any, Any, float]:
+        """One attempt at a stream, up to its first chunk. On success the scheduler slot stays held."""
+        scheduler = get_llm_scheduler()
+        agent = current_agent.get()
+        await scheduler.acquire(tier)
+        start_time = asyncio.get_event_loop().time()
+        try:
+            stream_iter = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                tools=tools,
+                tool_choice="auto",
+                stream=True,
+                # the SDK pinned here predates the stream_options argument
+                extra_body={"stream_options": {"include_usage": True}},
+            )
+            first = await stream_iter.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except BaseException as e:
+            scheduler.release()
+            if isinstance(e, RateLimitError):
+                scheduler.record_overload()
+            if isinstance(e, Exception):
+                LLM_REQUESTS.inc(agent, self.model, "throttled" if isinstance(e, RateLimitError) else "error")
+                logger.error("OpenAI error", error=str(e))
+            raise
+        # time to first chunk is the latency signal for streams
+        ttft = asyncio.get_event_loop().time() - start_time
+        scheduler.record_success(ttft)
+        LLM_TTFT.observe(ttft, agent, self.model)
+        return stream_iter, first, start_time
+
+    async def _stream_with_tools(self, messages: List[Dict], tools: List[Dict], tier: str) -> AsyncGenerator[Dict, None]:
+        # retries cover opening the stream; once a delta has been yielded the stream cannot be replayed
+        stream_iter, chunk, start_time = await self.resilience.call(lambda: self._open_stream(messages, tools, tier), hedge=False)
+        agent = current_agent.get()
+        deltas = 0
+        usage = None  # sent in a final chunk without choices (stream_options.include_usage)
+        outcome = "error"
+        try:
+            while chunk is not None:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if chunk.choices:
+                    delta = chunk.choices[0].delta
+                    if delta.tool_calls:
+                        yield {"type": "tool_call", "data": delta}
+                    elif delta.content:
+                        deltas += 1
+                        yield {"type": "content", "data": delta.content}
+                chunk = await anext(stream_iter, None)
+            outcome = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = "cancelled"  # the consumer went away, e.g. a client disconnect
+            raise
         except Exception as e:
             logger.error("OpenAI error", error=str(e))
             raise
+        finally:
+            get_llm_scheduler().release()
+            LLM_REQUESTS.inc(agent, self.model, outcome)
+            LLM_LATENCY.observe(asyncio.get_event_loop().time() - start_time, agent, self.model, "stream")
+            if usage:
+                prompt_tokens, completion_tokens = _usage_counts(usage)
+                LLM_TOKENS.inc(agent, self.model, "prompt", amount=prompt_tokens)
+                LLM_TOKENS.inc(agent, self.model, "completion", amount=completion_tokens)
+            else:
+                LLM_TOKENS.inc(agent, self.model, "completion", amount=deltas)  # fallback: one per delta
+            await stream_iter.close()
+
+    def resilience_stats(self) -> Dict[str, Any]:
+        return self.resilience.stats()
+
+
+def _usage_counts(usage: Any) -> Tuple[int, int]:
+    # a CompletionUsage on newer SDKs; the pinned one keeps unknown chunk fields as a plain dict
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0
 
 # Tools definitions (JSON schemas)
 TOOLS = [
@@ -106,13 +254,60 @@ TOOLS = [
             "description": "Estimate daily calorie needs",
             "parameters": {
                 "type": "object",
-                "properties": {"calories_in": {"type": "number"}, "activity_level": {"type": "string", "enum": ["low", "medium", "high"]}},
+                "properties": {"calories_in": {"type": "number"}, "activity_level": {"type": "string", "enum": ["low", "medium", "high"]}, "goal": {"type": "string", "enum": ["lose", "maintain", "gain"]}},
                 "required": ["calories_in", "activity_level"]
             }
         }
     },
-    # Add other tools: fetch_user_history, select_exercises, save_plan, get_subscription_tier, log_tokens
-    # ... (similar structure)
+    {
+        "type": "function",
+        "function": {
+            "name": "fetch_user_history",
+            "description": "Fetch the user's most recent health insights",
+            "parameters": {
+                "type": "object",
+                "properties": {"limit": {"type": "integer", "minimum": 1, "maximum": 50}},
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "save_plan",
+            "description": "Save a generated plan to the user's history",
+            "parameters": {
+                "type": "object",
+                "properties": {"plan": {"type": "object"}},
+                "required": ["plan"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "calculate_bmi",
+            "description": "Compute BMI and its category; defaults to the user's stats",
+            "parameters": {
+                "type": "object",
+                "properties": {"weight_kg": {"type": "number"}, "height_cm": {"type": "number"}},
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "calculate_macros",
+            "description": "Daily protein/fat/carb grams for a calorie target (defaults to the user's TDEE-based target)",
+            "parameters": {
+                "type": "object",
+                "properties": {"calories": {"type": "number"}, "goal": {"type": "string", "enum": ["lose", "maintain", "gain"]}},
+                "required": []
+            }
+        }
+    },
+    # handlers live in app.services.tools
 ]
 
 openai_client = OpenAIClient()
@@ -0,0 +1,95 @@
+# py
+"""Incremental scanner that pulls finished array items out of a JSON object while it streams.
+
+Feed it the completion deltas as they arrive. It tracks only the JSON lexical state:
+string/escape, a container stack, and the key each container sits under. So it never
+re-parses from the start. When an object inside one of the watched top-level arrays
+(e.g. "exercises") closes, its exact text is sliced out and returned. Leading prose or
+a ```json fence before the first `{` is skipped.
+"""
+import re
+from typing import List, Optional, Sequence, Tuple
+
+_STRUCTURAL = re.compile(r'[{}\[\]":]')
+_STRING_END = re.compile(r'["\\]')
+_TRIM_AT = 4096  # consumed characters kept before the buffer is sliced down
+
+
+class PartialJSONItems:
+    def __init__(self, fields: Sequence[str]):
+        self.fields = frozenset(fields)
+        self.buffer = ""
+        self.counts = {f: 0 for f in fields}
+        self._pos = 0
+        self._stack: List[Tuple[str, Optional[str]]] = []  # (kind, key it sits under)
+        self._in_string = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+        self._done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, int, str]]:
+        """Consume a delta; returns (field, index, raw item JSON) for every item that closed in it."""
+        self.buffer += chunk
+        found: List[Tuple[str, int, str]] = []
+        buf, pos, end = self.buffer, self._pos, len(self.buffer)
+        while pos < end and not self._done:
+            if self._in_string:
+                m = _STRING_END.search(buf, pos)
+                if m is None:
+                    pos = end
+                    break
+                if m.group() == "\\":
+                    if m.end() >= end:  # escape split across deltas: wait for the next one
+                        pos = m.start()
+                        break
+                    pos = m.end() + 1
+                    continue
+                self._in_string = False
+                self._last_string = buf[self._string_start + 1:m.start()]
+                pos = m.end()
+                continue
+            m = _STRUCTURAL.search(buf, pos)
+            if m is None:
+                pos = end
+                break
+            ch, pos = m.group(), m.end()
+            if ch == '"':
+                if self._stack:
+                    self._in_string = True
+                    self._string_start = m.start()
+            elif ch == ":":
+                self._pending_key = self._last_string
+            elif ch in "{[":
+                parent = self._stack[-1] if self._stack else None
+                key = self._pending_key if parent and parent[0] == "{" else None
+                self._pending_key = None
+                if ch == "{" and self._watched(parent):
+                    self._item_start = m.start()
+                self._stack.append((ch, key))
+            elif self._stack:  # } or ]
+                self._stack.pop()
+                if not self._stack:
+                    self._done = True
+                elif ch == "}" and self._item_start is not None and self._watched(self._stack[-1]):
+                    field = self._stack[-1][1]
+                    found.append((field, self.counts[field], buf[self._item_start:m.end()]))
+                    self.counts[field] += 1
+                    self._item_start = None
+        # drop text that is fully consumed so the buffer stays the size of one open item
+        keep = pos if self._item_start is None else self._item_start
+        if self._in_string and self._string_start < keep:
+            keep = self._string_start
+        if keep >= _TRIM_AT:
+            self.buffer = buf[keep:]
+            pos -= keep
+            self._string_start -= keep
+            if self._item_start is not None:
+                self._item_start -= keep
+        self._pos = pos
+        return found
+
+    def _watched(self, container: Optional[Tuple[str, Optional[str]]]) -> bool:
+        # a watched array directly under the top-level object
+        return container is not None and container[0] == "[" and container[1] in self.fields and len(self._stack) == 2
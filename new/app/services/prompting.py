@@ -0,0 +1,119 @@
+# py
+"""Prompt assembly under a token budget.
+
+The system message is fixed per agent and carries nothing request-specific, so the
+provider's prompt cache can reuse it (with TOOLS) across users. The request context is
+serialized once, compactly. That text goes into the user message and into the cache
+key. When the text is over the agent's budget, it is compacted step by step: long
+strings and lists are truncated, numeric series are summarized, and as a last resort
+the largest fields are dropped.
+"""
+from functools import lru_cache
+from statistics import fmean
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from loguru import logger
+from app.core.config import get_settings
+from app.core import serialization
+
+settings = get_settings()
+
+# shared by every agent and placed first, so the cacheable prefix is as long as possible
+SYSTEM_PREAMBLE = (
+    "You are part of a health coaching assistant. Base your answer on the user's request and the "
+    "JSON context that follows it. Prefer the provided tools over guessing numbers. Be concise and "
+    "specific, and reply in the format your role asks for."
+)
+
+# (max list items, max string chars) tried in order until the context fits
+_COMPACTION_LEVELS = ((20, 400), (10, 200), (5, 80), (2, 40))
+
+_encoder: Any = None
+
+
+def _get_encoder() -> Any:
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken  # optional; exact counts for OpenAI models
+            _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoder = False
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text))
+    return len(text.encode()) // 4 + 1  # ~4 bytes per token for English and JSON
+
+
+def dumps_context(context: Any) -> str:
+    return serialization.canonical(context).decode()
+
+
+def _compact(value: Any, max_items: int, max_chars: int) -> Any:
+    if isinstance(value, dict):
+        return {k: _compact(v, max_items, max_chars) for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        if len(value) > max_items and value and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+            # a long numeric series is more useful to the model as a summary
+            return {"count": len(value), "min": min(value), "max": max(value), "mean": round(fmean(value), 2), "last": value[-1]}
+        kept = [_compact(v, max_items, max_chars) for v in value[:max_items]]
+        if len(value) > max_items:
+            kept.append(f"... {len(value) - max_items} more")
+        return kept
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + "..."
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def compact_context(context: Dict, budget: int, count: Callable[[str], int] = count_tokens) -> Tuple[str, int]:
+    """Serialized context that fits in `budget` tokens, and its token count."""
+    text = dumps_context(context)
+    tokens = count(text)
+    if tokens <= budget:
+        return text, tokens
+    for max_items, max_chars in _COMPACTION_LEVELS:
+        compacted = _compact(context, max_items, max_chars)
+        text = dumps_context(compacted)
+        tokens = count(text)
+        if tokens <= budget:
+            return text, tokens
+    # still too big: drop the largest top-level fields, keeping stats as long as possible
+    omitted: List[str] = []
+    while tokens > budget and compacted:
+        key = max(compacted, key=lambda k: (k != "stats", len(dumps_context(compacted[k]))))
+        del compacted[key]
+        omitted.append(key)
+        text = dumps_context({**compacted, "_omitted": omitted})
+        tokens = count(text)
+    logger.info("Prompt context over budget; omitted fields {}", omitted)
+    return text, tokens
+
+
+class AssembledPrompt:
+    def __init__(self, messages: List[Dict], context_text: str, tokens: int):
+        self.messages = messages
+        self.context_text = context_text  # also the context part of the result cache key
+        self.tokens = tokens
+
+
+def budget_for(agent_name: str) -> int:
+    return settings.PROMPT_AGENT_BUDGETS.get(agent_name, settings.PROMPT_CONTEXT_BUDGET)
+
+
+@lru_cache(maxsize=None)
+def system_prompt(agent_name: str, spec: Optional[str]) -> str:
+    return f"{SYSTEM_PREAMBLE}\n\n{spec or f'You are {agent_name}. Use tools for accuracy.'}"
+
+
+def assemble(agent_name: str, spec: Optional[str], prompt: str, context: Dict) -> AssembledPrompt:
+    context_text, context_tokens = compact_context(context, budget_for(agent_name))
+    messages = [
+        {"role": "system", "content": system_prompt(agent_name, spec)},
+        {"role": "user", "content": f"{prompt}\nContext: {context_text}"},
+    ]
+    return AssembledPrompt(messages, context_text, context_tokens + count_tokens(prompt))
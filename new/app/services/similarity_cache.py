@@ -0,0 +1,199 @@
+# py
+"""Near-duplicate lookup for agent results, behind the exact-match result cache.
+
+Off by default (SIMILARITY_CACHE_THRESHOLD=0): these results are diet and workout
+advice, and a wrong reuse can hand an allergic user a plan with their allergen in it.
+
+Requests are reduced to two parts:
+- a namespace that must match exactly. It holds the agent and the user (unless
+  SIMILARITY_CACHE_SCOPE=global). It holds the stats quantized into buckets, so
+  80.1 kg and 80.2 kg share a bucket, and the rest of the context. It also holds the
+  prompt's pinned terms: numbers and every content word (ingredients, allergens,
+  body parts, exercises, level, goal, diet). Words inside a negation ("no running",
+  "avoiding nuts", "without eggs") are pinned as negated, so "with nuts, avoiding
+  eggs" never matches "avoiding nuts". Only stopwords and FRAMING_WORDS ("plan",
+  "routine", "ideas") are free to differ.
+- a feature set from the remaining framing words, lowercased with light suffix
+  stripping, plus word bigrams.
+
+A previous result is reused when its prompt features are at least the agent's
+threshold similar (estimated by MinHash). The index only stores exact cache keys. The
+values stay in the ResultCache, so both expire together.
+"""
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from app.core import serialization
+from app.core.cache import ResultCache, get_result_cache
+from app.core.config import get_settings
+from app.core.metrics import REGISTRY
+from app.core.similarity import LSHIndex, MinHasher
+from app.services.health_engine import normalize_stats
+
+settings = get_settings()
+
+_TOKEN = re.compile(r"[a-z0-9]+|[,.;:!?()]")
+STOPWORDS = frozenset(
+    "a an the i m me my mine im we our you your please pls can could would will should "
+    "for to of and or in on at with some any give make create build want need like get "
+    "help just really me up is are be it this that who what which how goal goals s t".split()
+)
+# words that only frame the request; every other non-stopword is pinned
+FRAMING_WORDS = frozenset(
+    "plan program programme routine schedule regimen session workout training exercise "
+    "meal menu recipe idea suggestion recommendation option something healthy good great "
+    "best new simple personalized custom tailored tip advice guide".split()
+)
+# a negator pins the words after it, up to the end of the clause, as "no_<word>";
+# "free" negates the word before it ("nut free")
+NEGATORS = frozenset(
+    "no not without avoid avoiding avoids skip skipping exclude excluding except never "
+    "dont don cant cannot wont hate allergy allergic intolerant intolerance".split()
+)
+_CLAUSE_END = frozenset(",.;:!?()") | frozenset("but because since so while though".split())
+_SUFFIXES = ("ing", "ed", "es", "s")
+# raw stats keys that normalize_stats folds into weight_kg/height_cm/age/sex/activity_level/goal
+_NORMALIZED_FROM = frozenset({"weight", "weight_kg", "height", "height_cm", "height_m", "age", "sex", "gender", "activity_level", "goal"})
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if len(word) > (3 if suffix == "s" else len(suffix) + 3) and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+_FRAMING = frozenset(_stem(w) for w in FRAMING_WORDS)
+
+
+def canonicalize_prompt(prompt: str) -> Tuple[Tuple[str, ...], List[str]]:
+    """(pinned terms, which must match exactly; similarity features from the remaining words)."""
+    pinned, words = set(), []
+    negated, last = False, None
+    for token in _TOKEN.findall(prompt.lower().replace("'", "")):
+        if token == "free" and last is not None:
+            pinned.discard(last)
+            pinned.add(f"no_{last.removeprefix('no_')}")
+            continue
+        if token in NEGATORS:
+            negated = True
+            continue
+        if token in _CLAUSE_END:
+            negated, last = False, None
+            continue
+        word = _stem(token)
+        if token in STOPWORDS or word in STOPWORDS:
+            continue
+        last = None
+        if negated:
+            last = f"no_{word}"
+        elif token.isdigit() or word not in _FRAMING:
+            last = word
+        if last is not None:
+            pinned.add(last)
+        else:
+            words.append(word)
+    return tuple(sorted(pinned)), words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def quantize_stats(stats: Dict, buckets: Dict[str, float]) -> Dict[str, Any]:
+    """Stats with numbers snapped to bucket starts; fields without a bucket keep two significant digits."""
+    fields = {**{k: v for k, v in stats.items() if k not in _NORMALIZED_FROM}, **normalize_stats(stats)}
+    out: Dict[str, Any] = {}
+    for key, value in fields.items():
+        if isinstance(value, bool) or value is None:
+            out[key] = value
+        elif isinstance(value, (int, float)):
+            step = buckets.get(key)
+            if step:
+                out[key] = math.floor(value / step) * step
+            else:
+                out[key] = float(f"{value:.2g}")
+        else:
+            out[key] = str(value).strip().lower()
+    return out
+
+
+class SimilarityCache:
+    def __init__(self, results: ResultCache, index: LSHIndex, hasher: MinHasher, threshold: float, agent_thresholds: Optional[Dict[str, float]] = None, scope: str = "user", stat_buckets: Optional[Dict[str, float]] = None):
+        if scope not in ("user", "global"):
+            raise ValueError(f"Unknown SIMILARITY_CACHE_SCOPE: {scope}")
+        self.results = results
+        self.index = index
+        self.hasher = hasher
+        self.threshold = threshold
+        self.agent_thresholds = dict(agent_thresholds or {})
+        self.scope = scope
+        self.stat_buckets = dict(stat_buckets or {})
+        self.hits = 0
+        self.misses = 0
+
+    def _locate(self, agent_name: str, user_id: str, prompt: str, context: Dict) -> Tuple[str, Any]:
+        """(namespace, MinHash signature) for a request."""
+        pinned, features = canonicalize_prompt(prompt)
+        rest = {k: v for k, v in context.items() if k != "stats"}
+        stats = quantize_stats(context.get("stats") or {}, self.stat_buckets)
+        owner = user_id if self.scope == "user" else "*"
+        key = serialization.digest(owner, " ".join(pinned), serialization.canonical(stats), serialization.canonical(rest))
+        return f"{agent_name}:{key}", self.hasher.signature(features)
+
+    def threshold_for(self, agent_name: str) -> float:
+        return self.agent_thresholds.get(agent_name, self.threshold)
+
+    async def get(self, agent_name: str, user_id: str, prompt: str, context: Dict) -> Optional[Any]:
+        namespace, signature = self._locate(agent_name, user_id, prompt, context)
+        for _, cache_key, _ in self.index.query(namespace, signature, self.threshold_for(agent_name)):
+            value = await self.results.backend.get(cache_key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.index.remove(cache_key)  # evicted from the result cache
+        self.misses += 1
+        return None
+
+    def add(self, agent_name: str, user_id: str, prompt: str, context: Dict, cache_key: str) -> None:
+        ttl = self.results.ttl_for(agent_name)
+        if ttl <= 0:
+            return
+        namespace, signature = self._locate(agent_name, user_id, prompt, context)
+        self.index.add(namespace, cache_key, signature, None, ttl)
+
+    def clear(self) -> None:
+        self.index.clear()
+        self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"entries": len(self.index), "hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / total if total else 0.0, "evictions": self.index.evictions}
+
+
+_similarity_cache: Optional[SimilarityCache] = None
+
+
+def get_similarity_cache() -> Optional[SimilarityCache]:
+    """The process-wide similarity cache, or None when SIMILARITY_CACHE_THRESHOLD is 0 (disabled)."""
+    global _similarity_cache
+    if _similarity_cache is None and settings.SIMILARITY_CACHE_THRESHOLD > 0:
+        _similarity_cache = SimilarityCache(
+            get_result_cache(),
+            LSHIndex(settings.SIMILARITY_CACHE_NUM_PERM, settings.SIMILARITY_CACHE_BANDS, settings.SIMILARITY_CACHE_MAX_ENTRIES),
+            MinHasher(settings.SIMILARITY_CACHE_NUM_PERM),
+            settings.SIMILARITY_CACHE_THRESHOLD,
+            settings.SIMILARITY_AGENT_THRESHOLDS,
+            settings.SIMILARITY_CACHE_SCOPE,
+            settings.SIMILARITY_STAT_BUCKETS,
+        )
+    return _similarity_cache
+
+
+def _collect_metrics():
+    if _similarity_cache is None:
+        return
+    cache = _similarity_cache
+    yield "similarity_cache_requests", "counter", "Near-duplicate lookups after an exact cache miss", [
+        ("_total", {"result": "hit"}, cache.hits), ("_total", {"result": "miss"}, cache.misses)]
+    yield "similarity_cache_hit_ratio", "gauge", "Share of exact cache misses answered by a near-duplicate", [("", {}, cache.stats()["hit_ratio"])]
+    yield "similarity_cache_entries", "gauge", "Requests indexed for near-duplicate lookup", [("", {}, len(cache.index))]
+
+
+REGISTRY.register_collector(_collect_metrics)
@@ -1,11 +1,11 @@
-# # app/services/subscription.py
-# from typing import Literal
-# import asyncio
+# app/services/subscription.py
+from typing import Literal
+import asyncio
 
-# async def get_subscription_tier(user_id: str) -> Literal["free", "pro", "enterprise"]:
-#     # Replace with DB lookup
-#     return "free"
+async def get_subscription_tier(user_id: str) -> Literal["free", "pro", "enterprise"]:
+    # Replace with DB lookup
+    return "free"
 
-# async def is_rate_limited(user_id: str) -> bool:
-#     # Replace with Redis count or token-bucket check
-#     return False
+async def is_rate_limited(user_id: str) -> bool:
+    # Replace with Redis count or token-bucket check
+    return False
@@ -1,12 +1,19 @@
 # py
-from app.db.client import get_supabase
-from loguru import logger
-from typing import List, Dict
-from datetime import datetime
+from app.db.repository import get_repository, encode_cursor, decode_cursor
+from app.db.write_behind import get_insight_writer
+from app.core.config import get_settings
+from app.core.metrics import DB_LATENCY, timed
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from datetime import datetime, timezone
+import json
+import uuid
 
-supabase = get_supabase()
+settings = get_settings()
 
-def upsert_user_profile(supabase_id: str, profile: Dict) -> Dict:
+# each call's latency lands in db_call_duration_seconds{function=...}; iter_health_insights is covered page by page
+
+@timed(DB_LATENCY)
+async def upsert_user_profile(supabase_id: str, profile: Dict) -> Dict:
     # ensure users_profiles exists; upsert by supabase_id
     data = {
         "supabase_id": supabase_id,
@@ -16,36 +23,53 @@ def upsert_user_profile(supabase_id: str, profile: Dict) -> Dict:
         "gender": profile.get("gender"),
         "updated_at": datetime.utcnow().isoformat()
     }
-    resp = supabase.table("users_profiles").upsert(data, on_conflict="supabase_id").execute()
-    if resp.error:
-        logger.error("Supabase upsert_user_profile error: %s", resp.error.message)
-        raise RuntimeError("DB error")
-    return resp.data[0]
-
-def create_health_insight(user_supabase_id: str, request_payload: Dict, agents_output: Dict, aggregated_output: str, confidence: float) -> Dict:
-    # resolve user_id
-    user = supabase.table("users_profiles").select("id").eq("supabase_id", user_supabase_id).maybe_single().execute()
-    if user.error or not user.data:
-        raise ValueError("User profile not found")
+    return await get_repository().upsert_user_profile(supabase_id, data)
+
+@timed(DB_LATENCY)
+async def create_health_insight(user_supabase_id: str, request_payload: Dict, agents_output: Dict, aggregated_output: str, confidence: float) -> Dict:
     payload = {
-        "user_id": user.data["id"],
         "request_payload": request_payload,
         "agents_output": agents_output,
         "aggregated_output": aggregated_output,
         "confidence": confidence
     }
-    resp = supabase.table("health_insights").insert(payload).execute()
-    if resp.error:
-        logger.error("Supabase create_health_insight error: %s", resp.error.message)
-        raise RuntimeError("DB insert error")
-    return resp.data[0]
-
-def list_health_insights(user_supabase_id: str, limit: int = 50) -> List[Dict]:
-    user = supabase.table("users_profiles").select("id").eq("supabase_id", user_supabase_id).maybe_single().execute()
-    if user.error or not user.data:
-        raise ValueError("User profile not found")
-    resp = supabase.table("health_insights").select("*").eq("user_id", user.data["id"]).order("created_at", {"ascending": False}).limit(limit).execute()
-    if resp.error:
-        logger.error("Supabase list_health_insights error: %s", resp.error.message)
-        raise RuntimeError("DB read error")
-    return resp.data
+    if settings.INSIGHTS_WRITE_BEHIND:
+        # allocate the id here and let the write-behind queue batch the insert; the bulk insert
+        # skips rows without a profile, so check first rather than hand out an id that never lands
+        if await get_repository().resolve_profile_id(user_supabase_id) is None:
+            raise ValueError("User profile not found")
+        row = {"id": str(uuid.uuid4()), "supabase_id": user_supabase_id, "created_at": datetime.now(timezone.utc).isoformat(), **payload}
+        await get_insight_writer().submit(row)
+        return {k: v for k, v in row.items() if k != "supabase_id"}
+    return await get_repository().create_health_insight(user_supabase_id, payload)
+
+@timed(DB_LATENCY)
+async def list_health_insights(user_supabase_id: str, limit: int = 50) -> List[Dict]:
+    return await get_repository().list_health_insights(user_supabase_id, limit)
+
+@timed(DB_LATENCY)
+async def list_health_insights_page(user_supabase_id: str, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    # keyset page: returns the rows and the cursor for the next page (None on the last page)
+    after = decode_cursor(cursor) if cursor else None
+    rows = await get_repository().list_health_insights(user_supabase_id, limit, after=after)
+    next_cursor = encode_cursor(rows[-1]) if len(rows) == limit else None
+    return rows, next_cursor
+
+async def iter_health_insights(user_supabase_id: str, page_size: int = 500, cursor: Optional[str] = None) -> AsyncIterator[Dict]:
+    # walks the user's whole history page by page; only one page is held in memory
+    while True:
+        rows, cursor = await list_health_insights_page(user_supabase_id, limit=page_size, cursor=cursor)
+        for row in rows:
+            yield row
+        if cursor is None:
+            return
+
+@timed(DB_LATENCY)
+async def get_user_history(user_supabase_id: str, limit: int = 10) -> List[Dict]:
+    # backs the fetch_user_history tool: the user's most recent insights
+    return await list_health_insights(user_supabase_id, limit=limit)
+
+@timed(DB_LATENCY)
+async def save_plan_to_db(user_supabase_id: str, plan: Dict) -> Dict:
+    # backs the save_plan tool; plans are stored as insights until a dedicated table exists
+    return await create_health_insight(user_supabase_id, {"source": "save_plan"}, {"plan": plan}, json.dumps(plan, default=str), 1.0)
@@ -0,0 +1,143 @@
+# py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from loguru import logger
+from app.core.config import get_settings
+from app.core import serialization
+from app.services import health_engine
+from app.services.supabase_service import get_user_history, save_plan_to_db
+
+settings = get_settings()
+
+# handler(ctx, **arguments) -> JSON-serializable result
+ToolHandler = Callable[..., Awaitable[Any]]
+
+
+class ToolContext:
+    """What a tool handler may see about the request it runs for."""
+
+    def __init__(self, user_id: str, context: Optional[Dict] = None):
+        self.user_id = user_id
+        self.context = context or {}
+
+
+class ToolRegistry:
+    """Name -> async handler with its own timeout. Schemas for the model stay in openai_client.TOOLS."""
+
+    def __init__(self, default_timeout: float):
+        self.default_timeout = default_timeout
+        self._handlers: Dict[str, ToolHandler] = {}
+        self._timeouts: Dict[str, float] = {}
+
+    def register(self, name: str, timeout: Optional[float] = None) -> Callable[[ToolHandler], ToolHandler]:
+        def decorator(fn: ToolHandler) -> ToolHandler:
+            self._handlers[name] = fn
+            self._timeouts[name] = timeout if timeout is not None else self.default_timeout
+            return fn
+        return decorator
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._handlers
+
+    def names(self) -> List[str]:
+        return list(self._handlers)
+
+    async def call(self, name: str, arguments: Dict, ctx: ToolContext) -> Any:
+        handler = self._handlers.get(name)
+        if handler is None:
+            raise KeyError(f"Unknown tool: {name}")
+        return await asyncio.wait_for(handler(ctx, **arguments), self._timeouts[name])
+
+
+def _call_parts(tool_call: Any) -> tuple:
+    # tool calls arrive as dicts (model_dump) or SDK objects
+    if isinstance(tool_call, dict):
+        fn = tool_call.get("function") or {}
+        return tool_call.get("id"), fn.get("name"), fn.get("arguments") or "{}"
+    fn = tool_call.function
+    return tool_call.id, fn.name, fn.arguments or "{}"
+
+
+class ToolExecutor:
+    """Runs every tool call of one model turn concurrently.
+
+    Each call gets its registry timeout. Failures and timeouts become `{"error": ...}`
+    results instead of exceptions, so the model sees what went wrong and can answer
+    anyway. Results come back as `role=tool` messages in the order of the calls.
+    """
+
+    def __init__(self, registry: ToolRegistry):
+        self.registry = registry
+
+    async def _run_one(self, tool_call: Any, ctx: ToolContext) -> Dict:
+        call_id, name, raw_args = _call_parts(tool_call)
+        try:
+            arguments = serialization.loads(raw_args) if isinstance(raw_args, str) else dict(raw_args)
+            result = await self.registry.call(name, arguments, ctx)
+        except asyncio.TimeoutError:
+            logger.warning("Tool {} timed out", name)
+            result = {"error": f"{name} timed out"}
+        except Exception as e:
+            logger.warning("Tool {} failed: {}", name, e)
+            result = {"error": str(e) or type(e).__name__}
+        return {"role": "tool", "tool_call_id": call_id, "content": serialization.dumps_str(result)}
+
+    async def run(self, tool_calls: List[Any], ctx: ToolContext) -> List[Dict]:
+        return list(await asyncio.gather(*(self._run_one(tc, ctx) for tc in tool_calls)))
+
+
+registry = ToolRegistry(default_timeout=settings.TOOL_TIMEOUT_SECONDS)
+executor = ToolExecutor(registry)
+
+REFERENCE_BMR = 1500.0  # kcal/day, used when the request context cannot give a BMR
+
+
+def _stats(ctx: ToolContext) -> Dict:
+    stats = ctx.context.get("stats")
+    return stats if isinstance(stats, dict) else ctx.context
+
+
+@registry.register("fetch_user_history")
+async def fetch_user_history(ctx: ToolContext, limit: int = 10) -> List[Dict]:
+    return await get_user_history(ctx.user_id, limit=min(int(limit), 50))
+
+
+@registry.register("save_plan")
+async def save_plan(ctx: ToolContext, plan: Dict) -> Dict:
+    saved = await save_plan_to_db(ctx.user_id, plan)
+    return {"saved": True, "id": saved.get("id")}
+
+
+@registry.register("estimate_calories", timeout=1.0)
+async def estimate_calories(ctx: ToolContext, calories_in: float, activity_level: str, goal: str = "maintain") -> Dict:
+    stats = _stats(ctx)
+    s = health_engine.normalize_stats(stats)
+    if {"weight_kg", "height_cm", "age", "sex"} <= s.keys():
+        bmr = health_engine.bmr_mifflin(s["weight_kg"], s["height_cm"], s["age"], s["sex"])
+    else:
+        bmr = float(stats.get("bmr") or REFERENCE_BMR)
+    estimate = health_engine.calorie_target(bmr, activity_level, goal)
+    return {"estimated_need_kcal": estimate["tdee"], "target_kcal": estimate["target"], "calories_in": calories_in, "balance_kcal": round(calories_in - estimate["tdee"])}
+
+
+@registry.register("calculate_bmi", timeout=1.0)
+async def calculate_bmi(ctx: ToolContext, weight_kg: Optional[float] = None, height_cm: Optional[float] = None) -> Dict:
+    stats = {**_stats(ctx), **{k: v for k, v in {"weight_kg": weight_kg, "height_cm": height_cm}.items() if v}}
+    result = health_engine.compute(stats, ["bmi"])
+    if result is None:
+        raise ValueError("weight and height are required")
+    return result["bmi"]
+
+
+@registry.register("calculate_macros", timeout=1.0)
+async def calculate_macros(ctx: ToolContext, calories: Optional[float] = None, goal: str = "maintain") -> Dict:
+    stats = {**_stats(ctx), "goal": goal}
+    if calories:
+        weight = health_engine.normalize_stats(stats).get("weight_kg")
+        if weight is None:
+            raise ValueError("weight is required")
+        return health_engine.macro_split(calories, weight, goal)
+    result = health_engine.compute(stats, ["macros"])
+    if result is None:
+        raise ValueError("weight, height, age and sex are required")
+    return result["macros"]
@@ -1,7 +1,13 @@
 # py
-from typing import Dict
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from app.core.config import get_settings
 from app.db.client import verify_jwt
 
+settings = get_settings()
+
 def validate_prompt_length(prompt: str):
     if not (1 <= len(prompt) <= 2000):
         raise ValueError("prompt length must be between 1 and 2000")
@@ -14,5 +20,67 @@ def get_bearer_token(authorization_header: str) -> str:
         raise ValueError("Invalid Authorization header")
     return parts[1]
 
+class VerifiedTokenCache:
+    """Bounded LRU of sha256(token) -> decoded claims.
+
+    Only tokens that passed full verification are stored, and each entry expires at
+    the token's own `exp` (capped at `max_ttl`), so a cached token is never accepted
+    past the point jose would have rejected it. Raw tokens are not kept in memory.
+    """
+
+    def __init__(self, max_entries: int, max_ttl: float):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rejections = 0
+
+    def get(self, digest: bytes, now: float) -> Optional[Dict]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, claims = entry
+        if expires_at <= now:
+            del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return claims
+
+    def put(self, digest: bytes, claims: Dict, now: float) -> None:
+        expires_at = now + self.max_ttl
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, float(exp))
+        if expires_at <= now:
+            return
+        self._entries[digest] = (expires_at, claims)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "rejections": self.rejections}
+
+_token_cache = VerifiedTokenCache(settings.JWT_CACHE_SIZE, settings.JWT_CACHE_MAX_TTL)
+
 def verify_supabase_jwt(token: str) -> Dict:
-    return verify_jwt(token)
+    if settings.JWT_CACHE_SIZE <= 0:
+        return verify_jwt(token)
+    now = time.time()
+    digest = hashlib.sha256(token.encode()).digest()
+    claims = _token_cache.get(digest, now)
+    if claims is None:
+        try:
+            claims = verify_jwt(token)
+        except ValueError:
+            _token_cache.rejections += 1
+            raise
+        _token_cache.put(digest, claims, now)
+    return dict(claims)
+
+def jwt_cache_stats() -> Dict[str, int]:
+    return _token_cache.stats()
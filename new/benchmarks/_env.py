@@ -0,0 +1,14 @@
+# py
+# Shared setup for the benchmark scripts: harmless settings so `app` imports without a
+# real Supabase/OpenAI account, and the repo root on sys.path.
+import os
+import sys
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "bench-service-key")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-jwt-secret")
+os.environ.setdefault("OPENAI_API_KEY", "bench-openai-key")
+os.environ.setdefault("DB_BACKEND", "memory")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
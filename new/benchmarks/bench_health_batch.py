@@ -0,0 +1,62 @@
+# py
+"""Batch BMI/calorie metrics: scalar Python loop vs the vectorized NumPy pass.
+
+Run from the project root:
+
+    python benchmarks/bench_health_batch.py [rows]
+"""
+import random
+import sys
+import time
+import _env  # noqa: F401
+from app.services import health_engine
+from app.services.health_batch import batch_metrics
+from app.utils.bmi import calculate_bmi, bmi_category
+
+
+def columns(n):
+    rng = random.Random(1)
+    return (
+        [rng.uniform(40, 150) for _ in range(n)],
+        [rng.uniform(145, 205) for _ in range(n)],
+        [rng.randint(18, 80) for _ in range(n)],
+        [rng.choice(["male", "female"]) for _ in range(n)],
+        [rng.choice(list(health_engine.ACTIVITY_FACTORS)) for _ in range(n)],
+        [rng.choice(list(health_engine.GOAL_ADJUSTMENT)) for _ in range(n)],
+    )
+
+
+def scalar(weight, height, age, sex, activity, goal):
+    out = []
+    for w, h, a, s, act, g in zip(weight, height, age, sex, activity, goal):
+        bmi = calculate_bmi(w, h / 100)
+        calories = health_engine.calorie_target(health_engine.bmr_mifflin(w, h, a, s), act, g)
+        out.append((bmi, bmi_category(bmi), calories["target"]))
+    return out
+
+
+def vectorized(weight, height, age, sex, activity, goal):
+    metrics = batch_metrics(weight, height, age, sex, activity, goal)
+    return {k: v.tolist() for k, v in metrics.items()}  # include conversion back to JSON-ready lists
+
+
+def best_of(fn, cols, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*cols)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    sizes = [int(sys.argv[1])] if len(sys.argv) > 1 else [1_000, 10_000, 100_000]
+    for n in sizes:
+        cols = columns(n)
+        s = best_of(scalar, cols)
+        v = best_of(vectorized, cols)
+        print(f"{n:>8,} rows  scalar {s * 1e3:8.2f} ms  numpy {v * 1e3:7.2f} ms  ({s / v:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
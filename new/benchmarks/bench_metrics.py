@@ -0,0 +1,57 @@
+# py
+"""Cost of recording metrics on the hot path, and of rendering /metrics.
+
+Run from the project root:
+
+    python benchmarks/bench_metrics.py [iterations]
+"""
+import asyncio
+import sys
+import time
+import _env  # noqa: F401
+from app.core.metrics import LLM_BUCKETS, Registry, timed
+
+
+def per_call_ns(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e9
+
+
+async def wrapped_overhead_ns(n):
+    hist = Registry().histogram("calls_seconds", "Calls", ("function", "outcome"))
+
+    async def bare():
+        return None
+
+    wrapped = timed(hist)(bare)
+    start = time.perf_counter()
+    for _ in range(n):
+        await bare()
+    plain = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(n):
+        await wrapped()
+    return (time.perf_counter() - start - plain) / n * 1e9
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    registry = Registry()
+    counter = registry.counter("tokens", "Tokens", ("agent", "model", "kind"))
+    hist = registry.histogram("latency_seconds", "Latency", ("agent", "model", "mode"), LLM_BUCKETS)
+    print(f"counter.inc        {per_call_ns(lambda: counter.inc('workout_generator', 'gpt-4o-mini', 'prompt', amount=120), n):7.0f} ns")
+    print(f"histogram.observe  {per_call_ns(lambda: hist.observe(1.7, 'workout_generator', 'gpt-4o-mini', 'stream'), n):7.0f} ns")
+    print(f"@timed overhead    {asyncio.run(wrapped_overhead_ns(n)):7.0f} ns per call")
+    for agent in range(10):
+        for model in range(3):
+            for mode in ("complete", "stream"):
+                hist.observe(0.5, f"agent{agent}", f"model{model}", mode)
+    start = time.perf_counter()
+    text = registry.render()
+    print(f"render             {(time.perf_counter() - start) * 1e3:7.2f} ms for 60 histogram series ({len(text):,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
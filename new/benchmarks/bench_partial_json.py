@@ -0,0 +1,46 @@
+# py
+"""Time to first structured item when streaming a WorkoutPlan, and the parser's cost.
+
+Replays a plan as ~4-character deltas at a fixed token rate. "before" is the first
+moment anything validated existed: the `done` event after the whole completion.
+"after" is the first `item` event from PartialJSONItems. Run from the project root:
+
+    python benchmarks/bench_partial_json.py [exercises]
+"""
+import sys
+import time
+import _env  # noqa: F401
+from app.services.agent_outputs import get_output_spec
+from app.services.partial_json import PartialJSONItems
+from bench_validation import plan_json
+
+DELTA_CHARS = 4
+TOKENS_PER_SECOND = 60  # typical streamed completion rate
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    text = plan_json(n)
+    deltas = [text[i:i + DELTA_CHARS] for i in range(0, len(text), DELTA_CHARS)]
+    spec = get_output_spec("workout_generator")
+
+    first = None
+    start = time.perf_counter()
+    parser = PartialJSONItems(spec.items)
+    emitted = 0
+    for i, delta in enumerate(deltas):
+        for field, _, raw in parser.feed(delta):
+            if spec.validate_item(field, raw) is not None:
+                emitted += 1
+                if first is None:
+                    first = i + 1
+    cost = time.perf_counter() - start
+
+    total = len(deltas) / TOKENS_PER_SECOND
+    print(f"WorkoutPlan with {n} exercises: {len(deltas)} deltas, {emitted} item events")
+    print(f"first structured data  before {total:6.2f} s   after {first / TOKENS_PER_SECOND:6.2f} s  (at {TOKENS_PER_SECOND} deltas/s)")
+    print(f"parser + item validation {cost / len(deltas) * 1e6:.2f} us per delta, {cost * 1e3:.2f} ms per plan")
+
+
+if __name__ == "__main__":
+    main()
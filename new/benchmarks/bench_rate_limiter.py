@@ -0,0 +1,79 @@
+# py
+"""Rate limiter store: per-call cost and memory for millions of distinct keys.
+
+Compares the previous design (one TokenBucket object with its own asyncio.Lock per
+key, kept forever) against GCRAStore. Run from the project root:
+
+    python benchmarks/bench_rate_limiter.py [n_keys]
+"""
+import asyncio
+import sys
+import time
+import tracemalloc
+import _env  # noqa: F401
+from app.core.rate_limiter import GCRAStore
+
+
+class LegacyTokenBucket:
+    def __init__(self, capacity: int, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def consume(self, amount: int = 1) -> bool:
+        async with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.last
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+            self.last = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True
+            return False
+
+
+async def legacy(keys):
+    store = {}
+    for key in keys:
+        bucket = store.get(key)
+        if bucket is None:
+            bucket = store[key] = LegacyTokenBucket(10, 1.0)
+        await bucket.consume(1)
+    return store
+
+
+async def gcra(keys):
+    store = GCRAStore(10, 1.0)
+    for key in keys:
+        store.allow(key)
+    return store
+
+
+async def run(label, fn, keys):
+    start = time.perf_counter()
+    await fn(keys)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()  # separate pass: tracing distorts timings
+    store = await fn(keys)
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<24} {elapsed / len(keys) * 1e9:8.0f} ns/call  {current / 1e6:8.1f} MB retained  ({current / len(keys):.0f} B/key)")
+    del store
+
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    keys = [f"user-{i}" for i in range(n)]
+    print(f"{n:,} distinct keys")
+    await run("TokenBucket + Lock", legacy, keys)
+    await run("GCRAStore", gcra, keys)
+    hot = keys[:1000] * (n // 1000)
+    print(f"{len(hot):,} calls over 1,000 hot keys")
+    await run("TokenBucket + Lock", legacy, hot)
+    await run("GCRAStore", gcra, hot)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+# py
+"""Rate limiting across worker processes: does the limit hold, and what does it cost?
+
+Starts N worker processes that hammer the same few hot keys for a fixed time, like N
+uvicorn workers serving one abusive client. For each backend it reports the per-call
+latency and how many requests got through compared with the configured limit
+(capacity + rate * elapsed per key). Run from the project root:
+
+    python benchmarks/bench_rate_limiter_contention.py [workers] [seconds]
+
+The redis backend runs only when REDIS_URL points at a real server (the in-memory
+stand-in is per-process).
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import _env  # noqa: F401
+from app.core.config import get_settings
+from app.core.rate_limiter import GCRAStore, RedisGCRA, SharedMemoryGCRA
+
+CAPACITY = 100
+RATE = 1000.0
+HOT_KEYS = [f"user-{i}" for i in range(4)]
+
+
+def worker(backend: str, path: str, seconds: float, start_at: float, out) -> None:
+    while time.time() < start_at:
+        time.sleep(0.001)
+    if backend == "redis":
+        asyncio.run(redis_worker(seconds, out))
+        return
+    if backend == "memory":
+        limiter = GCRAStore(CAPACITY, RATE)
+    else:
+        limiter = SharedMemoryGCRA(path, CAPACITY, RATE, slots=1024)
+    calls = allowed = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for key in HOT_KEYS:
+            allowed += limiter.allow(key)
+        calls += len(HOT_KEYS)
+    out.put((calls, allowed))
+
+
+async def redis_worker(seconds: float, out) -> None:
+    import redis.asyncio as aioredis
+
+    client = aioredis.from_url(get_settings().REDIS_URL)
+    limiter = RedisGCRA(client, CAPACITY, RATE, prefix=f"bench-rl-{os.getppid()}:")
+    calls = allowed = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        results = await asyncio.gather(*(limiter.allow(key) for key in HOT_KEYS * 8))
+        calls += len(results)
+        allowed += sum(results)
+    await client.aclose()
+    out.put((calls, allowed))
+
+
+def run(backend: str, workers: int, seconds: float) -> None:
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rl")
+        start_at = time.time() + 0.2
+        procs = [ctx.Process(target=worker, args=(backend, path, seconds, start_at, out)) for _ in range(workers)]
+        for p in procs:
+            p.start()
+        results = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+    calls = sum(c for c, _ in results)
+    allowed = sum(a for _, a in results)
+    limit = len(HOT_KEYS) * (CAPACITY + RATE * seconds)
+    per_call = seconds * workers / calls * 1e9
+    print(f"{backend:<8} {calls / seconds:12,.0f} calls/s  {per_call:8.0f} ns/call/worker  allowed {allowed:>9,} vs limit {limit:>9,.0f} ({allowed / limit:.2f}x)")
+
+
+def main() -> None:
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    print(f"{workers} workers, {len(HOT_KEYS)} hot keys, {seconds:.0f}s, limit {CAPACITY} burst + {RATE:.0f}/s per key")
+    run("memory", workers, seconds)
+    run("shm", workers, seconds)
+    url = get_settings().REDIS_URL
+    if url and not url.startswith("memory://"):
+        run("redis", workers, seconds)
+    else:
+        print("redis    skipped (set REDIS_URL to a real server)")
+
+
+if __name__ == "__main__":
+    main()
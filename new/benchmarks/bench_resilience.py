@@ -0,0 +1,94 @@
+# py
+"""Latency added by failure handling, with a simulated provider.
+
+1. One transient failure, then success. "before" replays the previous tenacity decorator
+   (3 attempts, exponential wait with a 4 s minimum). "after" is Resilience with the
+   default settings.
+2. Tail latency when 5% of calls stall for 2 s (otherwise 20-40 ms). Without hedging
+   vs with a p95 hedge. Run from the project root:
+
+    python benchmarks/bench_resilience.py
+"""
+import asyncio
+import random
+import time
+import _env  # noqa: F401
+from app.core.resilience import FAILURE, FATAL, CircuitBreaker, Resilience, RetryBudget
+
+
+class Transient(Exception):
+    pass
+
+
+def classify(e):
+    return (FAILURE, None) if isinstance(e, Transient) else (FATAL, None)
+
+
+def resilience(hedge):
+    return Resilience(CircuitBreaker(5, 30.0), RetryBudget(0.2, 1.0, 20.0), classify, hedge_percentile=0.95 if hedge else None, hedge_min_delay=0.05)
+
+
+def flaky():
+    state = {"failed": False}
+
+    async def call():
+        await asyncio.sleep(0.02)
+        if not state["failed"]:
+            state["failed"] = True
+            raise Transient()
+        return "ok"
+    return call
+
+
+async def transient_failure():
+    call = flaky()
+
+    async def legacy():
+        # what @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10)) did
+        for attempt in range(3):
+            try:
+                return await call()
+            except Exception:
+                if attempt == 2:
+                    raise
+                await asyncio.sleep(min(max(2 ** attempt, 4), 10))
+
+    start = time.monotonic()
+    await legacy()
+    before = time.monotonic() - start
+    start = time.monotonic()
+    await resilience(hedge=False).call(flaky())
+    return before, time.monotonic() - start
+
+
+async def tail(hedge, n=400):
+    r = resilience(hedge)
+    rng = random.Random(7)
+
+    async def call():
+        await asyncio.sleep(2.0 if rng.random() < 0.05 else rng.uniform(0.02, 0.04))
+        return "ok"
+
+    latencies = []
+
+    async def one():
+        start = time.monotonic()
+        await r.call(call)
+        latencies.append(time.monotonic() - start)
+
+    for i in range(0, n, 20):  # waves of 20 concurrent calls
+        await asyncio.gather(*(one() for _ in range(20)))
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], r.hedges
+
+
+def main():
+    before, after = asyncio.run(transient_failure())
+    print(f"one transient failure   before {before:6.2f} s   after {after:6.3f} s")
+    for hedge in (False, True):
+        p50, p99, hedges = asyncio.run(tail(hedge))
+        print(f"{'hedged' if hedge else 'no hedge':<10} p50 {p50 * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms   hedges {hedges}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# py
+"""Tier fairness and 429s under a free-tier burst, with a simulated provider.
+
+The provider serves CAPACITY concurrent calls at ~50 ms and answers 429 beyond that.
+200 free calls arrive at once, then 20 pro calls. "before" is what the code did
+previously: no admission control, every call goes straight to the provider.
+"fq" is the scheduler with equal weights, so tiers alternate. "wfq" uses the tier weights. Each call
+that gets a 429 waits 50 ms and retries. Run from the project root:
+
+    python benchmarks/bench_scheduler.py
+"""
+import asyncio
+import time
+import _env  # noqa: F401
+from app.core.scheduler import AIMDLimit, FairScheduler
+
+CAPACITY = 8
+SERVICE_SECONDS = 0.05
+
+
+class Provider:
+    def __init__(self):
+        self.active = 0
+        self.rejected = 0
+
+    async def call(self):
+        if self.active >= CAPACITY:
+            self.rejected += 1
+            raise RuntimeError("429")
+        self.active += 1
+        try:
+            await asyncio.sleep(SERVICE_SECONDS)
+        finally:
+            self.active -= 1
+
+
+async def run(scheduler):
+    provider = Provider()
+    done = {"free": [], "pro": []}
+    start = time.monotonic()
+
+    async def call(tier):
+        while True:
+            try:
+                if scheduler is None:
+                    await provider.call()
+                else:
+                    async with scheduler.slot(tier):
+                        t = time.monotonic()
+                        try:
+                            await provider.call()
+                        except RuntimeError:
+                            scheduler.record_overload()
+                            raise
+                        scheduler.record_success(time.monotonic() - t)
+                break
+            except RuntimeError:
+                await asyncio.sleep(SERVICE_SECONDS)
+        done[tier].append(time.monotonic() - start)
+
+    tasks = [asyncio.create_task(call("free")) for _ in range(200)]
+    await asyncio.sleep(0.001)
+    tasks += [asyncio.create_task(call("pro")) for _ in range(20)]
+    await asyncio.gather(*tasks)
+    pro = sorted(done["pro"])
+    return pro[len(pro) // 2], pro[-1], max(done["free"]), provider.rejected
+
+
+def main():
+    variants = {
+        "before": None,
+        "fq": FairScheduler({"free": 1.0, "pro": 1.0}, AIMDLimit(16, 2, 64, latency_target=0.5, cooldown=SERVICE_SECONDS), 1000, 30.0),
+        "wfq": FairScheduler({"free": 1.0, "pro": 4.0}, AIMDLimit(16, 2, 64, latency_target=0.5, cooldown=SERVICE_SECONDS), 1000, 30.0),
+    }
+    print(f"{'':<8}{'pro p50':>10}{'pro max':>10}{'all done':>10}{'429s':>8}   (seconds)")
+    for label, scheduler in variants.items():
+        p50, pmax, total, rejected = asyncio.run(run(scheduler))
+        print(f"{label:<8}{p50:10.2f}{pmax:10.2f}{total:10.2f}{rejected:8d}")
+
+
+if __name__ == "__main__":
+    main()
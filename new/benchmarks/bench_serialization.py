@@ -0,0 +1,76 @@
+# py
+"""JSON hot paths: the previous json.dumps code vs app.core.serialization (stdlib and orjson).
+
+Covers SSE frame encoding, result-cache keys, prompt context and a response body.
+Run from the project root:
+
+    python benchmarks/bench_serialization.py
+"""
+import hashlib
+import json
+import timeit
+import _env  # noqa: F401
+from app.core import serialization
+
+DELTA = {"stage": "delta", "agent": "workout_generator", "content": "Do three sets of ten squats, "}
+CONTEXT = {
+    "stats": {"weight": 80.5, "height": 1.8, "age": 30, "gender": "male", "activity_level": "moderate"},
+    "history": [{"id": f"id-{i}", "aggregated_output": "Sleep 8h and walk daily. " * 4, "confidence": 0.8} for i in range(20)],
+    "steps": list(range(0, 14000, 100)),
+}
+INSIGHTS = [{"id": f"{i:08d}-0000-0000-0000-000000000000", "aggregated_output": "Drink more water. " * 10, "confidence": 0.75, "created_at": "2024-05-01T10:00:00+00:00"} for i in range(100)]
+PROMPT = "Build me a four week plan to improve my 5k time"
+
+
+def old_frame():
+    return f"data: {json.dumps(DELTA)}\n\n".encode()
+
+
+def old_cache_key():
+    return "workout_generator:" + hashlib.md5((PROMPT + json.dumps(CONTEXT, sort_keys=True) + "user-1").encode()).hexdigest()
+
+
+def old_context():
+    return json.dumps(CONTEXT)
+
+
+def old_response():
+    return json.dumps(INSIGHTS, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def new_suite(dumps, canonical):
+    def frame():
+        return b"data: " + dumps(DELTA) + b"\n\n"
+
+    def cache_key():
+        # context text is built once and reused for the message; only the hash is extra
+        return "workout_generator:" + serialization.digest(PROMPT, canonical(CONTEXT), "user-1")
+
+    def context():
+        return canonical(CONTEXT).decode()
+
+    def response():
+        return dumps(INSIGHTS)
+
+    return frame, cache_key, context, response
+
+
+def bench(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    suites = {"json.dumps (before)": (old_frame, old_cache_key, old_context, old_response)}
+    suites["serialization/json"] = new_suite(serialization._json_dumps, serialization._json_canonical)
+    if serialization.orjson is not None:
+        o = serialization.orjson
+        opts = o.OPT_NON_STR_KEYS | o.OPT_SERIALIZE_NUMPY
+        suites["serialization/orjson"] = new_suite(lambda v: o.dumps(v, default=str, option=opts), lambda v: o.dumps(v, default=str, option=opts | o.OPT_SORT_KEYS))
+    print(f"{'':<24}{'SSE frame':>12}{'cache key':>12}{'context':>12}{'response':>12}   (us per op)")
+    for label, fns in suites.items():
+        cols = [bench(fn, n) for fn, n in zip(fns, (50000, 5000, 5000, 2000))]
+        print(f"{label:<24}" + "".join(f"{c:12.2f}" for c in cols))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# py
+"""Hit rate of exact vs similarity caching on a synthetic stream of plan requests.
+
+40 distinct intents (goal x level x plan type) are asked with random phrasings.
+The stats jitter (weight within 0.4 kg, age fixed per user), and users repeat similar
+asks. "exact" keys on the raw prompt and stats, as the result cache does. "similar"
+is the MinHash/LSH cache in front of it, per user and shared (SIMILARITY_CACHE_SCOPE). A false hit is a hit that returns the result
+of a different intent. Run from the project root:
+
+    python benchmarks/bench_similarity_cache.py [requests]
+"""
+import asyncio
+import random
+import sys
+import time
+import _env  # noqa: F401
+from app.core import serialization
+from app.core.cache import InMemoryLRUCache, ResultCache
+from app.core.similarity import LSHIndex, MinHasher
+from app.services.similarity_cache import SimilarityCache
+
+GOALS = ["lose weight", "gain muscle", "maintain"]
+LEVELS = ["beginner", "intermediate", "advanced"]
+PLANS = ["running plan", "strength program", "home workout", "mobility routine", "cycling plan"]
+PHRASINGS = [
+    "{n} week {level} {plan} to {goal}",
+    "Please build me a {n}-week {plan} for a {level} who wants to {goal}",
+    "can you make a {level} {plan}, {n} weeks, goal: {goal}",
+    "I want to {goal}. Give me a {n} week {plan} ({level})",
+    "{plan} for {level}s, {n} weeks, I need to {goal}",
+]
+
+
+def intents(rng):
+    combos = [(g, lvl, p) for g in GOALS for lvl in LEVELS for p in PLANS]
+    rng.shuffle(combos)
+    return combos[:40]
+
+
+async def run(n, scope):
+    rng = random.Random(3)
+    pool = intents(rng)
+    users = [(f"user-{u}", rng.uniform(60, 100), rng.randint(20, 60)) for u in range(50)]
+    now = [0.0]
+    results = ResultCache(InMemoryLRUCache(100_000, clock=lambda: now[0]), default_ttl=3600)
+    cache = SimilarityCache(results, LSHIndex(64, 16, 20_000, clock=lambda: now[0]), MinHasher(64), threshold=0.7, scope=scope, stat_buckets={"weight_kg": 2.5, "height_cm": 5.0, "age": 5.0})
+    exact_hits = similar_hits = false_hits = 0
+    seen = set()
+    lookup = 0.0
+    for i in range(n):
+        user, weight, age = rng.choice(users)
+        intent = rng.randrange(len(pool))
+        goal, level, plan = pool[intent]
+        prompt = rng.choice(PHRASINGS).format(n=4, level=level, plan=plan, goal=goal)
+        context = {"stats": {"weight": round(weight + rng.uniform(-0.4, 0.4), 1), "age": age}}
+        seen.add((user if scope == "user" else "*", intent, cache._locate("x", "", "", context)[0]))
+        key = serialization.digest(prompt, serialization.canonical(context), user)
+        if await results.get("workout_generator", key) is not None:
+            exact_hits += 1
+            continue
+        start = time.perf_counter()
+        found = await cache.get("workout_generator", user, prompt, context)
+        lookup += time.perf_counter() - start
+        if found is not None:
+            similar_hits += 1
+            false_hits += found["intent"] != intent
+            continue
+        await results.set("workout_generator", key, {"intent": intent})
+        cache.add("workout_generator", user, prompt, context, key)
+    print(f"scope={scope}: exact {exact_hits / n:6.1%}   exact + similar {(exact_hits + similar_hits) / n:6.1%}"
+          f"   (ceiling {1 - len(seen) / n:6.1%})   false hits {false_hits}   lookup {lookup / max(1, n - exact_hits) * 1e6:.0f} us")
+
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(f"{n} requests, 40 intents, 50 users; ceiling = repeats of (owner, intent, stats bucket)")
+    for scope in ("user", "global"):
+        await run(n, scope)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+# py
+"""Agent output validation throughput on large plans.
+
+"before" is the previous run_agent path: WorkoutPlan.model_validate_json and, when
+that fails, json.loads plus model_validate. "after" is the precompiled registry
+(TypeAdapter.validate_json straight into dicts). Timed on a clean completion, a fenced
+one (```json ... ```) that the old path rejected, and valid JSON that fails the schema,
+which the old path parsed twice. Run from the project root:
+
+    python benchmarks/bench_validation.py [exercises]
+"""
+import json
+import sys
+import timeit
+from typing import Any, Dict, List
+import _env  # noqa: F401
+from pydantic import BaseModel, Field, ValidationError
+from app.services.agent_outputs import validate_output
+
+
+class LegacyWorkoutPlan(BaseModel):
+    title: str
+    duration_minutes: int
+    difficulty: str = Field(..., pattern="^(beginner|intermediate|advanced)$")
+    exercises: List[Dict[str, Any]] = Field(..., min_length=1)
+    tips: List[str] = []
+    progression: Dict[str, str] = {}
+
+
+def legacy_validate(content: str) -> Dict:
+    try:
+        validated = LegacyWorkoutPlan.model_validate_json(content)
+    except Exception:
+        try:
+            validated = LegacyWorkoutPlan.model_validate(json.loads(content))
+        except Exception:
+            return {}
+    return validated.model_dump()
+
+
+def safe_validate(content: str) -> Dict:
+    try:
+        return validate_output("workout_generator", content)
+    except ValidationError:
+        return {}
+
+
+def plan_json(n: int) -> str:
+    return json.dumps({
+        "title": "12-week strength block",
+        "duration_minutes": 75,
+        "difficulty": "intermediate",
+        "exercises": [{"name": f"exercise {i}", "sets": 4, "reps": "8-10", "rest_seconds": 90, "notes": "Control the eccentric, full range of motion."} for i in range(n)],
+        "tips": ["Warm up for ten minutes", "Track every session"] * 5,
+        "progression": {f"week {w}": "add 2.5 kg to compound lifts" for w in range(1, 13)},
+    })
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    clean = plan_json(n)
+    fenced = f"```json\n{clean}\n```"
+    invalid = clean.replace('"intermediate"', '"expert"')  # valid JSON, fails the schema
+    print(f"WorkoutPlan with {n} exercises ({len(clean) / 1024:.0f} KiB)")
+    for label, content in (("clean", clean), ("fenced", fenced), ("invalid", invalid)):
+        before = min(timeit.repeat(lambda: legacy_validate(content), number=200, repeat=5)) / 200
+        after = min(timeit.repeat(lambda: safe_validate(content), number=200, repeat=5)) / 200
+        note = "" if legacy_validate(content) else "  (before: rejected)"
+        print(f"{label:<7} before {before * 1e6:9.0f} us  after {after * 1e6:9.0f} us  {1 / after:8.0f} plans/s{note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# py
+"""A deterministic local stand-in for the OpenAI chat-completions API.
+
+It serves `POST /v1/chat/completions` (plain and `stream=True`) with canned replies
+shaped like each agent's output schema. The agent is recognized by the
+"You are <agent>" line of the system prompt. It can also:
+
+- ask for a tool on the first turn of a request (`tool_call_rate`), then answer once
+  the tool result comes back;
+- wait before the first token, and again between chunks. The waits are drawn from
+  latency distributions: `fixed:0.2`, `uniform:0.1,0.5`, `lognormal:0.3,0.6` (median,
+  sigma) or `exp:0.2` (mean);
+- fail a request with an HTTP error (`errors={429: 0.05, 500: 0.01}`), optionally
+  with a `retry-after-ms` header. It can also fail the first `fail_first` attempts of
+  every distinct request, or cut a stream off halfway (`abort_rate`).
+
+Every random draw is seeded by (seed, request body, attempt number). A given request
+therefore gets the same fate however the load interleaves. A retried or hedged copy of
+it gets a fresh draw.
+
+Run it standalone and point the app at it with OPENAI_BASE_URL:
+
+    python benchmarks/fake_openai.py --port 8100 --ttft lognormal:0.3,0.5 --errors 429=0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_HTTP2=false python main.py
+
+Tests mount `create_app(...)` in-process through httpx.ASGITransport instead.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_DISTRIBUTIONS = ("fixed", "uniform", "lognormal", "exp")
+_YOU_ARE = re.compile(r"\bYou are (\w+)")
+
+
+@dataclass(frozen=True)
+class Latency:
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        kind, _, args = spec.partition(":")
+        if kind not in _DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        values = [float(v) for v in args.split(",") if v] or [0.0]
+        return cls(kind, values[0], values[1] if len(values) > 1 else 0.0)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return self.a * math.exp(rng.gauss(0.0, self.b)) if self.a > 0 else 0.0
+        if self.kind == "exp":
+            return rng.expovariate(1.0 / self.a) if self.a > 0 else 0.0
+        return self.a
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{self.a:g}" + (f",{self.b:g}" if self.kind in ("uniform", "lognormal") else "")
+
+
+@dataclass
+class FakeConfig:
+    seed: int = 1
+    ttft: Latency = field(default_factory=Latency)  # before the first token (or the whole reply when not streaming)
+    token_interval: Latency = field(default_factory=Latency)  # between streamed chunks
+    chunk_chars: int = 12  # characters of content per streamed chunk
+    items: int = 4  # exercises / meals per plan
+    tool_call_rate: float = 0.0
+    errors: Dict[int, float] = field(default_factory=dict)  # status -> probability per attempt
+    fail_first: int = 0  # the first N attempts at each distinct request fail with fail_status
+    fail_status: int = 500
+    retry_after: Optional[float] = None  # seconds, sent as retry-after-ms on 429/503
+    abort_rate: float = 0.0  # streams cut off halfway
+
+    def describe(self) -> Dict[str, Any]:
+        """Settings that change what a load run measures; stored with baselines."""
+        return {
+            "seed": self.seed, "ttft": str(self.ttft), "token_interval": str(self.token_interval),
+            "chunk_chars": self.chunk_chars, "items": self.items, "tool_call_rate": self.tool_call_rate,
+            "errors": {str(k): v for k, v in sorted(self.errors.items())}, "fail_first": self.fail_first,
+            "abort_rate": self.abort_rate,
+        }
+
+
+def parse_errors(spec: str) -> Dict[int, float]:
+    """`429=0.05,500=0.01` -> {429: 0.05, 500: 0.01}."""
+    errors = {}
+    for part in filter(None, spec.split(",")):
+        status, _, rate = part.partition("=")
+        errors[int(status)] = float(rate)
+    return errors
+
+
+def _agent_of(messages: List[Dict]) -> str:
+    # the shared preamble comes first, so the agent's own "You are <name>" is the last one
+    names = [m for message in messages if message.get("role") == "system" for m in _YOU_ARE.findall(message.get("content") or "")]
+    return names[-1] if names else "assistant"
+
+
+def reply_for(agent: str, rng: random.Random, items: int) -> str:
+    """Content a well-behaved model would send for `agent`: JSON for the structured agents, prose otherwise."""
+    if agent == "workout_generator":
+        moves = ["Squat", "Push-up", "Romanian deadlift", "Plank", "Lunge", "Row", "Overhead press", "Glute bridge"]
+        plan = {
+            "title": "Full body strength",
+            "duration_minutes": rng.choice([30, 40, 45, 60]),
+            "difficulty": rng.choice(["beginner", "intermediate", "advanced"]),
+            "exercises": [{"name": moves[i % len(moves)], "sets": 3, "reps": rng.choice(["8", "10", "12"])} for i in range(items)],
+            "tips": ["Warm up for five minutes first.", "You should rest 90 seconds between sets."],
+        }
+    elif agent == "nutrition_generator":
+        meals = ["Oats with berries", "Chicken and rice bowl", "Greek yogurt", "Salmon with vegetables", "Lentil soup", "Tofu stir fry"]
+        plan = {"meals": [{"name": meals[i % len(meals)], "calories": rng.randrange(250, 750, 10)} for i in range(items)], "notes": "Drink water with every meal."}
+    elif agent == "recovery_advisor":
+        plan = {"summary": "You should prioritise sleep and take rest days.", "sleep_hours": 8, "rest_days_per_week": 2, "recommendations": ["Keep a fixed bedtime.", "Walk on rest days."]}
+    elif agent == "habit_coach":
+        plan = {"summary": "I recommend stacking one small habit at a time.", "habits": [{"habit": "Drink a glass of water", "cue": "after waking up", "frequency": "daily"}]}
+    else:
+        return "Here is a short, general answer. You should keep a consistent routine."
+    return json.dumps(plan)
+
+
+class FakeOpenAI:
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self._attempts: Counter = Counter()  # request digest -> attempts seen
+        self.requests = 0
+        self.streams = 0
+        self.tool_calls = 0
+        self.errors: Counter = Counter()
+        self.aborted = 0
+
+    def _rng(self, body: Dict) -> Tuple[random.Random, int]:
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).digest()
+        attempt = self._attempts[digest]
+        self._attempts[digest] += 1
+        return random.Random(f"{self.config.seed}:{digest.hex()}:{attempt}"), attempt
+
+    def _error(self, rng: random.Random, attempt: int) -> Optional[int]:
+        if attempt < self.config.fail_first:
+            return self.config.fail_status
+        roll = rng.random()
+        for status, rate in sorted(self.config.errors.items()):
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+    def _error_response(self, status: int) -> JSONResponse:
+        self.errors[status] += 1
+        headers = {}
+        if status in (429, 503) and self.config.retry_after is not None:
+            headers["retry-after-ms"] = str(int(self.config.retry_after * 1000))
+        kind = "rate_limit_exceeded" if status == 429 else "server_error"
+        return JSONResponse({"error": {"message": f"Injected {status}", "type": kind, "code": kind}}, status_code=status, headers=headers)
+
+    def _wants_tool(self, body: Dict, rng: random.Random) -> bool:
+        messages = body.get("messages") or []
+        first_turn = not any(m.get("role") == "tool" for m in messages)
+        return bool(body.get("tools")) and body.get("tool_choice") != "none" and first_turn and rng.random() < self.config.tool_call_rate
+
+    async def complete(self, body: Dict) -> Any:
+        self.requests += 1
+        rng, attempt = self._rng(body)
+        status = self._error(rng, attempt)
+        if status is not None:
+            await asyncio.sleep(self.config.ttft.sample(rng) / 4)  # errors come back faster than answers
+            return self._error_response(status)
+        model = body.get("model", "fake-model")
+        tool_call = self._tool_call(rng) if self._wants_tool(body, rng) else None
+        content = None if tool_call else reply_for(_agent_of(body.get("messages") or []), rng, self.config.items)
+        if body.get("stream"):
+            self.streams += 1
+            usage = _usage(body, content) if (body.get("stream_options") or {}).get("include_usage") else None
+            return StreamingResponse(self._stream(rng, model, content, tool_call, usage), media_type="text/event-stream")
+        await asyncio.sleep(self.config.ttft.sample(rng))
+        message: Dict[str, Any] = {"role": "assistant", "content": content}
+        if tool_call:
+            message["tool_calls"] = [tool_call]
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+            "usage": _usage(body, content),
+        })
+
+    def _tool_call(self, rng: random.Random) -> Dict:
+        self.tool_calls += 1
+        name = rng.choice(["calculate_bmi", "calculate_macros"])
+        return {"id": f"call_{rng.getrandbits(48):012x}", "type": "function", "function": {"name": name, "arguments": "{}"}}
+
+    async def _stream(self, rng: random.Random, model: str, content: Optional[str], tool_call: Optional[Dict], usage: Optional[Dict] = None) -> AsyncIterator[bytes]:
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+
+        def frame(delta: Dict, finish: Optional[str] = None) -> bytes:
+            chunk = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            return b"data: " + json.dumps(chunk).encode() + b"\n\n"
+
+        # stream_options.include_usage: one last chunk with no choices and the request's usage
+        usage_frame = b"data: " + json.dumps({**base, "choices": [], "usage": usage}).encode() + b"\n\n" if usage else b""
+
+        await asyncio.sleep(self.config.ttft.sample(rng))
+        if tool_call is not None:
+            yield frame({"role": "assistant", "tool_calls": [{"index": 0, **tool_call}]})
+            yield frame({}, "tool_calls")
+            yield usage_frame + b"data: [DONE]\n\n"
+            return
+        step = max(1, self.config.chunk_chars)
+        pieces = [content[i:i + step] for i in range(0, len(content), step)]
+        abort_at = len(pieces) // 2 if rng.random() < self.config.abort_rate else None
+        for i, piece in enumerate(pieces):
+            if i == abort_at:
+                self.aborted += 1
+                raise ConnectionResetError("Injected stream abort")
+            if i:
+                await asyncio.sleep(self.config.token_interval.sample(rng))
+            yield frame({"role": "assistant", "content": piece} if i == 0 else {"content": piece})
+        yield frame({}, "stop")
+        yield usage_frame + b"data: [DONE]\n\n"
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "streams": self.streams, "tool_calls": self.tool_calls, "errors": dict(self.errors), "aborted": self.aborted}
+
+
+def _usage(body: Dict, content: Optional[str]) -> Dict[str, int]:
+    # about four characters per token, which is all the app reads usage for
+    prompt = sum(len(m.get("content") or "") for m in body.get("messages") or []) // 4
+    completion = len(content or "") // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def create_app(config: Optional[FakeConfig] = None) -> FastAPI:
+    fake = FakeOpenAI(config or FakeConfig())
+    app = FastAPI(title="fake-openai")
+    app.state.fake = fake
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await fake.complete(await request.json())
+
+    @app.get("/stats")
+    async def stats():
+        return fake.stats()
+
+    @app.api_route("/v1/", methods=["GET", "HEAD"])
+    async def root():
+        return {"status": "ok"}  # connection warm-up target
+
+    return app
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        seed=args.seed,
+        ttft=Latency.parse(args.ttft),
+        token_interval=Latency.parse(args.token_interval),
+        chunk_chars=args.chunk_chars,
+        items=args.items,
+        tool_call_rate=args.tool_call_rate,
+        errors=parse_errors(args.errors),
+        fail_first=args.fail_first,
+        fail_status=args.fail_status,
+        retry_after=args.retry_after,
+        abort_rate=args.abort_rate,
+    )
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ttft", default="lognormal:0.3,0.5", help="time to first token, e.g. fixed:0.2")
+    parser.add_argument("--token-interval", default="fixed:0.01")
+    parser.add_argument("--chunk-chars", type=int, default=12)
+    parser.add_argument("--items", type=int, default=4)
+    parser.add_argument("--tool-call-rate", type=float, default=0.0)
+    parser.add_argument("--errors", default="", help="status=probability pairs, e.g. 429=0.02,500=0.01")
+    parser.add_argument("--fail-first", type=int, default=0)
+    parser.add_argument("--fail-status", type=int, default=500)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--abort-rate", type=float, default=0.0)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# py
+"""End-to-end load test: the app under uvicorn, talking to the local fake OpenAI server.
+
+Starts benchmarks/fake_openai.py and `uvicorn main:app` as subprocesses. The app gets
+the in-memory DB, no result or similarity cache (so every request reaches the model)
+and no per-user rate limit. The script then drives one or more scenarios at each
+concurrency level, with that many clients in a closed loop:
+
+- stream:   POST /api/ai/stream-agent-response; TTFB is the first SSE byte
+- insights: POST /api/health/generate-insights; TTFB is the first response byte
+
+For each level it reports throughput, error count, TTFB and latency p50/p99, and the
+server's RSS growth per concurrent connection (peak RSS during the level minus RSS
+before it, read from /proc).
+
+Results can be saved as a baseline and later runs compared against it. A run whose
+throughput drops, or whose p99 latency or TTFB grows, by more than --tolerance exits
+with status 1. A missing baseline is an error (status 2) unless --save-baseline or
+--no-baseline is given. Baselines record the fake server's settings; comparing runs
+made with different settings only prints a warning. Run from the project root:
+
+    python benchmarks/load_test.py --scenarios stream,insights --concurrency 1,16,64
+    python benchmarks/load_test.py --save-baseline          # record benchmarks/baselines/load_test.json
+    python benchmarks/load_test.py --no-baseline            # report only
+    python benchmarks/load_test.py --ttft fixed:0.5 --errors 429=0.05 --baseline /tmp/slow.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import httpx
+from jose import jwt
+import _env  # noqa: F401
+from fake_openai import add_arguments as add_fake_arguments, config_from_args
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "load_test.json")
+JWT_SECRET = "load-test-jwt-secret"
+
+PROMPTS = {
+    "stream": "Plan my training and meals for this week, request {i}",
+    "insights": "How should I recover between sessions? Request {i}",
+}
+User = Tuple[str, Dict[str, str]]  # supabase_id, auth headers
+Sample = Tuple[float, float, bool]  # ttfb, latency, ok
+Request = Callable[[httpx.AsyncClient, User, int], Awaitable[Sample]]
+STATS = {"weight_kg": 80, "height_cm": 180, "age": 35, "sex": "male", "activity_level": "moderate", "goal": "maintain"}  # lets the tools compute
+# (metric, True if higher is better) compared against the baseline
+COMPARED = (("throughput", True), ("latency_p99_ms", False), ("ttfb_p99_ms", False))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_kib(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+async def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{url} exited with status {proc.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_servers(args: argparse.Namespace) -> Tuple[subprocess.Popen, str, subprocess.Popen, str]:
+    fake_port, app_port = free_port(), free_port()
+    fake_cmd = [sys.executable, os.path.join(ROOT, "benchmarks", "fake_openai.py"), "--port", str(fake_port)] + args.fake_argv
+    fake = subprocess.Popen(fake_cmd)
+    env = {
+        **os.environ,
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "OPENAI_API_KEY": "load-test",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "OPENAI_HTTP2": "false",
+        "DB_BACKEND": "memory",
+        "CACHE_DEFAULT_TTL": "0",
+        "SIMILARITY_CACHE_THRESHOLD": "0",
+        "RATE_LIMIT_TOKENS": "1000000000",
+        "RATE_LIMIT_RATE": "1000000000",
+        "LOG_LEVEL": "WARNING",
+    }
+    app_cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning", "--no-access-log"]
+    app = subprocess.Popen(app_cmd, cwd=ROOT, env=env)
+    return fake, f"http://127.0.0.1:{fake_port}", app, f"http://127.0.0.1:{app_port}"
+
+
+async def register_users(client: httpx.AsyncClient, users: int) -> List[User]:
+    """Profiles for `users` load-test users; returns (supabase_id, auth headers) pairs."""
+    exp = int(time.time()) + 3600
+    out = []
+    for u in range(users):
+        supabase_id = f"load-user-{u}"
+        profile = {"supabase_id": supabase_id, "email": None, "full_name": None, "birth_date": None, "gender": None}
+        (await client.post("/api/users/profile", json=profile)).raise_for_status()
+        token = jwt.encode({"sub": supabase_id, "exp": exp, "role": "authenticated"}, JWT_SECRET, algorithm="HS256")
+        out.append((supabase_id, {"Authorization": f"Bearer {token}"}))
+    return out
+
+
+async def _timed_post(client: httpx.AsyncClient, path: str, headers: Dict[str, str], body: Dict, check: Callable[[bytes], bool]) -> Sample:
+    start = time.perf_counter()
+    ttfb = None
+    received = bytearray()
+    async with client.stream("POST", path, json=body, headers=headers) as resp:
+        async for chunk in resp.aiter_raw():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            received += chunk
+        ok = resp.status_code == 200 and check(bytes(received))
+    latency = time.perf_counter() - start
+    return (ttfb if ttfb is not None else latency), latency, ok
+
+
+async def stream_request(client: httpx.AsyncClient, user: User, i: int) -> Sample:
+    supabase_id, headers = user
+    body = {"supabase_id": supabase_id, "prompt": PROMPTS["stream"].format(i=i)}
+    return await _timed_post(client, "/api/ai/stream-agent-response", headers, body, lambda b: b'"stage":"complete"' in b and b'"stage":"error"' not in b)
+
+
+async def insights_request(client: httpx.AsyncClient, user: User, i: int) -> Sample:
+    supabase_id, headers = user
+    body = {"supabase_id": supabase_id, "prompt": PROMPTS["insights"].format(i=i), "context": {"stats": STATS}}
+    return await _timed_post(client, "/api/health/generate-insights", headers, body, lambda b: b'"error"' not in b)
+
+
+SCENARIOS: Dict[str, Request] = {"stream": stream_request, "insights": insights_request}
+
+
+async def run_level(client: httpx.AsyncClient, request: Request, users: List[User], concurrency: int, total: int, app_pid: Optional[int]) -> Dict:
+    counter = iter(range(total))
+    samples: List[Sample] = []
+    rss_before = rss_kib(app_pid) if app_pid else None
+    peak = [rss_before or 0]
+    done = asyncio.Event()
+
+    async def sample_rss():
+        while not done.is_set():
+            peak[0] = max(peak[0], rss_kib(app_pid) or 0)
+            await asyncio.sleep(0.02)
+
+    async def worker():
+        for i in counter:
+            try:
+                samples.append(await request(client, users[i % len(users)], i))
+            except httpx.HTTPError:
+                samples.append((0.0, 0.0, False))
+
+    sampler = asyncio.create_task(sample_rss()) if rss_before is not None else None
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    if sampler is not None:
+        await sampler
+    ok = [s for s in samples if s[2]]
+    ms = lambda v: round(v * 1000, 1) if v is not None else None  # noqa: E731
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "throughput": round(len(ok) / elapsed, 2),
+        "ttfb_p50_ms": ms(percentile([s[0] for s in ok], 0.5)),
+        "ttfb_p99_ms": ms(percentile([s[0] for s in ok], 0.99)),
+        "latency_p50_ms": ms(percentile([s[1] for s in ok], 0.5)),
+        "latency_p99_ms": ms(percentile([s[1] for s in ok], 0.99)),
+        "kib_per_connection": round((peak[0] - rss_before) / concurrency, 1) if rss_before is not None else None,
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """Human-readable regressions of `results` against `baseline["results"]`."""
+    regressions = []
+    for key, run in results.items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED:
+            old, new = base.get(metric), run.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            print(f"  {key:<14} {metric:<15} {old:>9} -> {new:>9}  ({change:+.1%})")
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{key} {metric} {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    fake, fake_url, app, base_url = start_servers(args)
+    try:
+        await wait_ready(f"{fake_url}/stats", fake)
+        await wait_ready(f"{base_url}/health", app)
+        max_c = max(args.concurrency)
+        limits = httpx.Limits(max_connections=max_c, max_keepalive_connections=max_c)
+        timeout = httpx.Timeout(args.timeout, connect=5.0)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+            users = await register_users(client, args.users)
+            results: Dict[str, Dict] = {}
+            print(f"{'scenario':<9} {'conc':>5} {'reqs':>6} {'err':>4} {'req/s':>8} {'ttfb p50':>9} {'ttfb p99':>9} {'lat p50':>9} {'lat p99':>9} {'KiB/conn':>9}")
+            for name in args.scenarios:
+                request = SCENARIOS[name]
+                await run_level(client, request, users, min(4, max_c), min(8, args.requests), None)  # warm-up, not reported
+                for concurrency in args.concurrency:
+                    total = max(args.requests, concurrency * 2)
+                    r = await run_level(client, request, users, concurrency, total, app.pid)
+                    results[f"{name}@{concurrency}"] = r
+                    print(f"{name:<9} {concurrency:>5} {r['requests']:>6} {r['errors']:>4} {r['throughput']:>8} {r['ttfb_p50_ms']!s:>9} {r['ttfb_p99_ms']!s:>9} "
+                          f"{r['latency_p50_ms']!s:>9} {r['latency_p99_ms']!s:>9} {r['kib_per_connection']!s:>9}")
+    finally:
+        for proc in (app, fake):
+            proc.terminate()
+            proc.wait(10)
+
+    fake_settings = config_from_args(args).describe()
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({"recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "fake": fake_settings, "results": results}, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if args.no_baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print(f"compared with {args.baseline} ({baseline.get('recorded_at')}):")
+    if baseline.get("fake") != fake_settings:
+        print("  warning: the baseline was recorded with different fake server settings")
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", default="stream,insights", type=lambda s: s.split(","))
+    parser.add_argument("--concurrency", default="1,8,32", type=lambda s: [int(c) for c in s.split(",")])
+    parser.add_argument("--requests", type=int, default=64, help="requests per level (at least 2x its concurrency)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--no-baseline", action="store_true", help="only report; skip the baseline comparison")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative change before a metric counts as a regression")
+    fake_group = parser.add_argument_group("fake OpenAI server")
+    add_fake_arguments(fake_group)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if not (args.save_baseline or args.no_baseline or os.path.exists(args.baseline)):
+        # checked before the run so a missing baseline never passes as "no regressions"
+        parser.error(f"no baseline at {args.baseline}: record one with --save-baseline, or pass --no-baseline to only report")
+    # forwarded verbatim to the fake server process
+    args.fake_argv = [a for action in fake_group._group_actions for a in (action.option_strings[0], str(getattr(args, action.dest))) if getattr(args, action.dest) is not None]
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
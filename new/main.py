@@ -6,19 +6,48 @@ from app.core.config import get_settings
 from app.core.logging import configure_logging
 from app.middleware import register_middleware
 from app.api.router import api_router
-from fastapi.responses import JSONResponse
+from app.db.repository import close_repository
+from app.db.write_behind import get_insight_writer, close_insight_writer
+from app.services.openai_client import openai_client
+from app.core.jobs import close_job_queue
+from app.core import metrics
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.core.serialization import FastJSONResponse
 
 settings = get_settings()
 configure_logging(settings.LOG_LEVEL)
 
-app = FastAPI(title="health-ai-backend", version="1.0.0")
+app = FastAPI(title="health-ai-backend", version="1.0.0", default_response_class=FastJSONResponse)
 register_middleware(app)
 
 app.include_router(api_router, prefix="/api")
 
+@app.on_event("startup")
+async def startup():
+    if settings.INSIGHTS_WRITE_BEHIND:
+        await get_insight_writer().start()  # replays the spool, if any
+    if settings.OPENAI_WARMUP_CONNECTIONS > 0:
+        await openai_client.warm_up()
+    if settings.METRICS_ENABLED:
+        metrics.get_loop_monitor(settings.METRICS_LOOP_LAG_INTERVAL).start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await metrics.get_loop_monitor().stop()
+    await close_job_queue()  # stop workers before the clients they use are closed
+    await close_insight_writer()  # flush pending inserts before the pool closes
+    await close_repository()
+    await openai_client.aclose()
+
 @app.get("/health", response_class=JSONResponse)
 async def health_check():
     return {"status": "ok", "service": "health-ai-backend", "version": "1.0.0"}
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics_endpoint():
+        # Prometheus text exposition; this worker's numbers only
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=int(settings.PORT), log_level=settings.LOG_LEVEL)
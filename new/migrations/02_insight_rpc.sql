@@ -0,0 +1,16 @@
+-- sql
+-- Insert a health insight for a user identified by supabase_id in one statement,
+-- so the API does not need a separate users_profiles lookup first.
+CREATE OR REPLACE FUNCTION create_health_insight_for(
+  p_supabase_id text,
+  p_request_payload jsonb,
+  p_agents_output jsonb,
+  p_aggregated_output text,
+  p_confidence numeric
+) RETURNS SETOF health_insights
+LANGUAGE sql AS $$
+  INSERT INTO health_insights (user_id, request_payload, agents_output, aggregated_output, confidence)
+  SELECT id, p_request_payload, p_agents_output, p_aggregated_output, p_confidence
+  FROM users_profiles WHERE supabase_id = p_supabase_id
+  RETURNING *;
+$$;
@@ -0,0 +1,5 @@
+-- sql
+-- Serves GET /health/insights keyset pages: WHERE user_id = ? AND (created_at, id) < (?, ?)
+-- ORDER BY created_at DESC, id DESC LIMIT ?
+CREATE INDEX IF NOT EXISTS idx_health_insights_user_created_id
+  ON health_insights (user_id, created_at DESC, id DESC);
@@ -0,0 +1,18 @@
+-- sql
+-- Multi-row insert used by the write-behind queue. Ids are allocated by the API, so
+-- replays after a crash are idempotent; the owning profile is resolved by supabase_id.
+CREATE OR REPLACE FUNCTION create_health_insights_bulk(p_rows jsonb) RETURNS integer
+LANGUAGE sql AS $$
+  WITH inserted AS (
+    INSERT INTO health_insights (id, user_id, request_payload, agents_output, aggregated_output, confidence, created_at)
+    SELECT r.id, p.id, r.request_payload, r.agents_output, r.aggregated_output, r.confidence, COALESCE(r.created_at, now())
+    FROM jsonb_to_recordset(p_rows) AS r(
+      id uuid, supabase_id text, request_payload jsonb, agents_output jsonb,
+      aggregated_output text, confidence numeric, created_at timestamptz
+    )
+    JOIN users_profiles p ON p.supabase_id = r.supabase_id
+    ON CONFLICT (id) DO NOTHING
+    RETURNING 1
+  )
+  SELECT count(*)::integer FROM inserted;
+$$;
@@ -0,0 +1,51 @@
+# py
+import os
+import pytest
+
+# Settings are read at import time; give the test run harmless values.
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-service-key")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "test-jwt-secret")
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("DB_BACKEND", "memory")
+
+
+@pytest.fixture(autouse=True)
+async def _reset_result_cache():
+    from app.core.cache import get_result_cache
+    from app.services.similarity_cache import get_similarity_cache
+    await get_result_cache().clear()
+    if get_similarity_cache() is not None:
+        get_similarity_cache().clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+async def _reset_repository():
+    from app.db.repository import close_repository
+    yield
+    await close_repository()
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """Routes openai_client to the in-process fake server, as user "e2e-user"; call it with a FakeConfig."""
+    import httpx
+    from openai import AsyncOpenAI
+    from main import app
+    from app.api.deps import get_current_user
+    from app.services.openai_client import openai_client
+    from benchmarks.fake_openai import create_app
+
+    def use(config):
+        fake_app = create_app(config)
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_app), base_url="http://fake-openai")
+        monkeypatch.setattr(openai_client, "client", AsyncOpenAI(api_key="fake", base_url="http://fake-openai/v1", http_client=http, max_retries=0))
+        return fake_app.state.fake
+
+    async def user():
+        return {"supabase_id": "e2e-user"}
+
+    app.dependency_overrides[get_current_user] = user
+    yield use
+    app.dependency_overrides.clear()
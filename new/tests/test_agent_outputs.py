@@ -0,0 +1,36 @@
+# py
+import pytest
+from pydantic import BaseModel, ValidationError
+from unittest.mock import AsyncMock, patch
+from app.services import agent_outputs
+from app.services.agents import AgentOrchestrator
+from app.services.openai_client import openai_client
+
+PLAN = '{"title": "Legs", "duration_minutes": 40, "difficulty": "advanced", "exercises": [{"name": "squat", "sets": 5}]}'
+
+
+def test_structured_agents_validate_in_one_pass_including_fenced_json():
+    plan = agent_outputs.validate_output("workout_generator", f"```json\n{PLAN}\n```")
+    assert plan["exercises"] == [{"name": "squat", "sets": 5}]
+    assert agent_outputs.validate_output("nutrition_generator", {"meals": [{"name": "oats", "kcal": 300}]})["meals"][0]["kcal"] == 300
+    with pytest.raises(ValidationError):
+        agent_outputs.validate_output("workout_generator", '{"title": "no exercises"}')
+
+
+def test_advice_agents_fall_back_to_text_and_unknown_agents_are_text():
+    assert agent_outputs.validate_output("habit_coach", "Walk after dinner.") == {"text": "Walk after dinner."}
+    habits = agent_outputs.validate_output("habit_coach", '{"summary": "Small steps", "habits": [{"habit": "walk", "cue": "after dinner"}]}')
+    assert habits["habits"][0] == {"habit": "walk", "cue": "after dinner"}
+    assert agent_outputs.validate_output("nobody", "hi") == {"text": "hi"}
+
+
+async def test_new_agents_plug_in_through_the_registry(monkeypatch):
+    class SleepLog(BaseModel):
+        hours: float
+
+    monkeypatch.setitem(agent_outputs.OUTPUT_SPECS, "sleep_tracker", agent_outputs.OutputSpec(SleepLog))  # BaseModel shapes work too
+    with patch.object(openai_client, "call_with_tools", new_callable=AsyncMock) as mock_call:
+        mock_call.return_value = {"choices": [{"message": {"content": '{"hours": 7.5}'}}]}
+        result = await AgentOrchestrator("u").run_agent("sleep_tracker", "log", {})
+    assert result == {"hours": 7.5}
+    assert '"hours"' in mock_call.await_args.args[0][0]["content"]  # schema is in the system prompt
@@ -21,24 +21,91 @@
 #     assert "agents" in result and "aggregated_output" in result and "confidence" in result
 #     assert len(result["agents"]) == 4
 
+import asyncio
 import pytest
 from unittest.mock import AsyncMock, patch
 from app.services.agents import AgentOrchestrator, WorkoutPlan
 from app.services.openai_client import openai_client
 
+PLAN_JSON = '{"title": "Test", "duration_minutes": 30, "difficulty": "beginner", "exercises": [{"name": "squat", "sets": 3, "reps": "10"}]}'
+
 @pytest.mark.asyncio
 async def test_run_agent():
     with patch.object(openai_client, 'call_with_tools', new_callable=AsyncMock) as mock_call:
-        mock_call.return_value = {"choices": [{"message": {"content": '{"title": "Test", "duration_minutes": 30, "exercises": []}'}}]}
+        mock_call.return_value = {"choices": [{"message": {"content": PLAN_JSON}}]}
         orch = AgentOrchestrator("test_user")
         result = await orch.run_agent("workout_generator", "test prompt", {})
         assert isinstance(result, dict)
         assert result["title"] == "Test"
 
+@pytest.mark.asyncio
+async def test_run_agent_cache_shared_across_orchestrators():
+    with patch.object(openai_client, 'call_with_tools', new_callable=AsyncMock) as mock_call:
+        mock_call.return_value = {"choices": [{"message": {"content": PLAN_JSON}}]}
+        first = await AgentOrchestrator("test_user").run_agent("workout_generator", "test prompt", {"stats": {"weight": 80}})
+        second = await AgentOrchestrator("test_user").run_agent("workout_generator", "test prompt", {"stats": {"weight": 80}})
+        assert first == second
+        assert mock_call.await_count == 1
+        await AgentOrchestrator("other_user").run_agent("workout_generator", "test prompt", {"stats": {"weight": 80}})
+        assert mock_call.await_count == 2
+
+@pytest.mark.asyncio
+async def test_run_agent_coalesces_identical_in_flight_calls():
+    async def slow_call(*args, **kwargs):
+        await asyncio.sleep(0.01)
+        return {"choices": [{"message": {"content": PLAN_JSON}}]}
+
+    with patch.object(openai_client, 'call_with_tools', new_callable=AsyncMock) as mock_call:
+        mock_call.side_effect = slow_call
+        results = await asyncio.gather(*(AgentOrchestrator("test_user").run_agent("workout_generator", "burst", {}) for _ in range(4)))
+        assert mock_call.await_count == 1
+        assert all(r["title"] == "Test" for r in results)
+
 @pytest.mark.asyncio
 async def test_streaming():
-    # Mock streaming chunks
-    # Assert yields correct stages
-    pass
+    # Mock streaming chunks: the workout agent is fast, the nutrition agent is slow
+    async def fake_stream(messages, tools, stream=False):
+        slow = "nutrition" in messages[0]["content"]
+        body = '{"meals": [{"name": "oats"}]}' if slow else PLAN_JSON
+
+        async def gen():
+            for i in range(0, len(body), 16):
+                yield {"type": "content", "data": body[i:i + 16]}
+                await asyncio.sleep(0.02 if slow else 0)
+        return gen()
+
+    with patch.object(openai_client, 'call_with_tools', new_callable=AsyncMock) as mock_call:
+        mock_call.side_effect = fake_stream
+        orch = AgentOrchestrator("test_user")
+        events = [e async for e in orch.stream_concurrently(["workout_generator", "nutrition_generator"], "plan", {})]
+
+    # Assert yields correct stages: deltas interleaved, workout finishes before nutrition streams out
+    stages = [(e["stage"], e.get("agent")) for e in events]
+    assert stages.index(("done", "workout_generator")) < stages.index(("done", "nutrition_generator"))
+    assert ("delta", "nutrition_generator") in stages[:stages.index(("done", "workout_generator"))]
+    assert events[-1]["stage"] == "complete"
+    assert len(events[-1]["aggregated"]["action_plan"]) == 2
+    done = {e["agent"]: e["result"] for e in events if e["stage"] == "done"}
+    assert done["workout_generator"]["title"] == "Test"
+    assert done["nutrition_generator"]["meals"] == [{"name": "oats"}]
+
+
+async def test_closing_stream_with_full_queue_leaves_no_pump_tasks():
+    async def fake_stream(messages, tools, stream=False):
+        async def gen():
+            for _ in range(10_000):
+                yield {"type": "content", "data": "x"}
+        return gen()
+
+    with patch.object(openai_client, 'call_with_tools', new_callable=AsyncMock) as mock_call:
+        mock_call.side_effect = fake_stream
+        orch = AgentOrchestrator("test_user")
+        stream = orch.stream_concurrently(["workout_generator", "nutrition_generator"], "plan", {})
+        await stream.__anext__()
+        await asyncio.sleep(0.05)  # both pumps fill the queue and block on put
+        await stream.aclose()
+
+    pumps = [t for t in asyncio.all_tasks() if t.get_coro().__name__ == "_pump"]
+    assert pumps == []
 
 # Run: pytest tests/ -v
\ No newline at end of file
@@ -3,8 +3,9 @@ import pytest
 from httpx import AsyncClient
 from main import app
 from app.api.deps import get_current_user
-from app.services import agents
+from app.services import agents, supabase_service
 import asyncio
+import json
 
 @pytest.fixture
 def anyio_backend():
@@ -14,26 +15,70 @@ def anyio_backend():
 async def test_generate_insights_endpoint(monkeypatch):
     async def fake_current_user():
         return {"supabase_id": "test-user"}
-    monkeypatch.setattr("app.api.deps.get_current_user", lambda: fake_current_user())
+    app.dependency_overrides[get_current_user] = fake_current_user
     async def fake_run_agents_concurrently(context, prompt):
         return {"agents": [{"name":"nutrition","output":"ok","confidence":0.8}], "aggregated_output":"ok", "confidence":0.8}
     monkeypatch.setattr("app.services.agents.run_agents_concurrently", fake_run_agents_concurrently)
-    async with AsyncClient(app=app, base_url="http://test") as ac:
-        resp = await ac.post("/api/health/generate-insights", json={"supabase_id":"test-user","prompt":"hi","context":{}})
-        assert resp.status_code == 200
+    await supabase_service.upsert_user_profile("test-user", {})
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            resp = await ac.post("/api/health/generate-insights", json={"supabase_id":"test-user","prompt":"hi","context":{}})
+            assert resp.status_code == 200
+            listed = await ac.get("/api/health/insights")
+            assert listed.status_code == 200
+            assert [i["id"] for i in listed.json()] == [resp.json()["id"]]
+    finally:
+        app.dependency_overrides.clear()
 
 @pytest.mark.asyncio
 async def test_stream_agent_response(monkeypatch):
     async def fake_current_user():
         return {"supabase_id": "test-user"}
-    monkeypatch.setattr("app.api.deps.get_current_user", lambda: fake_current_user())
+    app.dependency_overrides[get_current_user] = fake_current_user
     # monkeypatch streaming to yield small chunks
-    async def fake_stream_orch(ctx, prompt):
+    async def fake_stream_orch(ctx, prompt, agents=None):
         for i in range(3):
             yield {"agent":"nutrition","chunk":f"part{i}"}
     monkeypatch.setattr("app.services.agents.stream_orchestrator", fake_stream_orch)
-    async with AsyncClient(app=app, base_url="http://test") as ac:
-        resp = await ac.post("/api/ai/stream-agent-response", json={"supabase_id":"test-user","prompt":"hi"})
-        assert resp.status_code == 200
-        text = await resp.aread()
-        assert b"data:" in text
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            resp = await ac.post("/api/ai/stream-agent-response", json={"supabase_id":"test-user","prompt":"hi"})
+            assert resp.status_code == 200
+            text = await resp.aread()
+            assert b"data:" in text
+    finally:
+        app.dependency_overrides.clear()
+
+@pytest.mark.asyncio
+async def test_insights_keyset_pagination_and_ndjson_export():
+    async def fake_current_user():
+        return {"supabase_id": "pager"}
+    app.dependency_overrides[get_current_user] = fake_current_user
+    await supabase_service.upsert_user_profile("pager", {})
+    created = [await supabase_service.create_health_insight("pager", {"big": "x" * 100}, {}, f"insight {i}", 0.5) for i in range(5)]
+    newest_first = [c["id"] for c in reversed(created)]
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            seen, cursor = [], None
+            while True:
+                resp = await ac.get("/api/health/insights", params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+                assert resp.status_code == 200
+                assert all(set(item) == {"id", "aggregated_output", "confidence", "created_at"} for item in resp.json())
+                seen += [item["id"] for item in resp.json()]
+                cursor = resp.headers.get("x-next-cursor")
+                if not cursor:
+                    break
+            assert seen == newest_first
+
+            export = await ac.get("/api/health/insights", params={"format": "ndjson"})
+            assert export.headers["content-type"].startswith("application/x-ndjson")
+            rows = [json.loads(line) for line in export.text.splitlines()]
+            assert [r["id"] for r in rows] == newest_first
+            assert "request_payload" not in rows[0]
+
+            assert (await ac.get("/api/health/insights", params={"cursor": "not-a-cursor"})).status_code == 400
+            bad_export = await ac.get("/api/health/insights", params={"format": "ndjson", "cursor": "not-a-cursor"})
+            assert bad_export.status_code == 400
+            assert not bad_export.headers["content-type"].startswith("application/x-ndjson")
+    finally:
+        app.dependency_overrides.clear()
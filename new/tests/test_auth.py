@@ -0,0 +1,52 @@
+# py
+import time
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from app.api.deps import get_current_user
+from app.core.config import get_settings
+from app.utils import validators
+from app.utils.validators import VerifiedTokenCache
+
+
+def make_token(sub="user-1", exp_in=3600):
+    return jwt.encode({"sub": sub, "exp": int(time.time()) + exp_in}, get_settings().SUPABASE_JWT_SECRET, algorithm="HS256")
+
+
+@pytest.mark.asyncio
+async def test_verified_tokens_skip_decode_on_repeat(monkeypatch):
+    calls = 0
+    real_verify = validators.verify_jwt
+
+    def counting_verify(token):
+        nonlocal calls
+        calls += 1
+        return real_verify(token)
+
+    monkeypatch.setattr(validators, "verify_jwt", counting_verify)
+    monkeypatch.setattr(validators, "_token_cache", VerifiedTokenCache(10, 300))
+    token = make_token()
+    for _ in range(3):
+        user = await get_current_user(authorization=f"Bearer {token}")
+        assert user["supabase_id"] == "user-1"
+    assert calls == 1
+    assert validators.jwt_cache_stats()["hits"] == 2
+
+    with pytest.raises(HTTPException) as err:
+        await get_current_user(authorization="Bearer not-a-jwt")
+    assert err.value.status_code == 401
+    assert validators.jwt_cache_stats()["rejections"] == 1
+
+
+def test_entries_expire_with_the_token():
+    cache = VerifiedTokenCache(max_entries=2, max_ttl=300)
+    cache.put(b"a", {"sub": "a", "exp": 1010}, now=1000)
+    assert cache.get(b"a", now=1009) is not None
+    assert cache.get(b"a", now=1010) is None
+    cache.put(b"b", {"sub": "b"}, now=1000)  # no exp: bounded by max_ttl
+    assert cache.get(b"b", now=1299) is not None and cache.get(b"b", now=1300) is None
+    cache.put(b"old", {"sub": "x", "exp": 900}, now=1000)  # already expired: never stored
+    assert cache.get(b"old", now=1000) is None
+    for key in (b"1", b"2", b"3"):
+        cache.put(key, {"exp": 5000}, now=1000)
+    assert cache.stats()["size"] == 2
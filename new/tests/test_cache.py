@@ -0,0 +1,63 @@
+# py
+import pytest
+from app.core.cache import InMemoryLRUCache, RedisCache, ResultCache
+from app.core.redis import InMemoryRedis
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_least_recently_used():
+    cache = InMemoryLRUCache(max_entries=2)
+    await cache.set("a", 1, ttl=60)
+    await cache.set("b", 2, ttl=60)
+    assert await cache.get("a") == 1  # "a" becomes most recent
+    await cache.set("c", 3, ttl=60)
+    assert await cache.get("b") is None
+    assert await cache.get("a") == 1 and await cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = InMemoryLRUCache(max_entries=10, clock=clock)
+    await cache.set("a", {"x": 1}, ttl=5)
+    clock.now = 4.9
+    assert await cache.get("a") == {"x": 1}
+    clock.now = 5.0
+    assert await cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_result_cache_per_agent_ttl_and_counters():
+    clock = FakeClock()
+    results = ResultCache(InMemoryLRUCache(10, clock=clock), default_ttl=10, agent_ttls={"habit_coach": 1, "no_cache": 0})
+    await results.set("workout_generator", "k1", {"plan": 1})
+    await results.set("habit_coach", "k2", {"tip": 1})
+    await results.set("no_cache", "k3", {"x": 1})
+    clock.now = 2
+    assert await results.get("workout_generator", "k1") == {"plan": 1}
+    assert await results.get("habit_coach", "k2") is None
+    assert await results.get("no_cache", "k3") is None
+    stats = results.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    assert stats["by_agent"]["habit_coach"] == {"hits": 0, "misses": 1}
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_round_trips_json():
+    client = InMemoryRedis()
+    cache = RedisCache(client, prefix="t:")
+    await cache.set("k", {"title": "Plan", "exercises": [1, 2]}, ttl=30)
+    assert await cache.get("k") == {"title": "Plan", "exercises": [1, 2]}
+    assert await client.get("t:k") is not None
+    await cache.clear()
+    assert await cache.get("k") is None
@@ -0,0 +1,62 @@
+# py
+import json
+import random
+import httpx
+import pytest
+from main import app
+from app.services import supabase_service
+from benchmarks.fake_openai import FakeConfig, FakeOpenAI, Latency, parse_errors, reply_for
+
+
+def _events(body: str):
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+def test_latency_specs_and_error_spec():
+    rng = random.Random(0)
+    assert Latency.parse("fixed:0.25").sample(rng) == 0.25
+    assert 0.1 <= Latency.parse("uniform:0.1,0.2").sample(rng) <= 0.2
+    assert Latency.parse("lognormal:0.3,0.5").sample(rng) > 0
+    assert str(Latency.parse("lognormal:0.3,0.5")) == "lognormal:0.3,0.5"
+    with pytest.raises(ValueError):
+        Latency.parse("gamma:1")
+    assert parse_errors("429=0.05,500=0.01") == {429: 0.05, 500: 0.01}
+
+
+async def test_fake_is_deterministic_per_request_and_attempt():
+    config = FakeConfig(seed=7, errors={500: 0.5})
+    body = {"model": "m", "messages": [{"role": "system", "content": "You are workout_generator, a coach."}, {"role": "user", "content": "plan"}]}
+    fates = []
+    for _ in range(2):
+        fake = FakeOpenAI(config)
+        fates.append([getattr(await fake.complete(body), "status_code", None) for _ in range(6)])
+    assert fates[0] == fates[1]
+    assert json.loads(reply_for("workout_generator", random.Random(1), 3))["exercises"][2]["name"]
+
+
+async def test_stream_agent_response_end_to_end(fake_openai):
+    fake_openai(FakeConfig(chunk_chars=7, items=3))
+    async with httpx.AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await ac.post("/api/ai/stream-agent-response", json={"supabase_id": "e2e-user", "prompt": "Plan my training and meals this week"})
+    assert resp.status_code == 200
+    events = _events(resp.text)
+    items = [e for e in events if e.get("stage") == "item"]
+    assert sorted((e["agent"], e["index"]) for e in items) == sorted([("workout_generator", i) for i in range(3)] + [("nutrition_generator", i) for i in range(3)])
+    done = {e["agent"]: e["result"] for e in events if e.get("stage") == "done"}
+    assert len(done["workout_generator"]["exercises"]) == 3
+    assert len(done["nutrition_generator"]["meals"]) == 3
+    assert events[-1]["stage"] == "complete"
+
+
+async def test_generate_insights_runs_tools_and_retries_throttling(fake_openai):
+    fake_api = fake_openai(FakeConfig(tool_call_rate=1.0, fail_first=1, fail_status=429, retry_after=0.01))
+    await supabase_service.upsert_user_profile("e2e-user", {})
+    async with httpx.AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await ac.post("/api/health/generate-insights", json={"supabase_id": "e2e-user", "prompt": "How should I recover between sessions?", "context": {}})
+    assert resp.status_code == 200
+    agents_output = resp.json()["agents_output"]
+    assert agents_output["recovery_advisor"]["data"]["sleep_hours"] == 8
+    assert agents_output["habit_coach"]["data"]["habits"][0]["habit"]
+    stats = fake_api.stats()
+    assert stats["tool_calls"] == 2  # one first-turn tool request per agent
+    assert stats["errors"] == {429: 4}  # each distinct request failed once, then was retried
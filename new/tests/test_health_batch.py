@@ -0,0 +1,54 @@
+# py
+import json
+import random
+import pytest
+from httpx import AsyncClient
+from main import app
+from app.api.deps import get_current_user
+from app.services import health_engine
+from app.services.health_batch import CATEGORY_LABELS, batch_metrics
+from app.utils.bmi import calculate_bmi, bmi_category
+
+
+def test_batch_matches_the_scalar_functions():
+    rng = random.Random(7)
+    rows = [(rng.uniform(40, 150), rng.uniform(145, 205), rng.randint(18, 80), rng.choice(["male", "female"]), rng.choice(["low", "moderate", "very_active"]), rng.choice(["lose", "maintain", "gain"])) for _ in range(500)]
+    out = batch_metrics(*(list(col) for col in zip(*rows)))
+    for i, (w, h, a, sex, activity, goal) in enumerate(rows):
+        bmi = calculate_bmi(w, h / 100)
+        assert out["bmi"][i] == pytest.approx(bmi, abs=0.011)
+        assert CATEGORY_LABELS[out["category"][i]] == bmi_category(out["bmi"][i])
+        expected = health_engine.calorie_target(health_engine.bmr_mifflin(w, h, a, sex), activity, goal)
+        assert abs(out["target_kcal"][i] - expected["target"]) <= 1
+
+
+def test_batch_rejects_bad_rows():
+    with pytest.raises(ValueError, match=r"rows \[1\]"):
+        batch_metrics([70, 0], [170, 170], [30, 30], ["m", "f"])
+    with pytest.raises(ValueError, match="activity_level"):
+        batch_metrics([70], [170], [30], ["m"], activity_level=["couch"])
+
+
+async def test_bulk_metrics_endpoint():
+    async def fake_current_user():
+        return {"supabase_id": "coach"}
+    app.dependency_overrides[get_current_user] = fake_current_user
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            body = {"weight_kg": [80, 55], "height_cm": [180, 170], "age": [30, 25], "sex": ["male", "female"], "goal": ["lose", "maintain"]}
+            resp = await ac.post("/api/health/metrics/batch", json=body)
+            assert resp.status_code == 200
+            data = resp.json()
+            assert data["count"] == 2
+            assert data["bmi"] == [24.69, 19.03]
+            assert [data["category_labels"][c] for c in data["category"]] == ["Normal weight", "Normal weight"]
+            assert data["target_kcal"][0] == 1636
+            mismatched = await ac.post("/api/health/metrics/batch", json={**body, "age": [30]})
+            assert mismatched.status_code == 422
+            for column in ("weight_kg", "height_cm", "age"):
+                for bad in (b"1e999", b"NaN", b"-Infinity"):
+                    raw = json.dumps({**body, column: [80, "BAD"]}).replace('"BAD"', bad.decode())
+                    resp = await ac.post("/api/health/metrics/batch", content=raw, headers={"content-type": "application/json"})
+                    assert resp.status_code == 422, (column, bad)
+    finally:
+        app.dependency_overrides.clear()
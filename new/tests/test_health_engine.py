@@ -0,0 +1,71 @@
+# py
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services import health_engine
+from app.services.agents import run_agents_concurrently
+from app.services.openai_client import openai_client
+from app.services.tools import ToolContext, registry
+
+STATS = {"weight": 80, "height": 1.8, "age": 30, "gender": "male", "activity_level": "moderate", "goal": "lose"}
+
+
+def test_calorie_and_macro_math():
+    assert health_engine.bmr_mifflin(80, 180, 30, "male") == 1780
+    assert health_engine.bmr_mifflin(60, 165, 30, "female") == 1320.25
+    assert health_engine.calorie_target(1780, "medium", "lose") == {"bmr": 1780, "tdee": 2759, "target": 2259}
+    macros = health_engine.macro_split(2000, 70, "maintain")
+    assert macros == {"calories": 2000, "protein_g": 112, "fat_g": 56, "carbs_g": 263}
+    with pytest.raises(ValueError):
+        health_engine.activity_factor("extreme")
+
+
+def test_only_purely_computational_prompts_are_answered_locally():
+    answer = health_engine.answer_locally("What is my BMI and how many calories should I eat?", {"stats": STATS})
+    assert answer["data"]["bmi"] == {"bmi": 24.69, "category": "Normal weight"}
+    assert answer["data"]["calories"]["target"] == 2259
+    assert "BMI: 24.69" in answer["text"]
+    assert health_engine.answer_locally("Build me a workout plan to lower my BMI", {"stats": STATS}) is None
+    assert health_engine.answer_locally("What are my macros?", {"stats": {"weight": 80}}) is None  # not enough stats
+    assert health_engine.answer_locally("How are you?", {"stats": STATS}) is None
+
+
+@pytest.mark.parametrize("prompt", [
+    "How many calories are in a banana?",
+    "What is a healthy BMI for a child?",
+    "How many calories did I burn on my 5k run?",
+    "what lowers metabolic rate",
+    "what lowers my metabolic rate",
+    "What is the normal BMI range?",
+    "How many calories does my wife need?",
+    "How many calories does running burn?",
+    "What are macros?",
+])
+def test_questions_not_about_the_users_own_numbers_go_to_the_model(prompt):
+    assert health_engine.detect_intents(prompt) == []
+    assert health_engine.answer_locally(prompt, {"stats": STATS}) is None
+
+
+@pytest.mark.parametrize("prompt, intents", [
+    ("what's my bmi", ["bmi"]),
+    ("How many calories should I eat?", ["calories"]),
+    ("what is my TDEE", ["calories"]),
+    ("my macros please", ["macros"]),
+])
+def test_self_referential_questions_are_detected(prompt, intents):
+    assert health_engine.detect_intents(prompt) == intents
+
+
+async def test_fast_path_skips_the_model():
+    with patch.object(openai_client, "call_with_tools", new_callable=AsyncMock) as mock_call:
+        result = await run_agents_concurrently({"supabase_id": "u", **STATS}, "my macros please")
+    assert mock_call.await_count == 0
+    assert result["confidence"] == 1.0
+    assert result["agents"][0]["data"]["macros"]["protein_g"] == 160
+
+
+async def test_engine_backs_the_tool_handlers():
+    ctx = ToolContext("u", {"stats": STATS})
+    assert (await registry.call("calculate_bmi", {}, ctx))["category"] == "Normal weight"
+    assert (await registry.call("calculate_macros", {"calories": 2000, "goal": "maintain"}, ctx))["protein_g"] == 128
+    estimate = await registry.call("estimate_calories", {"calories_in": 2500, "activity_level": "low"}, ctx)
+    assert estimate["estimated_need_kcal"] == 2136
@@ -0,0 +1,66 @@
+# py
+import asyncio
+import httpx
+import pytest
+from app.core.http_pool import pooled_client, warm_up
+
+
+async def _serve(delay: float = 0.0):
+    """Minimal keep-alive HTTP/1.1 server answering every request with 200 ok."""
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if not head:
+                    break
+                await asyncio.sleep(delay)
+                body = b"" if head.startswith(b"HEAD") else b"ok"
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n" + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+
+def _client(**overrides):
+    opts = dict(max_connections=4, max_keepalive=4, keepalive_expiry=30.0, http2=False, connect_timeout=1.0, read_timeout=1.0, pool_timeout=1.0)
+    opts.update(overrides)
+    return pooled_client(**opts)
+
+
+@pytest.mark.asyncio
+async def test_connections_reused_and_warmed():
+    server, url = await _serve()
+    client = _client()
+    try:
+        assert await warm_up(client, url, 3) == 3
+        assert client._transport.stats()["open"] == 3
+        for _ in range(10):
+            assert (await client.get(url)).text == "ok"
+        stats = client._transport.stats()
+        assert stats["connects"] == 3 and stats["requests"] == 13
+        assert stats["busy"] == 0 and stats["idle"] == 3
+    finally:
+        await client.aclose()
+        server.close()
+
+
+@pytest.mark.asyncio
+async def test_full_pool_fails_fast_and_is_counted():
+    server, url = await _serve(delay=0.3)
+    client = _client(max_connections=1, pool_timeout=0.05)
+    try:
+        first = asyncio.create_task(client.get(url))
+        await asyncio.sleep(0.05)
+        assert client._transport.stats()["utilization"] == 1.0
+        with pytest.raises(httpx.PoolTimeout):
+            await client.get(url)
+        assert (await first).text == "ok"
+        assert client._transport.stats()["pool_timeouts"] == 1
+    finally:
+        await client.aclose()
+        server.close()
@@ -0,0 +1,113 @@
+# py
+import asyncio
+import json
+import pytest
+from httpx import AsyncClient
+from main import app
+from app.api.deps import get_current_user
+from app.core.jobs import FAILED, SUCCEEDED, InProcessJobQueue, JobQueueFull, close_job_queue, register_job
+from app.services import supabase_service
+
+running = {"now": 0, "peak": 0}
+state = {}
+
+
+@register_job("test_echo")
+async def _echo(payload, progress):
+    running["now"] += 1
+    running["peak"] = max(running["peak"], running["now"])
+    try:
+        progress({"stage": "halfway"})
+        await state["gate"].wait()
+        if payload.get("fail"):
+            raise RuntimeError("boom")
+        return payload["value"]
+    finally:
+        running["now"] -= 1
+
+
+@pytest.fixture(autouse=True)
+async def _fresh_queue():
+    state["gate"] = asyncio.Event()  # per test: events bind to the running loop
+    running.update(now=0, peak=0)
+    yield
+    await close_job_queue()
+
+
+@pytest.mark.asyncio
+async def test_bounded_concurrency_dedup_and_events():
+    queue = InProcessJobQueue(concurrency=2, max_pending=10, result_ttl=60)
+    jobs = [await queue.submit("test_echo", {"value": i}, dedup_key=f"k{i}") for i in range(4)]
+    again = await queue.submit("test_echo", {"value": 0}, dedup_key="k0")
+    assert again is jobs[0] and queue.deduplicated == 1
+    await asyncio.sleep(0.01)
+    assert running["now"] == 2 and queue.stats()["queued"] == 2
+
+    seen = []
+
+    async def follow():
+        async for event in queue.events(jobs[0].id):
+            seen.append(event["stage"])
+    follower = asyncio.create_task(follow())
+    state["gate"].set()
+    await asyncio.wait_for(follower, 1)
+    while queue.running:
+        await asyncio.sleep(0.01)
+    assert seen == ["queued", "running", "halfway", "succeeded"]
+    assert [j.result for j in jobs] == [0, 1, 2, 3] and running["peak"] == 2
+    # finished jobs still deduplicate within the TTL
+    assert await queue.submit("test_echo", {"value": 0}, dedup_key="k0") is jobs[0]
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_not_reused_and_queue_is_bounded():
+    queue = InProcessJobQueue(concurrency=1, max_pending=1, result_ttl=60)
+    failing = await queue.submit("test_echo", {"fail": True}, dedup_key="same")
+    await asyncio.sleep(0.01)
+    await queue.submit("test_echo", {"value": 1})
+    with pytest.raises(JobQueueFull):
+        await queue.submit("test_echo", {"value": 2})
+    state["gate"].set()
+    while queue.running or queue.stats()["queued"]:
+        await asyncio.sleep(0.01)
+    assert failing.status == FAILED and failing.error == "boom"
+    retry = await queue.submit("test_echo", {"value": 3}, dedup_key="same")
+    assert retry is not failing
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_insight_job_endpoints(monkeypatch):
+    async def fake_current_user():
+        return {"supabase_id": "job-user"}
+
+    async def fake_run_agents_concurrently(context, prompt, progress=None):
+        progress({"stage": "agent_done", "agent": "habit_coach", "completed": 1, "total": 1})
+        return {"agents": [{"name": "habit_coach", "output": "ok", "confidence": 0.7}], "aggregated_output": "ok", "confidence": 0.7}
+
+    app.dependency_overrides[get_current_user] = fake_current_user
+    monkeypatch.setattr("app.services.agents.run_agents_concurrently", fake_run_agents_concurrently)
+    await supabase_service.upsert_user_profile("job-user", {})
+    body = {"supabase_id": "job-user", "prompt": "sleep better", "context": {"stats": {"age": 30}}}
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            submitted = await ac.post("/api/health/insight-jobs", json=body)
+            assert submitted.status_code == 202
+            job_id = submitted.json()["id"]
+            assert submitted.headers["location"].endswith(job_id)
+            assert (await ac.post("/api/health/insight-jobs", json=body)).json()["id"] == job_id
+
+            events = await ac.get(f"/api/health/insight-jobs/{job_id}/events")
+            stages = [json.loads(line[6:])["stage"] for line in events.text.splitlines() if line.startswith("data: ")]
+            assert stages[-3:] == ["agent_done", "saved", "succeeded"]
+
+            polled = (await ac.get(f"/api/health/insight-jobs/{job_id}")).json()
+            assert polled["status"] == SUCCEEDED and polled["result"]["aggregated_output"] == "ok"
+            listed = await ac.get("/api/health/insights")
+            assert [i["id"] for i in listed.json()] == [polled["result"]["id"]]
+
+            app.dependency_overrides[get_current_user] = lambda: {"supabase_id": "someone-else"}
+            assert (await ac.get(f"/api/health/insight-jobs/{job_id}")).status_code == 404
+    finally:
+        app.dependency_overrides.clear()
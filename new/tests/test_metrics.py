@@ -0,0 +1,125 @@
+# py
+import asyncio
+import re
+import time
+import httpx
+import pytest
+from main import app
+from app.core import metrics
+from app.core.metrics import Registry, LoopLagMonitor, timed
+from app.core.rate_limiter import allow_request
+from app.services import supabase_service
+from benchmarks.fake_openai import FakeConfig
+
+
+def _sample(text: str, name: str, **labels) -> float:
+    """Value of the sample `name` whose labels include `labels` (0 if absent)."""
+    for line in text.splitlines():
+        m = re.match(r"^(\w+)(?:\{(.*)\})? (\S+)$", line)
+        if not m or m.group(1) != name:
+            continue
+        have = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', m.group(2) or ""))
+        if all(have.get(k) == v for k, v in labels.items()):
+            return float(m.group(3))
+    return 0.0
+
+
+def test_histogram_and_counter_render_in_prometheus_format():
+    registry = Registry()
+    latency = registry.histogram("op_seconds", "Op latency", ("op",), buckets=(0.1, 1.0))
+    calls = registry.counter("ops", "Ops", ("op", "result"))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, 'say "hi"')
+    calls.inc("read", "ok")
+    calls.inc("read", "ok", amount=2)
+    text = registry.render()
+    assert "# TYPE op_seconds histogram" in text
+    assert 'op_seconds_bucket{op="say \\"hi\\"",le="0.1"} 2' in text  # le is inclusive
+    assert 'op_seconds_bucket{op="say \\"hi\\"",le="1"} 3' in text
+    assert 'op_seconds_bucket{op="say \\"hi\\"",le="+Inf"} 4' in text
+    assert 'op_seconds_count{op="say \\"hi\\""} 4' in text
+    assert 'ops_total{op="read",result="ok"} 3' in text
+    with pytest.raises(ValueError):
+        calls.inc("read")
+    with pytest.raises(ValueError):
+        registry.counter("ops", "again")
+
+
+async def test_timed_records_outcome_by_function():
+    hist = Registry().histogram("calls_seconds", "Calls", ("function", "outcome"))
+
+    @timed(hist)
+    async def lookup(fail: bool):
+        if fail:
+            raise KeyError("missing")
+        return 1
+
+    assert await lookup(False) == 1
+    with pytest.raises(KeyError):
+        await lookup(True)
+    assert hist.count("lookup", "ok") == 1
+    assert hist.count("lookup", "error") == 1
+
+
+async def test_loop_lag_monitor_sees_a_blocked_loop():
+    hist = Registry().histogram("lag_seconds", "Lag", buckets=metrics.LAG_BUCKETS)
+    monitor = LoopLagMonitor(hist, interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.02)
+    time.sleep(0.06)  # blocks the loop, as a CPU-bound handler would
+    await asyncio.sleep(0.03)
+    await monitor.stop()
+    assert hist.count() >= 2
+    assert monitor.max_lag >= 0.04
+
+
+async def test_metrics_endpoint_covers_the_hot_paths(fake_openai):
+    fake_openai(FakeConfig(chunk_chars=9))
+    await supabase_service.upsert_user_profile("e2e-user", {})
+    assert await allow_request("metrics-user")
+    async with httpx.AsyncClient(app=app, base_url="http://test") as ac:
+        stream = await ac.post("/api/ai/stream-agent-response", json={"supabase_id": "e2e-user", "prompt": "Plan my training and meals this week"})
+        assert stream.status_code == 200
+        insights = await ac.post("/api/health/generate-insights", json={"supabase_id": "e2e-user", "prompt": "How should I recover between sessions?", "context": {}})
+        assert insights.status_code == 200
+        resp = await ac.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    text = resp.text
+    model = "gpt-4o-mini"
+    assert _sample(text, "llm_request_duration_seconds_count", agent="workout_generator", model=model, mode="stream") >= 1
+    assert _sample(text, "llm_request_duration_seconds_count", agent="habit_coach", model=model, mode="complete") >= 1
+    assert _sample(text, "llm_time_to_first_token_seconds_count", agent="nutrition_generator") >= 1
+    assert _sample(text, "llm_tokens_total", agent="recovery_advisor", kind="prompt") > 0
+    assert _sample(text, "llm_tokens_total", agent="workout_generator", kind="completion") > 0
+    assert _sample(text, "llm_tokens_total", agent="workout_generator", kind="prompt") > 0  # streams report usage too
+    assert _sample(text, "sse_time_to_first_byte_seconds_count") >= 1
+    assert _sample(text, "sse_stream_duration_seconds_count") >= 1
+    assert _sample(text, "db_call_duration_seconds_count", function="create_health_insight", outcome="ok") >= 1
+    assert _sample(text, "rate_limit_decisions_total", backend="memory", decision="allow") >= 1
+    assert _sample(text, "cache_requests_total", agent="workout_generator", result="miss") >= 1
+    assert "# TYPE cache_hit_ratio gauge" in text
+    assert "# TYPE llm_concurrency_limit gauge" in text
+    assert "# TYPE event_loop_lag_seconds histogram" in text
+
+
+async def test_stream_tokens_come_from_usage_and_disconnects_count_as_cancelled(fake_openai):
+    from app.services.openai_client import openai_client
+    fake_openai(FakeConfig(chunk_chars=5))
+    agent, model = "usage_probe", openai_client.model
+    messages = [{"role": "system", "content": "You are workout_generator."}, {"role": "user", "content": "plan"}]
+    token = metrics.current_agent.set(agent)
+    try:
+        stream = await openai_client.call_with_tools(messages, [], stream=True)
+        content = "".join([d["data"] async for d in stream if d["type"] == "content"])
+        assert metrics.LLM_TOKENS.value(agent, model, "completion") == len(content) // 4  # the fake's usage, not the delta count
+        assert metrics.LLM_TOKENS.value(agent, model, "prompt") > 0
+
+        stream = await openai_client.call_with_tools(messages, [], stream=True)
+        await stream.__anext__()
+        await stream.aclose()  # the client went away mid-stream
+    finally:
+        metrics.current_agent.reset(token)
+    assert metrics.LLM_REQUESTS.value(agent, model, "ok") == 1
+    assert metrics.LLM_REQUESTS.value(agent, model, "cancelled") == 1
+    assert metrics.LLM_REQUESTS.value(agent, model, "error") == 0
@@ -0,0 +1,72 @@
+# py
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services.agents import AgentOrchestrator
+from app.services.openai_client import openai_client
+from app.services.partial_json import PartialJSONItems
+
+PLAN = {
+    "title": "Legs {day}",
+    "duration_minutes": 40,
+    "difficulty": "beginner",
+    "exercises": [
+        {"name": "squat \"low\" \\ bar", "sets": 3, "cues": ["knees out", "brace"]},
+        {"name": "lunge", "meta": {"exercises": [{"name": "nested"}]}},
+    ],
+    "tips": ["[rest] {well}"],
+}
+
+
+def feed_all(parser, text, step):
+    found = []
+    for i in range(0, len(text), step):
+        found.extend(parser.feed(text[i:i + step]))
+    return found
+
+
+@pytest.mark.parametrize("step", [1, 2, 7, 1000])
+def test_items_emitted_exactly_once_regardless_of_split(step):
+    text = "```json\n" + json.dumps(PLAN) + "\n```"
+    found = feed_all(PartialJSONItems(["exercises"]), text, step)
+    assert [(f, i) for f, i, _ in found] == [("exercises", 0), ("exercises", 1)]
+    assert [json.loads(raw) for _, _, raw in found] == PLAN["exercises"]
+
+
+def test_item_emitted_when_it_closes_not_at_the_end():
+    text = json.dumps(PLAN)
+    parser = PartialJSONItems(["exercises"])
+    first_close = text.index('"brace"]}') + len('"brace"]}')
+    assert parser.feed(text[:first_close - 1]) == []
+    assert len(parser.feed(text[first_close - 1:first_close])) == 1
+
+
+def test_unwatched_fields_ignored():
+    assert feed_all(PartialJSONItems(["meals"]), json.dumps(PLAN), 5) == []
+
+
+@pytest.mark.asyncio
+async def test_stream_agent_yields_item_events_before_done():
+    body = json.dumps(PLAN)
+
+    async def fake_stream(messages, tools, stream=False):
+        async def gen():
+            for i in range(0, len(body), 10):
+                yield {"type": "content", "data": body[i:i + 10]}
+        return gen()
+
+    with patch.object(openai_client, "call_with_tools", new_callable=AsyncMock) as mock_call:
+        mock_call.side_effect = fake_stream
+        events = [e async for e in AgentOrchestrator("item_user").stream_agent("workout_generator", "items", {})]
+    items = [e for e in events if e["stage"] == "item"]
+    assert [e["item"]["name"] for e in items] == ["squat \"low\" \\ bar", "lunge"]
+    assert events.index(items[0]) < len(events) - 2  # first item arrives while deltas are still streaming
+    assert events[-1]["stage"] == "done" and events[-1]["result"]["exercises"] == PLAN["exercises"]
+
+
+def test_buffer_trimmed_on_long_streams():
+    plan = {"exercises": [{"name": f"exercise {i}", "notes": "x" * 50} for i in range(500)]}
+    parser = PartialJSONItems(["exercises"])
+    found = feed_all(parser, json.dumps(plan), 9)
+    assert [json.loads(raw) for _, _, raw in found] == plan["exercises"]
+    assert len(parser.buffer) < 5000
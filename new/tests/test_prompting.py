@@ -0,0 +1,41 @@
+# py
+import json
+from unittest.mock import AsyncMock, patch
+from app.services import prompting
+from app.services.agents import AgentOrchestrator
+from app.services.openai_client import openai_client
+
+
+def test_small_context_is_sent_whole_and_canonical():
+    text, _ = prompting.compact_context({"b": 1, "a": {"weight": 80.0}}, budget=100)
+    assert text == '{"a":{"weight":80.0},"b":1}'
+
+
+def test_oversized_context_is_compacted_under_budget():
+    context = {
+        "stats": {"weight": 80, "age": 30},
+        "steps": list(range(5000)),
+        "notes": "x" * 20000,
+        "meals": [{"name": f"meal {i}", "kcal": 500.123456} for i in range(300)],
+    }
+    text, tokens = prompting.compact_context(context, budget=300)
+    assert tokens <= 300
+    compacted = json.loads(text)
+    assert compacted["stats"] == {"weight": 80, "age": 30}
+    assert compacted["steps"] == {"count": 5000, "min": 0, "max": 4999, "mean": 2499.5, "last": 4999}
+
+
+def test_stats_are_the_last_field_dropped():
+    text, tokens = prompting.compact_context({"stats": {"weight": 80}, "history": [{"k": "v" * 30}] * 50}, budget=60, count=len)
+    assert json.loads(text) == {"stats": {"weight": 80}, "_omitted": ["history"]}
+
+
+async def test_system_prefix_is_stable_across_users_and_contexts():
+    with patch.object(openai_client, "call_with_tools", new_callable=AsyncMock) as mock_call:
+        mock_call.return_value = {"choices": [{"message": {"content": "ok"}}]}
+        await AgentOrchestrator("a").run_agent("habit_coach", "help", {"stats": {"weight": 80}})
+        await AgentOrchestrator("b").run_agent("habit_coach", "other", {"history": ["x" * 50000]})
+    first, second = (c.args[0] for c in mock_call.await_args_list)
+    assert first[0] == second[0]
+    assert first[0]["content"].startswith(prompting.SYSTEM_PREAMBLE)
+    assert prompting.count_tokens(second[1]["content"]) <= prompting.budget_for("habit_coach") + 10
@@ -0,0 +1,91 @@
+# py
+import pytest
+from app.core.rate_limiter import GCRAStore
+
+
+def test_burst_then_steady_refill_like_a_token_bucket():
+    store = GCRAStore(capacity=3, rate=1.0)
+    assert [store.allow("u", now=100.0) for _ in range(4)] == [True, True, True, False]
+    assert not store.allow("u", now=100.5)
+    assert store.allow("u", now=101.0)
+    assert not store.allow("u", now=101.0)
+    assert [store.allow("u", now=110.0) for _ in range(4)] == [True, True, True, False]
+    assert store.allow("other", now=100.0)
+
+
+def test_idle_keys_are_swept_without_changing_decisions():
+    store = GCRAStore(capacity=2, rate=10.0, shards=4, sweep_interval=0.4)
+    for i in range(100):
+        store.allow(f"user-{i}", now=0.0)
+    assert len(store) == 100
+    # each allow() past the sweep deadline cleans one shard; all keys are refilled by t=1
+    for step in range(4):
+        store.allow("active", now=1.0 + step * 0.15)
+    assert len(store) <= 1
+    assert store.stats()["evicted"] >= 100
+    # a swept key starts from a full bucket, which is what it had anyway
+    assert [store.allow("user-1", now=2.0) for _ in range(3)] == [True, True, False]
+
+
+def test_key_table_is_hard_capped():
+    store = GCRAStore(capacity=5, rate=0.001, shards=1, max_keys=10, sweep_interval=1e9)
+    for i in range(50):
+        store.allow(f"user-{i}", now=1.0)
+    assert len(store) == 10
+
+
+def test_rejects_bad_configuration():
+    with pytest.raises(ValueError):
+        GCRAStore(capacity=0, rate=1.0)
+    with pytest.raises(ValueError):
+        GCRAStore(capacity=1, rate=1.0, shards=3)
+
+
+def _drain(path, n):
+    from app.core.rate_limiter import SharedMemoryGCRA
+    limiter = SharedMemoryGCRA(path, capacity=20, rate=0.001, slots=64)
+    return sum(limiter.allow("shared-user") for _ in range(n))
+
+
+def test_shared_memory_limit_holds_across_processes(tmp_path):
+    import multiprocessing
+    path = str(tmp_path / "rl")
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        allowed = pool.starmap(_drain, [(path, 50)] * 4)
+    assert sum(allowed) == 20
+
+
+def test_shared_memory_reuses_idle_slots_and_caps_the_table(tmp_path):
+    from app.core.rate_limiter import SharedMemoryGCRA
+    limiter = SharedMemoryGCRA(str(tmp_path / "rl"), capacity=2, rate=1.0, slots=64)
+    for i in range(500):
+        assert limiter.allow(f"user-{i}", now=10.0)
+    assert limiter.stats()["keys"] <= 64
+    other = SharedMemoryGCRA(str(tmp_path / "rl"), capacity=2, rate=1.0, slots=64)
+    assert [other.allow("u", now=20.0) for _ in range(3)] == [True, True, False]
+    assert not limiter.allow("u", now=20.5)
+    assert limiter.allow("u", now=21.0)
+
+
+async def test_redis_backend_script_on_local_fake():
+    from app.core.rate_limiter import RedisGCRA
+    from app.core.redis import InMemoryRedis
+    client = InMemoryRedis()
+    limiter = RedisGCRA(client, capacity=3, rate=0.01)
+    assert [await limiter.allow("u") for _ in range(4)] == [True, True, True, False]
+    assert await limiter.allow("v")
+    assert await client.get("rl:u") is not None
+
+
+async def test_allow_request_falls_back_to_local_limits_when_redis_fails(monkeypatch):
+    from app.core import rate_limiter
+
+    class DownRedis:
+        def register_script(self, script):
+            async def run(keys=None, args=None):
+                raise ConnectionError("refused")
+            return run
+
+    monkeypatch.setattr(rate_limiter, "_shared", rate_limiter.RedisGCRA(DownRedis(), capacity=1, rate=1.0))
+    monkeypatch.setattr(rate_limiter.settings, "RATE_LIMIT_BACKEND", "redis")
+    assert await rate_limiter.allow_request("fallback-user")
@@ -0,0 +1,144 @@
+# py
+import base64
+import json
+import httpx
+import pytest
+from app.db.repository import InMemoryRepository, PostgrestRepository, decode_cursor, encode_cursor
+
+
+def postgrest_client(handler):
+    return httpx.AsyncClient(base_url="http://db.test/rest/v1", transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_postgrest_repository_needs_one_round_trip_per_call():
+    seen = []
+
+    def handler(request: httpx.Request):
+        seen.append((request.method, request.url.path, dict(request.url.params)))
+        if request.url.path.endswith("/rpc/create_health_insight_for"):
+            body = json.loads(request.content)
+            return httpx.Response(200, json=[{"id": "i-1", "user_id": "u-1", "aggregated_output": body["p_aggregated_output"]}])
+        if request.method == "POST":
+            return httpx.Response(201, json=[{"id": "i-2", **json.loads(request.content)}])
+        return httpx.Response(200, json=[{"id": "i-1", "created_at": "2025-01-01T00:00:00+00:00", "users_profiles": {"id": "u-1"}}])
+
+    repo = PostgrestRepository("http://db.test", "key", client=postgrest_client(handler))
+    # cold: the id is resolved server-side, inside the same request
+    assert (await repo.create_health_insight("sb-1", {"aggregated_output": "ok", "confidence": 0.8}))["user_id"] == "u-1"
+    assert seen[-1][:2] == ("POST", "/rest/v1/rpc/create_health_insight_for")
+    # warm: plain insert / filter on the cached id
+    assert (await repo.create_health_insight("sb-1", {"aggregated_output": "again"}))["user_id"] == "u-1"
+    assert seen[-1][:2] == ("POST", "/rest/v1/health_insights")
+    await repo.list_health_insights("sb-1", limit=5)
+    assert seen[-1][2] == {"select": "id,aggregated_output,confidence,created_at", "order": "created_at.desc,id.desc", "limit": "5", "user_id": "eq.u-1"}
+    assert len(seen) == 3
+    # cold read uses an inner-join filter and strips the embedded profile
+    assert await repo.list_health_insights("sb-2", limit=5, after=("2025-02-01T00:00:00+00:00", "i-9")) == [{"id": "i-1", "created_at": "2025-01-01T00:00:00+00:00"}]
+    assert seen[-1][2]["users_profiles.supabase_id"] == "eq.sb-2"
+    assert seen[-1][2]["or"] == '(created_at.lt."2025-02-01T00:00:00+00:00",and(created_at.eq."2025-02-01T00:00:00+00:00",id.lt.i-9))'
+    assert repo.identities.get("sb-2") == "u-1"
+    await repo.close()
+
+
+@pytest.mark.asyncio
+async def test_identity_map_is_refreshed_by_upsert_and_dropped_when_stale():
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request.url.path)
+        if request.url.path.endswith("/users_profiles"):
+            return httpx.Response(201, json=[{"id": "u-new", "supabase_id": "sb-1"}])
+        if request.url.path.endswith("/health_insights"):
+            return httpx.Response(409, json={"code": "23503"})
+        return httpx.Response(200, json=[{"id": "i-1", "user_id": "u-new"}])
+
+    repo = PostgrestRepository("http://db.test", "key", client=postgrest_client(handler))
+    repo.identities.put("sb-1", "u-old")
+    await repo.upsert_user_profile("sb-1", {"supabase_id": "sb-1"})
+    assert repo.identities.get("sb-1") == "u-new"
+    repo.identities.put("sb-1", "u-deleted")
+    saved = await repo.create_health_insight("sb-1", {"aggregated_output": "x"})
+    assert saved["user_id"] == "u-new"
+    assert calls[-2:] == ["/rest/v1/health_insights", "/rest/v1/rpc/create_health_insight_for"]
+
+
+@pytest.mark.asyncio
+async def test_stale_identity_on_read_falls_back_to_the_join():
+    seen = []
+
+    def handler(request: httpx.Request):
+        params = dict(request.url.params)
+        seen.append(params.get("user_id"))
+        if params.get("user_id") == "eq.u-old":
+            return httpx.Response(200, json=[])
+        return httpx.Response(200, json=[{"id": "i-1", "created_at": "2025-01-01T00:00:00+00:00", "users_profiles": {"id": "u-new"}}])
+
+    repo = PostgrestRepository("http://db.test", "key", client=postgrest_client(handler))
+    repo.identities.put("sb-1", "u-old")  # the profile was recreated under a new id
+    rows = await repo.list_health_insights("sb-1", limit=10)
+    assert [r["id"] for r in rows] == ["i-1"] and "users_profiles" not in rows[0]
+    assert seen == ["eq.u-old", None]
+    assert repo.identities.get("sb-1") == "u-new"
+
+    # an empty later page is the end of the list, not a stale mapping
+    seen.clear()
+    repo.identities.put("sb-1", "u-old")
+    assert await repo.list_health_insights("sb-1", limit=10, after=("2025-01-01T00:00:00+00:00", "8c4f2a8e-1d2b-4c3a-9f1e-2b7d6a5c4e3f")) == []
+    assert seen == ["eq.u-old"]
+    assert repo.identities.get("sb-1") == "u-old"
+
+
+@pytest.mark.asyncio
+async def test_resolve_profile_id_uses_the_identity_map():
+    seen = []
+
+    def handler(request: httpx.Request):
+        seen.append(dict(request.url.params)["supabase_id"])
+        return httpx.Response(200, json=[{"id": "u-1"}] if request.url.params["supabase_id"] == "eq.sb-1" else [])
+
+    repo = PostgrestRepository("http://db.test", "key", client=postgrest_client(handler))
+    assert await repo.resolve_profile_id("sb-1") == "u-1"
+    assert await repo.resolve_profile_id("sb-1") == "u-1"  # cached
+    assert await repo.resolve_profile_id("missing") is None
+    assert seen == ["eq.sb-1", "eq.missing"]
+
+
+def test_cursor_only_carries_a_timestamp_and_a_uuid():
+    row = {"created_at": "2025-01-01T00:00:00+00:00", "id": "8c4f2a8e-1d2b-4c3a-9f1e-2b7d6a5c4e3f"}
+    assert decode_cursor(encode_cursor(row)) == (row["created_at"], row["id"])
+
+    def crafted(created_at, row_id):
+        return base64.urlsafe_b64encode(json.dumps([created_at, row_id]).encode()).decode()
+
+    for token in (
+        crafted('2025-01-01",id.gt.0)', row["id"]),
+        crafted(row["created_at"], "0),or(user_id.neq.x"),
+        crafted(row["created_at"], 42),
+        "not-a-cursor",
+    ):
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            decode_cursor(token)
+
+
+@pytest.mark.asyncio
+async def test_postgrest_errors_are_raised():
+    repo = PostgrestRepository("http://db.test", "key", client=postgrest_client(lambda r: httpx.Response(200, json=[])))
+    with pytest.raises(ValueError):
+        await repo.create_health_insight("missing", {"aggregated_output": "x"})
+    repo = PostgrestRepository("http://db.test", "key", client=postgrest_client(lambda r: httpx.Response(500, text="boom")))
+    with pytest.raises(RuntimeError):
+        await repo.upsert_user_profile("sb-1", {"supabase_id": "sb-1"})
+
+
+@pytest.mark.asyncio
+async def test_in_memory_repository_matches_service_behaviour():
+    repo = InMemoryRepository()
+    with pytest.raises(ValueError):
+        await repo.create_health_insight("sb-1", {})
+    profile = await repo.upsert_user_profile("sb-1", {"supabase_id": "sb-1", "email": "a@b.c"})
+    again = await repo.upsert_user_profile("sb-1", {"supabase_id": "sb-1", "email": "x@y.z"})
+    assert profile["id"] == again["id"] and again["email"] == "x@y.z"
+    first = await repo.create_health_insight("sb-1", {"aggregated_output": "a"})
+    second = await repo.create_health_insight("sb-1", {"aggregated_output": "b"})
+    assert [r["id"] for r in await repo.list_health_insights("sb-1", limit=10)] == [second["id"], first["id"]]
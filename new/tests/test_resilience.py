@@ -0,0 +1,151 @@
+# py
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+import httpx
+from openai import APIConnectionError, RateLimitError
+from app.core.resilience import FAILURE, FATAL, THROTTLED, CircuitBreaker, CircuitOpenError, Resilience, RetryBudget, parse_retry_after
+from app.services.openai_client import classify_error, openai_client
+
+
+class Flaky(Exception):
+    def __init__(self, kind=FAILURE, retry_after=None):
+        self.kind, self.retry_after = kind, retry_after
+
+
+def _classify(e):
+    return (e.kind, e.retry_after) if isinstance(e, Flaky) else (FATAL, None)
+
+
+def _resilience(failures=5, budget=20.0, **kwargs):
+    opts = dict(base_delay=0.001, max_delay=0.002, hedge_percentile=None)
+    opts.update(kwargs)
+    return Resilience(CircuitBreaker(failures, reset_timeout=0.05), RetryBudget(0.2, 0.0, budget), _classify, **opts)
+
+
+def _failing(*errors, result="ok"):
+    errors = list(errors)
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn, calls
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+    assert parse_retry_after({"retry-after": "2"}) == 2.0
+    assert 0 <= parse_retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+    assert parse_retry_after({}) is None
+
+
+@pytest.mark.asyncio
+async def test_retries_fast_and_honours_retry_after():
+    r = _resilience()
+    fn, calls = _failing(Flaky(), Flaky(THROTTLED, retry_after=0.05))
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    assert await r.call(fn) == "ok"
+    assert len(calls) == 3 and r.retries == 2
+    assert 0.05 <= loop.time() - start < 1.0  # waited Retry-After, not a multi-second floor
+    # a Retry-After beyond the cap fails now instead of sleeping
+    fn, calls = _failing(Flaky(THROTTLED, retry_after=60))
+    with pytest.raises(Flaky):
+        await r.call(fn)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_fatal_errors_and_empty_budget_are_not_retried():
+    r = _resilience(budget=1.0)
+    fn, calls = _failing(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        await r.call(fn)
+    assert len(calls) == 1
+    fn, calls = _failing(Flaky(), Flaky(), Flaky())
+    with pytest.raises(Flaky):
+        await r.call(fn)
+    assert len(calls) == 2 and r.budget.exhausted == 1
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_fails_fast_and_recovers_after_probe():
+    r = _resilience(failures=2, max_attempts=1)
+    for _ in range(2):
+        with pytest.raises(Flaky):
+            await r.call(_failing(Flaky())[0])
+    fn, calls = _failing()
+    with pytest.raises(CircuitOpenError):
+        await r.call(fn)
+    assert calls == [] and r.breaker.state == CircuitBreaker.OPEN
+    await asyncio.sleep(0.06)
+    assert await r.call(fn) == "ok"  # half-open probe succeeds
+    assert r.breaker.state == CircuitBreaker.CLOSED
+    # throttling is not a provider failure
+    for _ in range(3):
+        with pytest.raises(Flaky):
+            await r.call(_failing(Flaky(THROTTLED))[0])
+    assert r.breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged():
+    r = _resilience(hedge_percentile=0.95, hedge_min_delay=0.01)
+    for _ in range(20):
+        r.latencies.add(0.01)
+    delays = [1.0, 0.0]
+
+    async def fn():
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return delay
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    assert await r.call(fn) == 0.0
+    assert loop.time() - start < 0.5
+    assert r.hedges == 1 and r.hedge_wins == 1
+
+
+def test_classify_openai_errors():
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    throttled = RateLimitError("slow down", response=httpx.Response(429, headers={"retry-after": "3"}, request=request), body=None)
+    assert classify_error(throttled) == (THROTTLED, 3.0)
+    assert classify_error(APIConnectionError(request=request)) == (FAILURE, None)
+    assert classify_error(ValueError()) == (FATAL, None)
+
+
+@pytest.mark.asyncio
+async def test_stream_retried_until_first_chunk():
+    class Chunk:
+        def __init__(self, text):
+            delta = type("Delta", (), {"content": text, "tool_calls": None})
+            self.choices = [type("Choice", (), {"delta": delta})]
+
+    class FakeStream:
+        def __init__(self, texts):
+            self.chunks = iter(texts)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return Chunk(next(self.chunks))
+            except StopIteration:
+                raise StopAsyncIteration
+
+        async def close(self):
+            pass
+
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    create = AsyncMock(side_effect=[APIConnectionError(request=request), FakeStream(["Hel", "lo"])])
+    with patch.object(openai_client.client.chat.completions, "create", create), patch.object(openai_client.resilience, "base_delay", 0.001):
+        stream = await openai_client.call_with_tools([{"role": "user", "content": "hi"}], [], stream=True)
+        deltas = [d["data"] async for d in stream]
+    assert deltas == ["Hel", "lo"] and create.await_count == 2
+    from app.core.scheduler import get_llm_scheduler
+    assert get_llm_scheduler().in_flight == 0
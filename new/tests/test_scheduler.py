@@ -0,0 +1,92 @@
+# py
+import asyncio
+import pytest
+from app.core.scheduler import AIMDLimit, FairScheduler, SchedulerOverloaded
+
+
+def _scheduler(limit=1, max_queue=100, queue_timeout=5.0):
+    return FairScheduler({"free": 1.0, "pro": 4.0}, AIMDLimit(limit, 1, 8, latency_target=1.0, cooldown=0.0), max_queue, queue_timeout)
+
+
+@pytest.mark.asyncio
+async def test_weighted_fair_order_under_contention():
+    sched = _scheduler()
+    order = []
+
+    async def call(tier, i):
+        async with sched.slot(tier):
+            order.append(f"{tier}{i}")
+            await asyncio.sleep(0)
+
+    await sched.acquire("free")  # hold the only slot while the burst queues up
+    tasks = [asyncio.create_task(call("free", i)) for i in range(8)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(call("pro", i)) for i in range(4)]
+    await asyncio.sleep(0)
+    assert sched.stats()["queued"] == 12
+    sched.release()
+    await asyncio.gather(*tasks)
+    # pro arrived last but is admitted within the first few slots, four per free call
+    assert order.index("pro3") < order.index("free3")
+    assert sched.in_flight == 0 and sched.stats()["tiers"]["pro"]["admitted"] == 4
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_and_cancel_do_not_leak_slots():
+    sched = _scheduler(queue_timeout=0.02)
+    await sched.acquire("free")
+    with pytest.raises(SchedulerOverloaded):
+        await sched.acquire("free")
+    waiter = asyncio.create_task(sched.acquire("pro"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    sched.release()
+    assert sched.in_flight == 0 and sched.queued == 0
+    assert sched.stats()["tiers"]["free"]["rejected"] == 1
+    async with sched.slot("free"):
+        assert sched.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_slot_granted_as_the_wait_times_out_is_released(monkeypatch):
+    sched = _scheduler()
+    await sched.acquire("free")
+
+    async def grant_then_time_out(fut, timeout):
+        sched.release()  # hands the slot to the waiter...
+        assert fut.done()
+        raise asyncio.TimeoutError  # ...in the same tick as its timeout fires
+
+    monkeypatch.setattr(asyncio, "wait_for", grant_then_time_out)
+    with pytest.raises(SchedulerOverloaded):
+        await sched.acquire("free")
+    assert sched.in_flight == 0 and sched.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects():
+    sched = _scheduler(max_queue=1)
+    await sched.acquire("free")
+    queued = asyncio.create_task(sched.acquire("free"))
+    await asyncio.sleep(0)
+    with pytest.raises(SchedulerOverloaded):
+        await sched.acquire("pro")
+    sched.release()
+    await queued
+    assert sched.in_flight == 1
+
+
+def test_aimd_limit():
+    limit = AIMDLimit(4, 2, 6, latency_target=1.0, cooldown=60.0)
+    for _ in range(20):
+        limit.on_success(0.1, in_flight=4)
+    assert limit.value == 6  # additive increase, capped
+    limit.on_success(0.1, in_flight=0)
+    limit.on_overload()
+    limit.on_overload()  # within the cooldown: one decrease per window
+    assert limit.value == 3 and limit.decreases == 1
+    limit._last_decrease = float("-inf")
+    limit.on_success(5.0, in_flight=3)  # too slow
+    assert limit.limit == pytest.approx(2.7) and limit.value == 2
@@ -0,0 +1,33 @@
+# py
+from datetime import datetime, timezone
+from app.core import serialization, sse
+
+
+def test_backends_agree_and_fall_back_to_str():
+    value = {"b": [1, 2.5, None], "a": {"z": "é", "y": True}, "at": datetime(2024, 1, 1, tzinfo=timezone.utc)}
+    assert serialization.loads(serialization.dumps(value)) == serialization.loads(serialization._json_dumps(value))
+    assert serialization.canonical(value) == serialization._json_canonical(value)
+
+
+def test_canonical_digest_ignores_key_order_but_not_part_boundaries():
+    a = serialization.canonical({"x": 1, "y": {"b": 2, "a": 1}})
+    b = serialization.canonical({"y": {"a": 1, "b": 2}, "x": 1})
+    assert a == b
+    assert serialization.digest("ab", "c") != serialization.digest("a", "bc")
+
+
+async def test_sse_writer_serializes_each_event_once(monkeypatch):
+    calls = []
+    real = serialization.dumps
+    monkeypatch.setattr(serialization, "dumps", lambda obj: calls.append(obj) or real(obj))
+
+    async def source():
+        yield {"stage": "starting"}
+        for i in range(5):
+            yield {"stage": "delta", "agent": "a", "content": str(i)}
+        yield {"stage": "done", "agent": "a"}
+
+    body = b"".join([f async for f in sse.SSEWriter(source(), max_delay=0.05).frames()])
+    assert b'"content":"1234"' in body or b'"content":"01234"' in body
+    assert len(calls) == len({id(c) for c in calls})  # no event encoded twice
+    assert len(calls) <= 4
@@ -0,0 +1,95 @@
+# py
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.core.cache import InMemoryLRUCache, ResultCache
+from app.core.similarity import LSHIndex, MinHasher, similarity
+from app.services import similarity_cache as similarity_module
+from app.services.agents import AgentOrchestrator
+from app.services.openai_client import openai_client
+from app.services.similarity_cache import SimilarityCache, canonicalize_prompt, quantize_stats
+
+PLAN_JSON = '{"title": "Test", "duration_minutes": 30, "difficulty": "beginner", "exercises": [{"name": "squat"}]}'
+
+
+def test_canonical_prompt_and_quantized_stats():
+    assert canonicalize_prompt("Please build me a 4 week running plan!") == canonicalize_prompt("4-week running plans")
+    assert canonicalize_prompt("beginner running plan")[0] == ("beginner", "runn")
+    assert canonicalize_prompt("advanced running plan")[0] != canonicalize_prompt("beginner running plan")[0]
+    buckets = {"weight_kg": 2.5, "height_cm": 5.0, "age": 5.0}
+    a = quantize_stats({"weight": 80.1, "height": 1.80, "age": 31, "gender": "Male", "steps": 10234}, buckets)
+    b = quantize_stats({"weight_kg": 80.2, "height_cm": 181, "age": 33, "sex": "m", "steps": 10480}, buckets)
+    assert a == b == {"weight_kg": 80.0, "height_cm": 180.0, "age": 30.0, "sex": "male", "steps": 10000.0}
+    assert quantize_stats({"weight": 83}, buckets) != quantize_stats({"weight": 80.1}, buckets)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Breakfast ideas with nuts, avoiding eggs", "Breakfast ideas avoiding nuts because of my allergy"),
+    ("Breakfast ideas with eggs, avoiding nuts", "Breakfast ideas with nuts, avoiding eggs"),
+    ("4 week running plan", "4 week plan, no running or jumping because of my knee injury"),
+    ("nut free granola breakfast", "granola breakfast with nuts"),
+    ("high protein dinner with chicken", "high protein dinner with tofu"),
+    ("upper body strength routine", "lower body strength routine"),
+])
+def test_opposite_meaning_prompts_never_share_pinned_terms(first, second):
+    assert canonicalize_prompt(first)[0] != canonicalize_prompt(second)[0]
+
+
+def test_similarity_cache_is_off_by_default():
+    assert similarity_module.settings.SIMILARITY_CACHE_THRESHOLD == 0
+    assert similarity_module.get_similarity_cache() is None
+
+
+@pytest.mark.asyncio
+async def test_allergy_prompt_does_not_reuse_a_plan_with_the_allergen():
+    results = ResultCache(InMemoryLRUCache(10), default_ttl=60)
+    cache = SimilarityCache(results, LSHIndex(64, 16, 100), MinHasher(64), threshold=0.5)
+    await results.set("nutrition_generator", "key-1", {"meals": ["peanut butter oats"]})
+    cache.add("nutrition_generator", "u1", "Give me a breakfast plan with nuts, avoiding eggs", {}, "key-1")
+    assert await cache.get("nutrition_generator", "u1", "Give me a breakfast plan avoiding nuts because of my allergy", {}) is None
+    assert await cache.get("nutrition_generator", "u1", "breakfast plans with nuts, avoid eggs please", {}) == {"meals": ["peanut butter oats"]}
+
+
+def test_minhash_estimates_jaccard_and_lsh_finds_neighbours():
+    hasher = MinHasher(128)
+    base = [f"w{i}" for i in range(40)]
+    near = base[:36] + ["x1", "x2", "x3", "x4"]  # jaccard 36/44
+    far = [f"y{i}" for i in range(40)]
+    assert abs(similarity(hasher.signature(base), hasher.signature(near)) - 36 / 44) < 0.12
+    index = LSHIndex(128, 32, max_entries=2)
+    index.add("ns", "near", hasher.signature(near), None, ttl=60)
+    index.add("ns", "far", hasher.signature(far), None, ttl=60)
+    assert [key for _, key, _ in index.query("ns", hasher.signature(base), 0.6)] == ["near"]
+    assert index.query("other-ns", hasher.signature(base), 0.6) == []
+    index.add("ns", "third", hasher.signature(base), None, ttl=60)
+    assert len(index) == 2 and index.evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_similar_results_expire_with_the_result_cache():
+    now = [0.0]
+    results = ResultCache(InMemoryLRUCache(10, clock=lambda: now[0]), default_ttl=10)
+    cache = SimilarityCache(results, LSHIndex(64, 16, 100, clock=lambda: now[0]), MinHasher(64), threshold=0.7, stat_buckets={"weight_kg": 2.5})
+    context = {"stats": {"weight": 80.1}}
+    await results.set("workout_generator", "key-1", {"title": "A"})
+    cache.add("workout_generator", "u1", "4 week running plan for beginners", context, "key-1")
+    assert await cache.get("workout_generator", "u1", "a 4-week running plan for a beginner", {"stats": {"weight": 80.2}}) == {"title": "A"}
+    assert await cache.get("workout_generator", "u2", "4 week running plan for beginners", context) is None  # per-user scope
+    assert await cache.get("workout_generator", "u1", "4 week running plan for advanced runners", context) is None  # pinned term differs
+    assert await cache.get("workout_generator", "u1", "strength and mobility routine", context) is None
+    now[0] = 11
+    assert await cache.get("workout_generator", "u1", "4 week running plan for beginners", context) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 4
+
+
+@pytest.mark.asyncio
+async def test_run_agent_reuses_result_for_rephrased_request(monkeypatch):
+    monkeypatch.setattr(similarity_module.settings, "SIMILARITY_CACHE_THRESHOLD", 0.7)
+    monkeypatch.setattr(similarity_module, "_similarity_cache", None)
+    with patch.object(openai_client, "call_with_tools", new_callable=AsyncMock) as mock_call:
+        mock_call.return_value = {"choices": [{"message": {"content": PLAN_JSON}}]}
+        orch = AgentOrchestrator("similar_user")
+        first = await orch.run_agent("workout_generator", "Build me a 4 week beginner running plan", {"stats": {"weight": 80.1}})
+        second = await orch.run_agent("workout_generator", "4-week running plan for a beginner please", {"stats": {"weight": 80.2}})
+        assert first == second and mock_call.await_count == 1
+        await orch.run_agent("workout_generator", "4-week running plan for a beginner please", {"stats": {"weight": 95}})
+        assert mock_call.await_count == 2
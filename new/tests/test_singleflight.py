@@ -0,0 +1,77 @@
+# py
+import asyncio
+import pytest
+from app.core.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"ok": True}
+
+    results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+    assert calls == 1
+    assert all(r == {"ok": True} for r in results)
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "shared": 4}
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter_and_are_not_reused():
+    flight = SingleFlight()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*(flight.do("k", failing) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    with pytest.raises(RuntimeError):
+        await flight.do("k", failing)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelling_one_waiter_keeps_the_call_running_for_others():
+    flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def work():
+        started.set()
+        await asyncio.sleep(0.02)
+        return 42
+
+    leader = asyncio.create_task(flight.do("k", work))
+    await started.wait()
+    follower = asyncio.create_task(flight.do("k", work))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == 42
+    assert leader.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_call_is_cancelled_when_all_waiters_leave():
+    flight = SingleFlight()
+    finished = False
+
+    async def work():
+        nonlocal finished
+        await asyncio.sleep(1)
+        finished = True
+
+    waiter = asyncio.create_task(flight.do("k", work))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await asyncio.sleep(0)
+    assert len(flight) == 0 and not finished
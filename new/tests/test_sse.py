@@ -0,0 +1,91 @@
+# py
+import asyncio
+import json
+import pytest
+from app.core.sse import SSEWriter
+
+
+def parse(frames):
+    events = []
+    for frame in frames:
+        for block in frame.decode().split("\n\n"):
+            if block.startswith("data: "):
+                events.append(json.loads(block[len("data: "):]))
+    return events
+
+
+async def deltas(n, agent="workout_generator", delay=0.0):
+    for i in range(n):
+        yield {"stage": "delta", "agent": agent, "content": f"t{i} "}
+        if delay:
+            await asyncio.sleep(delay)
+
+
+@pytest.mark.asyncio
+async def test_small_deltas_are_coalesced_into_bounded_frames():
+    writer = SSEWriter(deltas(200), chunk_size=256, max_delay=0.05, heartbeat=0)
+    frames = [f async for f in writer.frames()]
+    events = parse(frames)
+    assert "".join(e["content"] for e in events) == "".join(f"t{i} " for i in range(200))
+    assert writer.frames_sent == len(frames) < 200
+    assert all(len(f) <= 256 + 80 for f in frames)
+    assert writer.stats()["bytes"] == sum(len(f) for f in frames)
+    assert writer.stats()["events"] == 200
+
+
+@pytest.mark.asyncio
+async def test_deltas_from_different_agents_are_not_merged():
+    async def mixed():
+        yield {"stage": "delta", "agent": "a", "content": "x"}
+        yield {"stage": "delta", "agent": "b", "content": "y"}
+        yield {"stage": "done", "agent": "a", "result": {}}
+    frames = [f async for f in SSEWriter(mixed(), max_delay=0.01, heartbeat=0).frames()]
+    assert [(e["agent"], e["stage"]) for e in parse(frames)] == [("a", "delta"), ("b", "delta"), ("a", "done")]
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_pushes_back_on_the_source():
+    pulled = 0
+
+    async def source():
+        nonlocal pulled
+        for i in range(10_000):
+            pulled += 1
+            yield {"stage": "delta", "agent": "a", "content": "x" * 64}
+
+    frames = SSEWriter(source(), chunk_size=128, max_delay=0, heartbeat=0, queue_size=8).frames()
+    await frames.__anext__()
+    await asyncio.sleep(0.05)  # consumer stalls, like a client that stopped reading
+    assert pulled < 20
+    await frames.aclose()
+
+
+@pytest.mark.asyncio
+async def test_closing_a_backed_up_stream_leaves_no_tasks():
+    closed = False
+
+    async def source():
+        nonlocal closed
+        try:
+            while True:
+                yield {"stage": "delta", "agent": "a", "content": "x" * 64}
+        finally:
+            closed = True
+
+    before = asyncio.all_tasks()
+    frames = SSEWriter(source(), chunk_size=128, max_delay=0, heartbeat=0, queue_size=8).frames()
+    await frames.__anext__()
+    await asyncio.sleep(0.05)  # the queue fills while the client is not reading
+    await frames.aclose()
+    assert asyncio.all_tasks() - before == set()
+    assert closed
+
+
+@pytest.mark.asyncio
+async def test_source_errors_become_an_error_event():
+    async def broken():
+        yield {"stage": "starting"}
+        raise RuntimeError("boom")
+
+    frames = b"".join([f async for f in SSEWriter(broken(), heartbeat=0).frames()])
+    assert b"event: error" in frames and b"boom" in frames
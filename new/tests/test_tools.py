@@ -0,0 +1,72 @@
+# py
+import asyncio
+import json
+import time
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services.agents import AgentOrchestrator
+from app.services.openai_client import openai_client, TOOLS
+from app.services.tools import ToolContext, ToolExecutor, ToolRegistry, registry
+
+PLAN_JSON = '{"title": "Test", "duration_minutes": 30, "difficulty": "beginner", "exercises": [{"name": "squat"}]}'
+
+
+def _call(call_id, name, **arguments):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+
+def test_every_advertised_tool_has_a_handler():
+    assert {t["function"]["name"] for t in TOOLS} <= set(registry.names())
+
+
+async def test_tool_calls_of_one_turn_overlap_and_fail_independently():
+    reg = ToolRegistry(default_timeout=1.0)
+
+    @reg.register("slow")
+    async def slow(ctx, n):
+        await asyncio.sleep(0.1)
+        return {"n": n}
+
+    @reg.register("stuck", timeout=0.05)
+    async def stuck(ctx):
+        await asyncio.sleep(10)
+
+    start = time.perf_counter()
+    results = await ToolExecutor(reg).run([_call("a", "slow", n=1), _call("b", "slow", n=2), _call("c", "stuck"), _call("d", "missing")], ToolContext("u"))
+    assert time.perf_counter() - start < 0.19
+    assert [r["tool_call_id"] for r in results] == ["a", "b", "c", "d"]
+    assert json.loads(results[1]["content"]) == {"n": 2}
+    assert "timed out" in json.loads(results[2]["content"])["error"]
+    assert "Unknown tool" in json.loads(results[3]["content"])["error"]
+
+
+async def test_run_agent_feeds_tool_results_back_to_the_model():
+    turns = [
+        {"choices": [{"message": {"content": None, "tool_calls": [_call("c1", "estimate_calories", calories_in=2000, activity_level="medium"), _call("c2", "fetch_user_history")]}}]},
+        {"choices": [{"message": {"content": PLAN_JSON}}]},
+    ]
+    with patch.object(openai_client, "call_with_tools", new_callable=AsyncMock) as mock_call:
+        mock_call.side_effect = turns
+        result = await AgentOrchestrator("tool_user").run_agent("workout_generator", "plan", {"stats": {"bmr": 1600}})
+    assert result["title"] == "Test"
+    second_turn = mock_call.await_args_list[1].args[0]
+    assert second_turn[-3]["role"] == "assistant"
+    tool_results = {m["tool_call_id"]: json.loads(m["content"]) for m in second_turn[-2:]}
+    assert tool_results["c1"]["estimated_need_kcal"] == 2480
+    assert tool_results["c2"] == []
+
+
+async def test_tool_loop_is_bounded(monkeypatch):
+    from app.services import agents
+    monkeypatch.setattr(agents.settings, "TOOL_MAX_ROUNDS", 2)
+    asking = {"choices": [{"message": {"content": None, "tool_calls": [_call("c", "fetch_user_history")]}}]}
+    final = {"choices": [{"message": {"content": PLAN_JSON}}]}
+    with patch.object(openai_client, "call_with_tools", new_callable=AsyncMock) as mock_call:
+        mock_call.side_effect = [asking, asking, final]
+        await AgentOrchestrator("tool_user").run_agent("workout_generator", "loop", {})
+    assert [c.kwargs["tool_choice"] for c in mock_call.await_args_list] == ["auto", "auto", "none"]
+
+
+async def test_estimate_calories_rejects_unknown_activity_level():
+    with pytest.raises(ValueError):
+        await registry.call("estimate_calories", {"calories_in": 2000, "activity_level": "extreme"}, ToolContext("u"))
@@ -0,0 +1,149 @@
+# py
+import asyncio
+import json
+import os
+import pytest
+from app.db.write_behind import WriteBehindQueue
+
+
+class Sink:
+    def __init__(self, fail_times=0, delay=0.0):
+        self.batches = []
+        self.fail_times = fail_times
+        self.delay = delay
+
+    async def __call__(self, rows):
+        await asyncio.sleep(self.delay)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("db down")
+        self.batches.append([r["id"] for r in rows])
+
+
+@pytest.mark.asyncio
+async def test_rows_are_batched_by_size_and_by_time():
+    sink = Sink()
+    queue = WriteBehindQueue(sink, max_batch=3, max_delay=0.05)
+    for i in range(7):
+        await queue.submit({"id": i})
+    await asyncio.sleep(0.01)
+    assert sink.batches[:2] == [[0, 1, 2], [3, 4, 5]]
+    await asyncio.sleep(0.1)  # the straggler goes out once the delay window closes
+    assert sink.batches[2:] == [[6]]
+    await queue.close()
+    assert queue.stats() == {"pending": 0, "flushed": 7, "batches": 3, "failures": 0, "dropped": 0}
+
+
+@pytest.mark.asyncio
+async def test_pending_rows_are_bounded():
+    sink = Sink(delay=0.05)
+    queue = WriteBehindQueue(sink, max_batch=2, max_delay=10, max_pending=4)
+    submitted = 0
+
+    async def producer():
+        nonlocal submitted
+        for i in range(10):
+            await queue.submit({"id": i})
+            submitted += 1
+            assert len(queue) <= 4
+
+    await asyncio.wait_for(producer(), timeout=2)
+    await queue.close()
+    assert sum(len(b) for b in sink.batches) == 10
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_and_failed_rows_survive_in_the_spool(tmp_path):
+    spool = str(tmp_path / "insights.jsonl")
+    sink = Sink(fail_times=1)
+    queue = WriteBehindQueue(sink, max_batch=100, max_delay=10, spool_path=spool)
+    await queue.submit({"id": "a"})
+    await queue.submit({"id": "b"})
+    await queue.close()  # the shutdown flush fails: rows must stay on disk
+    assert sink.batches == []
+    assert [json.loads(l)["id"] for l in open(spool)] == ["a", "b"]
+
+    # a fresh process replays the spool and empties it once written
+    restarted = WriteBehindQueue(sink, max_batch=100, max_delay=0.01, spool_path=spool)
+    await restarted.start()
+    await restarted.close()
+    assert sink.batches == [["a", "b"]]
+    assert open(spool).read() == ""
+
+
+@pytest.mark.asyncio
+async def test_spool_is_append_only_and_replays_from_the_checkpoint(tmp_path, monkeypatch):
+    spool = str(tmp_path / "insights.jsonl")
+    fsyncs = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: fsyncs.append(fd) or real_fsync(fd))
+    sink = Sink()
+    queue = WriteBehindQueue(sink, max_batch=2, max_delay=10, spool_path=spool)
+    await queue.start()
+    await asyncio.gather(*(queue.submit({"id": i}) for i in "abc"))
+    assert len(fsyncs) < 3  # concurrent submits share a write and an fsync
+    await asyncio.sleep(0.01)
+    assert sink.batches == [["a", "b"]]
+    lines = open(spool, "rb").readlines()
+    assert [json.loads(l)["id"] for l in lines] == ["a", "b", "c"]  # flushed rows are not rewritten
+    assert int(open(spool + ".offset").read()) == len(lines[0]) + len(lines[1])
+
+    # crash: the task dies without a shutdown flush, and a write was torn mid-line
+    queue._task.cancel()
+    with open(spool, "ab") as f:
+        f.write(b'{"id": "d"')
+    restarted = WriteBehindQueue(sink, max_batch=100, max_delay=0.01, spool_path=spool)
+    await restarted.start()
+    await restarted.close()
+    assert sink.batches == [["a", "b"], ["c"]]
+    assert open(spool).read() == ""
+
+
+class Rejected(Exception):
+    status_code = 400
+
+
+@pytest.mark.asyncio
+async def test_a_poison_row_is_dead_lettered_instead_of_blocking_the_queue(tmp_path):
+    dead = str(tmp_path / "dead.jsonl")
+    written = []
+
+    async def sink(rows):
+        if any(r["id"] == "bad" for r in rows):
+            raise Rejected("violates check constraint")
+        written.extend(r["id"] for r in rows)
+
+    queue = WriteBehindQueue(sink, max_batch=8, max_delay=0.01, max_pending=8, dead_letter_path=dead)
+    for i in ["a", "b", "bad", "c", "d", "e"]:
+        await queue.submit({"id": i})
+    await queue.close()
+    assert sorted(written) == ["a", "b", "c", "d", "e"]
+    assert [json.loads(l)["row"]["id"] for l in open(dead)] == ["bad"]
+    assert queue.stats()["dropped"] == 1 and queue.stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_transient_failures_are_retried_not_dropped():
+    sink = Sink(fail_times=3)
+    queue = WriteBehindQueue(sink, max_batch=4, max_delay=0.001, max_attempts=2)
+    for i in range(4):
+        await queue.submit({"id": i})
+    await asyncio.sleep(0.05)
+    await queue.close()
+    assert sorted(i for b in sink.batches for i in b) == [0, 1, 2, 3]
+    assert queue.stats()["dropped"] == 0
+
+
+@pytest.mark.asyncio
+async def test_create_health_insight_returns_before_the_write(monkeypatch):
+    from app.services import supabase_service
+    from app.db.write_behind import close_insight_writer
+    monkeypatch.setattr(supabase_service.settings, "INSIGHTS_WRITE_BEHIND", True)
+    await supabase_service.upsert_user_profile("wb-user", {})
+    saved = await supabase_service.create_health_insight("wb-user", {"prompt": "hi"}, {}, "text", 0.5)
+    assert saved["id"] and "supabase_id" not in saved
+    assert await supabase_service.list_health_insights("wb-user") == []
+    await close_insight_writer()  # shutdown flush
+    assert [r["id"] for r in await supabase_service.list_health_insights("wb-user")] == [saved["id"]]
+    with pytest.raises(ValueError, match="profile not found"):
+        await supabase_service.create_health_insight("no-such-user", {"prompt": "hi"}, {}, "text", 0.5)